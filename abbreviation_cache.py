@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Persistent Header Abbreviation Cache
+Remembers the shortName the model gave each concatenated longName, so
+headers that repeat across surveys ("Respondent ID", "Start Date",
+demographic questions) are only sent to the LLM once.
+1. Entries are keyed by (longName, prompt version, model) in a SQLite file
+2. Lookups touch last_used; expired entries (TTL) are never returned
+3. evict() drops expired entries, then least-recently-used ones beyond max_entries
+4. A longName repeated within one survey is keyed per occurrence (see cache_keys),
+   so each copy keeps its own shortName and warm runs rebuild the same names
+"""
+
+import logging
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.getenv('ABBREVIATION_CACHE_PATH', '.cache/abbreviations.sqlite3')
+DEFAULT_MAX_ENTRIES = int(os.getenv('ABBREVIATION_CACHE_MAX_ENTRIES', '100000'))
+DEFAULT_TTL_SECONDS = int(os.getenv('ABBREVIATION_CACHE_TTL_SECONDS', str(90 * 24 * 3600)))
+
+# SQLite caps bound parameters per statement; stay well under it
+_LOOKUP_CHUNK = 500
+
+# Separates a repeated longName from its occurrence number in the cache key
+DUPLICATE_MARK = '\x1f#'
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS abbreviations (
+    long_name TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    model TEXT NOT NULL,
+    short_name TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    use_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (long_name, prompt_version, model)
+);
+CREATE INDEX IF NOT EXISTS idx_abbreviations_last_used ON abbreviations(last_used);
+"""
+
+
+def cache_keys(long_names: Iterable[str]) -> List[str]:
+    """Cache key per column: the longName, plus its occurrence number from the second copy on"""
+    seen: Dict[str, int] = {}
+    keys = []
+    for long_name in long_names:
+        seen[long_name] = seen.get(long_name, 0) + 1
+        keys.append(long_name if seen[long_name] == 1 else f"{long_name}{DUPLICATE_MARK}{seen[long_name]}")
+    return keys
+
+
+class AbbreviationCache:
+    """SQLite-backed longName -> shortName cache shared by every wrangler"""
+
+    def __init__(self, path: Union[str, Path] = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 ttl_seconds: Optional[int] = DEFAULT_TTL_SECONDS):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Batch workers share the file, so wait on locks instead of failing
+        self.connection = sqlite3.connect(str(self.path), timeout=30)
+        self.connection.executescript(SCHEMA_SQL)
+
+    def _oldest_valid(self, now: float) -> float:
+        return now - self.ttl_seconds if self.ttl_seconds else 0.0
+
+    def get_many(self, long_names: Iterable[str], prompt_version: str, model: str) -> Dict[str, str]:
+        """Cached shortNames for the given longNames (misses are simply absent)"""
+        wanted = list(dict.fromkeys(long_names))
+        now = time.time()
+        found: Dict[str, str] = {}
+
+        for i in range(0, len(wanted), _LOOKUP_CHUNK):
+            chunk = wanted[i:i + _LOOKUP_CHUNK]
+            placeholders = ', '.join('?' for _ in chunk)
+            rows = self.connection.execute(
+                f"""
+                SELECT long_name, short_name FROM abbreviations
+                WHERE prompt_version = ? AND model = ? AND created_at >= ?
+                AND long_name IN ({placeholders})
+                """,
+                (prompt_version, model, self._oldest_valid(now), *chunk)
+            ).fetchall()
+            found.update(rows)
+
+        if found:
+            with self.connection:
+                self.connection.executemany(
+                    """
+                    UPDATE abbreviations SET last_used = ?, use_count = use_count + 1
+                    WHERE long_name = ? AND prompt_version = ? AND model = ?
+                    """,
+                    [(now, long_name, prompt_version, model) for long_name in found]
+                )
+
+        self.hits += len(found)
+        self.misses += len(wanted) - len(found)
+        return found
+
+    def put_many(self, abbreviations: Dict[str, str], prompt_version: str, model: str):
+        """Store model answers; an existing entry is replaced and its TTL restarted"""
+        if not abbreviations:
+            return
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                """
+                INSERT OR REPLACE INTO abbreviations
+                    (long_name, prompt_version, model, short_name, created_at, last_used, use_count)
+                VALUES (?, ?, ?, ?, ?, ?, 0)
+                """,
+                [(long_name, prompt_version, model, short_name, now, now)
+                 for long_name, short_name in abbreviations.items()]
+            )
+        self.evict()
+
+    def evict(self) -> int:
+        """Drop expired entries, then the least recently used beyond max_entries"""
+        with self.connection:
+            removed = self.connection.execute(
+                "DELETE FROM abbreviations WHERE created_at < ?", (self._oldest_valid(time.time()),)
+            ).rowcount
+            removed += self.connection.execute(
+                """
+                DELETE FROM abbreviations WHERE rowid IN (
+                    SELECT rowid FROM abbreviations ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,)
+            ).rowcount
+        if removed:
+            logger.info(f"Evicted {removed} abbreviation cache entries")
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters for this process plus the current entry count"""
+        entries = self.connection.execute("SELECT COUNT(*) FROM abbreviations").fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries}
+
+    def close(self):
+        self.connection.close()
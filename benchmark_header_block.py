@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Header Block Benchmark
+Times the previous cell-by-cell forward fill / concatenation against the
+columnar versions in header_block on synthetic SurveyMonkey-style header
+blocks, and checks both produce the same longNames.
+1. Build a header block: a question row (text on the first column of each
+   block, blanks after it) above one or more sub-label rows
+2. Run the reference loops and the columnar functions, best of --repeat runs
+Example: python benchmark_header_block.py --columns 253 10000 20000 --header-rows 3
+"""
+
+import argparse
+import time
+from typing import Callable, List
+
+from header_block import concatenate_columns, forward_fill_block
+
+
+def loop_forward_fill(rows: List[List[str]]) -> List[List[str]]:
+    """Reference: the per-cell forward fill ImprovedDataWrangler used before"""
+    filled_headers = []
+    for original_row in rows:
+        row = original_row[:]  # Copy
+        filled_row = []
+        last_value = ''
+        for cell in row:
+            if cell and cell.strip():
+                last_value = cell.strip()
+                filled_row.append(last_value)
+            else:
+                filled_row.append(last_value)
+        filled_headers.append(filled_row)
+    return filled_headers
+
+
+def loop_concatenate(filled_headers: List[List[str]]) -> List[str]:
+    """Reference: per-column concatenation with list-scan de-duplication, as before"""
+    num_columns = len(filled_headers[0]) if filled_headers else 0
+    concatenated_headers = []
+    for col_idx in range(num_columns):
+        column_parts = []
+        for row_data in filled_headers:
+            if col_idx < len(row_data) and row_data[col_idx]:
+                column_parts.append(row_data[col_idx])
+
+        unique_parts = []
+        for part in column_parts:
+            if part not in unique_parts:
+                unique_parts.append(part)
+
+        long_name = ' | '.join(unique_parts) if unique_parts else f'Column_{col_idx}'
+        concatenated_headers.append(long_name)
+    return concatenated_headers
+
+
+def synthetic_header_rows(columns: int, header_rows: int = 2, block_width: int = 12) -> List[List[str]]:
+    """Matrix-question header block: each question spans block_width columns"""
+    rows = [[f'Question {col_idx // block_width}: how much do you agree with the following?'
+             if col_idx % block_width == 0 else '' for col_idx in range(columns)]]
+    for depth in range(1, header_rows - 1):
+        rows.append([f'Section {col_idx // (block_width * 4)}' if col_idx % (block_width * 4) == 0 else ''
+                     for col_idx in range(columns)])
+    if header_rows > 1:
+        rows.append([f'Option {col_idx % block_width}' if col_idx % block_width else 'Response'
+                     for col_idx in range(columns)])
+    return rows
+
+
+def best_of(repeat: int, run: Callable[[], object]) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark header forward fill and concatenation")
+    parser.add_argument('--columns', type=int, nargs='+', default=[253, 10000, 20000], help="Sheet widths to time")
+    parser.add_argument('--header-rows', type=int, default=3, help="Depth of the header block")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per measurement (best is reported)")
+    args = parser.parse_args()
+
+    print(f"{'columns':>8} {'loop ms':>10} {'columnar ms':>12} {'speedup':>8}")
+    for columns in args.columns:
+        rows = synthetic_header_rows(columns, args.header_rows)
+
+        expected = loop_concatenate(loop_forward_fill(rows))
+        actual = concatenate_columns(forward_fill_block(rows))
+        if expected != actual:
+            raise SystemExit(f"Mismatch at {columns} columns")
+
+        loop_seconds = best_of(args.repeat, lambda: loop_concatenate(loop_forward_fill(rows)))
+        columnar_seconds = best_of(args.repeat, lambda: concatenate_columns(forward_fill_block(rows)))
+        print(f"{columns:>8} {loop_seconds * 1000:>10.1f} {columnar_seconds * 1000:>12.1f} "
+              f"{loop_seconds / columnar_seconds:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
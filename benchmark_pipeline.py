@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Pipeline Benchmark Suite
+Times the wrangling stages on synthetic surveys (see synthetic_survey) with the
+LLM stubbed out, and flags regressions against a saved baseline.
+1. load: stream a generated .xlsx back in (open_sheet + normalize_sheet, as
+   python_pipeline does); very wide / tall cases are generated in memory and
+   skip this stage
+2. detect / ffill / concatenate: header_detection and header_block
+3. abbreviate: AsyncAbbreviator batching, prompt building, reply parsing and
+   collision handling, with an instant local reply in place of the model
+4. transform: LLMDataWrangler.apply_transformation_plan with a synthetic plan
+   (drop the upper header rows, rename every column, type the numeric ones)
+5. export: type_columns over the working table + Parquet via columnar_export
+Each stage runs --warmup times untimed, then reports the best of --repeat runs
+and their noise (median minus best). A stage is a regression when it is more
+than --tolerance slower than the baseline and the slowdown exceeds both
+--min-delta seconds and the noise of the two runs; the run then exits with
+status 1. The baseline records the host, interpreter and library versions; a
+run that differs in any of them is reported but not gated (--ignore-machine
+compares anyway).
+Example: python benchmark_pipeline.py --suite quick --update-baseline
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from importlib import metadata
+from typing import Any, Callable, Dict, List, Optional
+
+from cell_normalization import frame_from_rows, normalize_sheet, to_rows
+from columnar_export import type_columns, unique_column_names, write_columnar
+from excel_loader import open_sheet
+from header_abbreviation import DEFAULT_BATCH_SIZE, AsyncAbbreviator, snake_case
+from header_block import concatenate_columns, forward_fill_block
+from header_detection import detect_header_rows
+from prototype_data_wrangling import LLMDataWrangler
+from synthetic_survey import SurveySpec, data_chunks, header_rows, write_workbook
+from working_table import WorkingTable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASELINE = 'benchmark_baseline.json'
+DEFAULT_TOLERANCE = 0.5
+DEFAULT_MIN_DELTA = 0.1
+DEFAULT_WARMUP = 1
+WORKBOOK_DIR = os.path.join('.cache', 'benchmarks')
+
+STAGES = ['load', 'detect', 'ffill', 'concatenate', 'abbreviate', 'transform', 'export']
+# Timings are only compared when the baseline was recorded with the same values of these
+MACHINE_FIELDS = ['host', 'implementation', 'python', 'machine', 'cpu_count', 'libraries']
+LIBRARIES = ['numpy', 'pandas', 'pyarrow', 'openpyxl']
+
+# name -> (spec, whether the case round-trips through an .xlsx file)
+SUITES = {
+    'quick': {
+        'parents': (SurveySpec(rows=1000, columns=253, header_depth=2, matrix_width=6), True),
+        'deep_headers': (SurveySpec(rows=2000, columns=400, header_depth=5, matrix_width=8), False),
+        'wide': (SurveySpec(rows=200, columns=5000, header_depth=3, matrix_width=12), False),
+        'tall': (SurveySpec(rows=100000, columns=25, header_depth=2, matrix_width=4), False)
+    },
+    'full': {
+        'parents': (SurveySpec(rows=1000, columns=253, header_depth=2, matrix_width=6), True),
+        'large_workbook': (SurveySpec(rows=20000, columns=500, header_depth=3, matrix_width=6), True),
+        'deep_headers': (SurveySpec(rows=2000, columns=400, header_depth=5, matrix_width=8), False),
+        'widest': (SurveySpec(rows=1000, columns=20000, header_depth=3, matrix_width=12), False),
+        'tallest': (SurveySpec(rows=1000000, columns=20, header_depth=2, matrix_width=4), False)
+    }
+}
+
+
+class StubAbbreviator(AsyncAbbreviator):
+    """Answers each batch instantly with snake_cased headers, so only the pipeline's own work is timed"""
+
+    async def _send_batch(self, client, semaphore, batch_index, batch, depth):
+        request = self.build_request(batch)
+        reply = json.dumps({str(col_idx): snake_case(header)[:self.max_length] for col_idx, header in batch})
+        abbreviations = self.response_parser(reply, batch)
+        stats = {'batch': batch_index, 'depth': depth, 'start_column': batch[0][0], 'end_column': batch[-1][0],
+                 'headers': len(batch), 'success': True, 'latency_seconds': 0.0,
+                 'prompt_chars': len(request['messages'][0]['content'])}
+        return abbreviations, stats
+
+
+def best_of(repeat: int, run: Callable[[], Any], setup: Optional[Callable[[], Any]] = None,
+            warmup: int = DEFAULT_WARMUP) -> Dict[str, Any]:
+    """Best wall time of `repeat` runs after `warmup` untimed ones (setup, untimed, feeds each run),
+    the noise (median minus best) and the last result"""
+    timings, result = [], None
+    for attempt in range(warmup + max(1, repeat)):
+        state = setup() if setup is not None else None
+        started = time.perf_counter()
+        result = run(state) if setup is not None else run()
+        if attempt >= warmup:
+            timings.append(time.perf_counter() - started)
+    best = min(timings)
+    return {'seconds': round(best, 4), 'noise': round(statistics.median(timings) - best, 4), 'result': result}
+
+
+def workbook_path(spec: SurveySpec) -> str:
+    """Generated workbooks are kept between runs; generation is never timed"""
+    os.makedirs(WORKBOOK_DIR, exist_ok=True)
+    path = os.path.join(WORKBOOK_DIR, f"{spec.key}.xlsx")
+    if not os.path.exists(path):
+        logger.warning(f"Generating {path} (one-off)...")
+        write_workbook(spec, path)
+    return path
+
+
+def load_workbook_rows(path: str) -> List[List[Any]]:
+    with open_sheet(path) as stream:
+        frame = frame_from_rows(stream.rows())
+    headers, data = normalize_sheet(frame)
+    return to_rows(headers, data)
+
+
+def transformation_plan(rows: List[List[Any]], header_count: int, short_names: List[str]) -> Dict[str, Any]:
+    """The plan an LLM analysis would return for this survey, in LLMDataWrangler's format"""
+    first_data = rows[header_count] if len(rows) > header_count else []
+    numeric_columns = [col_idx for col_idx, cell in enumerate(first_data)
+                       if isinstance(cell, (int, float)) and not isinstance(cell, bool)]
+    return {
+        'success': True,
+        'analysis': {
+            'executablePlan': {
+                'removeRows': list(range(header_count - 1)),
+                'renameColumns': {str(col_idx): name for col_idx, name in enumerate(short_names)},
+                'dataValidation': {'numericColumns': numeric_columns}
+            }
+        }
+    }
+
+
+def run_case(name: str, spec: SurveySpec, use_workbook: bool, repeat: int, export_dir: str,
+             warmup: int = DEFAULT_WARMUP) -> Dict[str, Any]:
+    """Time every stage of one case; later stages use the previous stage's output"""
+    stages: Dict[str, float] = {}
+    noise: Dict[str, float] = {}
+
+    def timed(stage: str, run: Callable[..., Any], setup: Optional[Callable[[], Any]] = None) -> Any:
+        measured = best_of(repeat, run, setup, warmup)
+        stages[stage] = measured['seconds']
+        noise[stage] = measured['noise']
+        return measured['result']
+
+    if use_workbook:
+        path = workbook_path(spec)
+        rows = timed('load', lambda: load_workbook_rows(path))
+    else:
+        # Same cell conventions as to_rows(): header text, typed answers, '' for blanks
+        rows = [list(row) for row in header_rows(spec)]
+        for chunk in data_chunks(spec):
+            rows.extend(['' if cell is None else cell for cell in row] for row in chunk)
+
+    detected = timed('detect', lambda: detect_header_rows(rows))
+    header_count = len(detected['header_rows'])
+    if header_count != spec.header_depth:
+        logger.warning(f"{name}: detected {header_count} header rows, generated {spec.header_depth}")
+
+    filled = timed('ffill', lambda: forward_fill_block(rows[:header_count]))
+    long_names = timed('concatenate', lambda: concatenate_columns(filled))
+
+    abbreviator = StubAbbreviator(api_key='benchmark')
+    abbreviated = timed('abbreviate', lambda: abbreviator.abbreviate(long_names, batch_size=DEFAULT_BATCH_SIZE))
+
+    plan = transformation_plan(rows, header_count, abbreviated['names'])
+    wrangler = LLMDataWrangler(api_key='benchmark')
+    table = WorkingTable.from_rows(rows, header_rows=header_count)
+
+    def fresh_working_data():
+        wrangler.working_data = table.copy()
+
+    transformed = timed('transform', lambda _: wrangler.apply_transformation_plan(plan), setup=fresh_working_data)
+    cleaned = transformed['transformed_data']
+
+    export_path = os.path.join(export_dir, f"{name}.parquet")
+    timed('export', lambda: write_columnar(
+        type_columns(cleaned.data_frame(unique_column_names(cleaned.header))), export_path))
+
+    return {'spec': spec.to_dict(), 'workbook': use_workbook, 'header_rows_detected': header_count,
+            'stages': stages, 'noise': noise}
+
+
+def library_version(name: str) -> Optional[str]:
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def machine_info() -> Dict[str, Any]:
+    return {'host': platform.node(), 'platform': platform.platform(),
+            'implementation': platform.python_implementation(), 'python': platform.python_version(),
+            'machine': platform.machine(),
+            'processor': platform.processor() or platform.machine(), 'cpu_count': os.cpu_count(),
+            'libraries': {name: library_version(name) for name in LIBRARIES}}
+
+
+def machine_differences(baseline_machine: Dict[str, Any], machine: Dict[str, Any]) -> List[str]:
+    """MACHINE_FIELDS whose recorded values differ (a baseline without a field counts as different)"""
+    return [field for field in MACHINE_FIELDS if baseline_machine.get(field) != machine.get(field)]
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, min_delta: float) -> List[Dict[str, Any]]:
+    """One row per timed stage that also exists in the baseline"""
+    rows = []
+    for case, result in results['cases'].items():
+        base_case = baseline.get('cases', {}).get(case)
+        if base_case is None:
+            continue
+        if base_case.get('spec') != result['spec']:
+            logger.warning(f"{case}: spec differs from the baseline; not compared")
+            continue
+        for stage, seconds in result['stages'].items():
+            base = base_case['stages'].get(stage)
+            if base is None:
+                continue
+            # A slowdown within the run-to-run noise of either measurement is not a regression
+            noise = base_case.get('noise', {}).get(stage, 0.0) + result.get('noise', {}).get(stage, 0.0)
+            regression = seconds > base * (1 + tolerance) and seconds - base >= max(min_delta, noise)
+            rows.append({'case': case, 'stage': stage, 'baseline': base, 'current': seconds,
+                         'change': (seconds - base) / base if base else 0.0, 'regression': regression})
+    return rows
+
+
+def main():
+    # force: the wrangler modules configure INFO logging on import
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s', force=True)
+    parser = argparse.ArgumentParser(description="Benchmark the wrangling stages on synthetic surveys")
+    parser.add_argument('--suite', choices=sorted(SUITES), default='quick', help="Set of survey shapes to run")
+    parser.add_argument('--case', action='append', help="Only run these cases of the suite")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per stage (best is reported)")
+    parser.add_argument('--warmup', type=int, default=DEFAULT_WARMUP, help="Untimed runs per stage before timing")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline timings to compare against")
+    parser.add_argument('--update-baseline', action='store_true', help="Write this run's timings as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help="Allowed slowdown (0.5 = 50%%)")
+    parser.add_argument('--min-delta', type=float, default=DEFAULT_MIN_DELTA,
+                        help="Ignore slowdowns smaller than this many seconds")
+    parser.add_argument('--ignore-machine', action='store_true',
+                        help="Gate on the baseline even if it was recorded on a different host / interpreter")
+    parser.add_argument('--output', help="Also write this run's results to this JSON file")
+    args = parser.parse_args()
+
+    cases = {name: case for name, case in SUITES[args.suite].items() if not args.case or name in args.case}
+    results = {'suite': args.suite, 'machine': machine_info(), 'repeat': args.repeat, 'warmup': args.warmup,
+               'cases': {}}
+
+    print(f"{'case':<16} " + ' '.join(f"{stage:>11}" for stage in STAGES))
+    with tempfile.TemporaryDirectory() as export_dir:
+        for name, (spec, use_workbook) in cases.items():
+            result = run_case(name, spec, use_workbook, args.repeat, export_dir, args.warmup)
+            results['cases'][name] = result
+            print(f"{name:<16} " + ' '.join(
+                f"{result['stages'][stage]:>10.3f}s" if stage in result['stages'] else f"{'-':>11}" for stage in STAGES
+            ))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        differences = machine_differences(baseline.get('machine', {}), results['machine'])
+        if differences:
+            print(f"\nNOTE: {args.baseline} was recorded with a different {', '.join(differences)}:")
+            for field in differences:
+                print(f"  {field}: {baseline.get('machine', {}).get(field)} (baseline) vs {results['machine'][field]}")
+
+        comparison = compare(results, baseline, args.tolerance, args.min_delta)
+        gated = not differences or args.ignore_machine
+        if gated:
+            regressions = [row for row in comparison if row['regression']]
+        else:
+            print("Timings are shown but not gated; record a baseline here with --update-baseline "
+                  "or pass --ignore-machine")
+        print(f"\nAgainst {args.baseline} (tolerance {args.tolerance:.0%}, min delta {args.min_delta}s):")
+        for row in comparison:
+            flag = ('REGRESSION' if gated else 'slower') if row['regression'] else ''
+            print(f"  {row['case']:<16} {row['stage']:<12} {row['baseline']:>9.3f}s -> {row['current']:>9.3f}s "
+                  f"({row['change']:+.0%}) {flag}")
+
+    if args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline written to {args.baseline}")
+
+    if regressions:
+        print(f"\n{len(regressions)} stage(s) regressed")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
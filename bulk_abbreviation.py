@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Offline Bulk Header Abbreviation (Message Batches API)
+Collects the abbreviation prompts of many documents into one Message Batches
+job instead of sending them as individual requests.
+1. add_document() runs the local fast path and cache, then queues the
+   remaining columns as batch requests (custom_id = "<document>-b<n>")
+2. submit() creates the batch job; wait() polls until it has ended
+3. collect() parses each result back onto its document's columns
+4. finish() fills anything that errored or expired through the normal online
+   path and returns each document's names in column order
+5. The caller stores each document's names, then calls mark_committed(); once
+   every document is committed, retire() archives the checkpoint next to
+   itself, named after the batch id, so the next run starts a new job
+Every step is saved to a JSON checkpoint, so an interrupted run picks up where
+it stopped (a submitted job is polled, never resubmitted, and the names of
+documents not yet committed are served again from the checkpoint).
+"""
+
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+from anthropic import Anthropic
+
+from header_abbreviation import DEFAULT_BATCH_SIZE, AsyncAbbreviator, pack_batches
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_VERSION = 1
+DEFAULT_POLL_SECONDS = 60
+
+STATUS_COLLECTING = 'collecting'
+STATUS_SUBMITTED = 'submitted'
+STATUS_ENDED = 'ended'
+STATUS_COLLECTED = 'collected'
+
+
+class BulkAbbreviationJob:
+    """One resumable Message Batches job covering the pending headers of many documents"""
+
+    def __init__(self, checkpoint_path: Union[str, Path], abbreviator: AsyncAbbreviator,
+                 batch_size: int = DEFAULT_BATCH_SIZE, poll_seconds: float = DEFAULT_POLL_SECONDS,
+                 client: Optional[Anthropic] = None):
+        self.checkpoint_path = Path(checkpoint_path)
+        self.abbreviator = abbreviator
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.client = client or Anthropic(api_key=abbreviator.api_key, base_url=abbreviator.base_url)
+        self.state = self._load_checkpoint()
+
+    def _load_checkpoint(self) -> Dict[str, Any]:
+        if not self.checkpoint_path.exists():
+            return {
+                'version': CHECKPOINT_VERSION,
+                'model': self.abbreviator.model,
+                'prompt_version': self.abbreviator.prompt_version,
+                'status': STATUS_COLLECTING,
+                'batch_id': None,
+                'documents': {},
+                'requests': {},
+                'errors': {}
+            }
+
+        state = json.loads(self.checkpoint_path.read_text(encoding='utf-8'))
+        if (state.get('version') != CHECKPOINT_VERSION or state['model'] != self.abbreviator.model
+                or state['prompt_version'] != self.abbreviator.prompt_version):
+            raise ValueError(f"Checkpoint {self.checkpoint_path} was written for a different model or prompt; "
+                             f"finish it with the original settings or start a new checkpoint")
+        logger.info(f"Resuming bulk abbreviation from {self.checkpoint_path}: status {state['status']}, "
+                    f"{len(state['documents'])} documents, {len(state['requests'])} requests")
+        return state
+
+    def save(self):
+        """Write the checkpoint atomically"""
+        self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.checkpoint_path.with_suffix(self.checkpoint_path.suffix + '.tmp')
+        tmp_path.write_text(json.dumps(self.state, indent=2, ensure_ascii=False), encoding='utf-8')
+        os.replace(tmp_path, self.checkpoint_path)
+
+    @property
+    def status(self) -> str:
+        return self.state['status']
+
+    def add_document(self, key: str, headers: List[str]) -> int:
+        """Queue one document's pending columns; returns how many columns need the model"""
+        if key in self.state['documents']:
+            return len(self.state['documents'][key]['pending'])
+        if self.status != STATUS_COLLECTING:
+            raise RuntimeError(f"Cannot add {key}: batch job already {self.status}")
+
+        known, local_count = self.abbreviator.prefill(headers)
+        pending = [(col_idx, header) for col_idx, header in enumerate(headers) if col_idx not in known]
+
+        for batch_number, batch in enumerate(pack_batches(pending, self.batch_size, self.abbreviator.max_batch_tokens)):
+            self.state['requests'][f"{key}-b{batch_number}"] = {'document': key, 'columns': [col_idx for col_idx, _ in batch]}
+
+        self.state['documents'][key] = {
+            'headers': headers,
+            'known': {str(col_idx): name for col_idx, name in known.items()},
+            'pending': [col_idx for col_idx, _ in pending],
+            'local_count': local_count,
+            'cache_hits': len(known) - local_count
+        }
+        self.save()
+        logger.info(f"Queued {key}: {len(pending)} of {len(headers)} columns need the model")
+        return len(pending)
+
+    def _batch(self, custom_id: str):
+        request = self.state['requests'][custom_id]
+        headers = self.state['documents'][request['document']]['headers']
+        return [(col_idx, headers[col_idx]) for col_idx in request['columns']]
+
+    def submit(self) -> Optional[str]:
+        """Create the batch job (once); returns its id, or None if nothing needs the model"""
+        if self.state['batch_id'] or not self.state['requests']:
+            return self.state['batch_id']
+
+        requests = [
+            {'custom_id': custom_id, 'params': self.abbreviator.build_request(self._batch(custom_id))}
+            for custom_id in self.state['requests']
+        ]
+        batch = self.client.messages.batches.create(requests=requests)
+
+        self.state['batch_id'] = batch.id
+        self.state['status'] = STATUS_SUBMITTED
+        self.save()
+        logger.info(f"Submitted batch {batch.id} with {len(requests)} requests for {len(self.state['documents'])} documents")
+        return batch.id
+
+    def wait(self):
+        """Poll until the batch job has ended"""
+        while self.status == STATUS_SUBMITTED:
+            batch = self.client.messages.batches.retrieve(self.state['batch_id'])
+            counts = batch.request_counts
+            logger.info(f"Batch {batch.id}: {batch.processing_status} "
+                        f"(processing {counts.processing}, succeeded {counts.succeeded}, errored {counts.errored}, "
+                        f"expired {counts.expired}, canceled {counts.canceled})")
+            if batch.processing_status == 'ended':
+                self.state['status'] = STATUS_ENDED
+                self.save()
+                break
+            time.sleep(self.poll_seconds)
+
+    def collect(self):
+        """Parse every result back onto its document's columns"""
+        if self.status != STATUS_ENDED:
+            return
+
+        for entry in self.client.messages.batches.results(self.state['batch_id']):
+            request = self.state['requests'].get(entry.custom_id)
+            if request is None:
+                continue
+            document = self.state['documents'][request['document']]
+            batch = self._batch(entry.custom_id)
+
+            if entry.result.type != 'succeeded':
+                self.state['errors'][entry.custom_id] = entry.result.type
+                logger.warning(f"Request {entry.custom_id} {entry.result.type}")
+                continue
+            try:
+                abbreviations = self.abbreviator.response_parser(entry.result.message.content[0].text, batch)
+            except Exception as e:
+                self.state['errors'][entry.custom_id] = f"unparseable: {e}"
+                logger.warning(f"Request {entry.custom_id} returned an unparseable reply: {e}")
+                continue
+
+            document['known'].update({str(col_idx): name for col_idx, name in abbreviations.items()})
+            self.abbreviator.remember(document['headers'], abbreviations)
+
+        self.state['status'] = STATUS_COLLECTED
+        self.save()
+        logger.info(f"Collected batch {self.state['batch_id']}: {len(self.state['errors'])} requests need a retry")
+
+    def finish(self) -> Dict[str, Dict[str, Any]]:
+        """Names per uncommitted document in column order; columns still missing go through the online path"""
+        results = {}
+        for key, document in self.state['documents'].items():
+            if document.get('committed'):
+                continue
+            headers = document['headers']
+            known = {int(col_idx): name for col_idx, name in document['known'].items()}
+            missing = len(headers) - len(known)
+
+            if missing:
+                logger.info(f"{key}: requesting {missing} columns the batch job did not return")
+                online = self.abbreviator.abbreviate(headers, self.batch_size, known=known,
+                                                     on_batch=lambda names, document=document: self._keep(document, names))
+                names = online['names']
+            else:
+                names = self.abbreviator.assemble(headers, known)
+
+            results[key] = {
+                'names': names,
+                'local_count': document['local_count'],
+                'cache_hits': document['cache_hits'],
+                'batched': len(document['pending']),
+                'retried_online': missing
+            }
+        return results
+
+    def _keep(self, document: Dict[str, Any], abbreviations: Dict[int, str]):
+        """Save names fetched online, so a crash before the commit does not request them again"""
+        document['known'].update({str(col_idx): name for col_idx, name in abbreviations.items()})
+        self.save()
+
+    def mark_committed(self, key: str):
+        """Record that a document's names have been stored; a resumed run no longer returns it"""
+        self.state['documents'][key]['committed'] = True
+        self.save()
+
+    @property
+    def uncommitted(self) -> List[str]:
+        return [key for key, document in self.state['documents'].items() if not document.get('committed')]
+
+    def retire(self) -> Optional[Path]:
+        """Move the finished checkpoint aside (<name>.<batch id>.json) so the next run starts a new job
+
+        Refuses (returns None) while any document's names are not committed yet.
+        """
+        if not self.checkpoint_path.exists():
+            return None
+        if self.uncommitted:
+            logger.warning(f"Keeping checkpoint {self.checkpoint_path}: {len(self.uncommitted)} documents "
+                           f"not committed yet ({', '.join(self.uncommitted)})")
+            return None
+        archived = self.checkpoint_path.with_name(
+            f"{self.checkpoint_path.stem}.{self.state['batch_id'] or f'local-{int(time.time())}'}"
+            f"{self.checkpoint_path.suffix}")
+        os.replace(self.checkpoint_path, archived)
+        logger.info(f"Archived finished checkpoint to {archived}")
+        return archived
+
+    def run(self) -> Dict[str, Dict[str, Any]]:
+        """submit -> wait -> collect -> finish, resuming from whatever the checkpoint says
+
+        The checkpoint stays in place; mark_committed() each document once its
+        names are stored, then retire().
+        """
+        if self.submit():
+            self.wait()
+            self.collect()
+        return self.finish()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Columnar Cell Normalization
+Shared by ImprovedDataWrangler, LLMDataWrangler and PythonDataWrangler.
+1. Header rows are stringified: empty -> '', everything else str(cell).strip()
+2. Data rows keep their numeric / datetime dtypes; text cells are stripped and
+   blank text becomes missing, in pure-text and mixed (e.g. 3 and ' 5+ ') columns alike
+3. Data columns are handled with pandas column ops; only the scanned header rows
+   are inspected cell by cell
+4. Streamed rows are turned into the frame chunk by chunk, so the body never
+   exists as one list of row tuples
+"""
+
+import datetime
+import logging
+import numbers
+from itertools import islice
+from typing import Any, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEADER_SCAN_ROWS = 10
+DEFAULT_FRAME_CHUNK_ROWS = 5000
+
+
+def frame_from_rows(rows: Iterable[Tuple[Any, ...]], chunk_rows: int = DEFAULT_FRAME_CHUNK_ROWS) -> pd.DataFrame:
+    """Build a raw (untyped) frame from streamed rows, with integer column labels
+
+    At most chunk_rows row tuples are held at a time; each chunk becomes an
+    object-dtype block (so a chunk's own dtype guess cannot differ from the
+    next one's) and normalize_data restores the dtypes over the whole column.
+    """
+    iterator = iter(rows)
+    chunks = []
+    while True:
+        chunk = list(islice(iterator, chunk_rows))
+        if not chunk:
+            break
+        chunks.append(pd.DataFrame.from_records(chunk).astype(object))
+    if not chunks:
+        return pd.DataFrame()
+    if len(chunks) == 1:
+        return chunks[0]
+    return pd.concat(chunks, ignore_index=True)
+
+
+def stringify_rows(frame: pd.DataFrame) -> List[List[str]]:
+    """Header rows: NaN/None -> '', all other cells -> stripped strings"""
+    if frame.empty:
+        return [[] for _ in range(len(frame))]
+
+    block = frame.astype(object).where(frame.notna(), '')
+    block = block.astype(str).apply(lambda column: column.str.strip())
+    return block.values.tolist()
+
+
+def normalize_data(frame: pd.DataFrame) -> pd.DataFrame:
+    """Data rows: restore column dtypes, strip text columns and map blank text to NA"""
+    # convert_dtypes keeps integer answers integral even when the column has gaps
+    frame = frame.reset_index(drop=True).convert_dtypes()
+
+    for col in frame.columns:
+        column = frame[col]
+        kind = pd.api.types.infer_dtype(column, skipna=True)
+        if kind == 'string':
+            stripped = column.str.strip()
+            frame[col] = stripped.where(stripped != '', np.nan)
+        elif kind in ('mixed', 'mixed-integer'):
+            # .str ops return NaN for the non-str cells, which keep their original value
+            stripped = column.str.strip()
+            is_text = stripped.notna()
+            column = column.where(~is_text, stripped)
+            frame[col] = column.where(~(is_text & (stripped == '')), np.nan)
+
+    return frame
+
+
+def leading_text_rows(frame: pd.DataFrame, max_rows: int = DEFAULT_HEADER_SCAN_ROWS) -> int:
+    """Count leading rows that contain no numeric or datetime cells (header candidates)"""
+    head = frame.iloc[:max_rows]
+    if head.empty:
+        return 0
+
+    # Only the scanned head is inspected cell by cell, so this stays cheap on wide sheets
+    typed = head.map(
+        lambda cell: isinstance(cell, (numbers.Number, datetime.date)) and not isinstance(cell, bool) and not pd.isna(cell)
+    ).to_numpy(dtype=bool)
+
+    has_typed = typed.any(axis=1)
+    return int(np.argmax(has_typed)) if has_typed.any() else len(head)
+
+
+def normalize_sheet(frame: pd.DataFrame, header_rows: Optional[int] = None) -> Tuple[List[List[str]], pd.DataFrame]:
+    """Split a raw sheet into stringified header rows and a typed data frame"""
+    if header_rows is None:
+        header_rows = leading_text_rows(frame)
+
+    headers = stringify_rows(frame.iloc[:header_rows])
+    data = normalize_data(frame.iloc[header_rows:])
+
+    logger.info(f"Normalized sheet: {len(headers)} header rows stringified, {len(data)} data rows typed "
+                f"({int((data.dtypes != object).sum())}/{len(data.columns)} columns non-object)")
+
+    return headers, data
+
+
+def to_rows(headers: List[List[str]], data: pd.DataFrame) -> List[List[Any]]:
+    """List-of-rows view for the list-based wranglers; missing data cells become ''"""
+    body = data.astype(object).where(data.notna(), '')
+    return [row[:] for row in headers] + body.values.tolist()
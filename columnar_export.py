@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Columnar Export for Cleaned Survey Data
+Writes the cleaned grid as Parquet or Feather (Arrow IPC) so downstream
+analytics can skip CSV parsing and type inference.
+1. Numeric answers get numeric dtypes (nullable Int64 / Float64)
+2. Likert and choice answers (low-cardinality text) are dictionary-encoded categoricals
+3. Parquet row groups are sized from the estimated row width
+4. read_columnar() memory-maps the file back
+"""
+
+import logging
+import os
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+# A text column becomes categorical when it has at most this many distinct answers...
+MAX_CATEGORIES = 1000
+# ...and they make up no more than this share of its non-empty cells
+MAX_CATEGORY_RATIO = 0.5
+
+TARGET_ROW_GROUP_BYTES = 64 * 1024 * 1024
+
+
+def unique_column_names(header: Sequence[Any]) -> List[str]:
+    """Columnar formats need unique, non-empty string names"""
+    names = []
+    seen: Dict[str, int] = {}  # name -> last suffix tried for it
+    for col_idx, name in enumerate(header):
+        name = str(name).strip() or f'column_{col_idx}'
+        if name in seen:
+            # A generated name can clash with a later literal one (['a', 'a', 'a_2']), so keep counting
+            base = name
+            while name in seen:
+                seen[base] += 1
+                name = f'{base}_{seen[base]}'
+        seen[name] = 1
+        names.append(name)
+    return names
+
+
+def categorical_type(column: pd.Series, category_dtypes: Optional[Dict[tuple, pd.CategoricalDtype]] = None) -> pd.Series:
+    """type_column for a dictionary-encoded column: decide on its distinct values, then map the codes
+
+    Lookup tables have one slot per category plus a trailing missing slot, so
+    indexing them with the codes sends code -1 to the missing value.
+    category_dtypes shares one dtype between columns with the same answer set.
+    """
+    categories = column.cat.categories.to_numpy(dtype=object)
+    codes = column.cat.codes.to_numpy()
+    # Blank ('') and unused categories count as missing, as in the generic path
+    keep = np.zeros(len(categories) + 1, dtype=bool)
+    keep[codes] = True
+    keep = keep[:-1] & (categories != '')
+    slots = np.flatnonzero(keep)
+    present = categories[slots]
+    if not len(present):
+        return pd.Series(pd.array(np.full(len(column), None), dtype='string'), index=column.index)
+
+    if pd.api.types.infer_dtype(present, skipna=True) in ('datetime', 'datetime64', 'date'):
+        return type_column(column.astype(object))
+
+    numbers = pd.to_numeric(present, errors='coerce').astype('float64')
+    if not np.isnan(numbers).any():
+        values = np.full(len(categories) + 1, np.nan)
+        values[slots] = numbers
+        return pd.Series(pd.array(values[codes], dtype='Int64' if (numbers % 1 == 0).all() else 'Float64'),
+                         index=column.index)
+
+    # Distinct values can share a text form (1 and '1'), so re-factorize on the strings
+    labels = present.astype(str)
+    uniques, inverse = np.unique(labels, return_inverse=True)
+    text_codes = np.full(len(categories) + 1, -1)
+    text_codes[slots] = inverse
+    text_codes = text_codes[codes]
+    if len(uniques) <= MAX_CATEGORIES and len(uniques) <= (text_codes >= 0).sum() * MAX_CATEGORY_RATIO:
+        key = tuple(uniques)
+        dtype = category_dtypes.get(key) if category_dtypes is not None else None
+        if dtype is None:
+            dtype = pd.CategoricalDtype(pd.Index(uniques, dtype='string'))
+            if category_dtypes is not None:
+                category_dtypes[key] = dtype
+        return pd.Series(pd.Categorical.from_codes(text_codes, dtype=dtype, validate=False), index=column.index)
+
+    text = np.full(len(categories) + 1, None, dtype=object)
+    text[slots] = labels
+    return pd.Series(pd.array(text[codes], dtype='string'), index=column.index)
+
+
+def type_column(column: pd.Series, category_dtypes: Optional[Dict[tuple, pd.CategoricalDtype]] = None) -> pd.Series:
+    """Give one column of cleaned cells its most specific dtype"""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return categorical_type(column, category_dtypes)
+    if pd.api.types.is_numeric_dtype(column.dtype) and not pd.api.types.is_bool_dtype(column.dtype):
+        # Already typed by the working table: only pick the nullable dtype
+        if column.isna().all():
+            return column.astype('string')
+        if pd.api.types.is_integer_dtype(column.dtype) or (column.dropna() % 1 == 0).all():
+            return column.astype('Int64')
+        return column.astype('Float64')
+
+    column = column.replace('', pd.NA)
+    present = column.dropna()
+    if present.empty:
+        return column.astype('string')
+
+    # Check dates first: to_numeric would happily turn a column of Timestamps into epoch integers
+    if pd.api.types.infer_dtype(present, skipna=True) in ('datetime', 'datetime64', 'date'):
+        return pd.to_datetime(column, errors='coerce')
+
+    numeric = pd.to_numeric(present, errors='coerce')
+    if numeric.notna().all():
+        numeric = pd.to_numeric(column, errors='coerce')
+        if (numeric.dropna() % 1 == 0).all():
+            return numeric.astype('Int64')
+        return numeric.astype('Float64')
+
+    text = column.astype('string')
+    distinct = text.nunique(dropna=True)
+    if distinct <= MAX_CATEGORIES and distinct <= len(present) * MAX_CATEGORY_RATIO:
+        return text.astype('category')
+    return text
+
+
+def type_columns(raw: pd.DataFrame) -> pd.DataFrame:
+    """The cleaned frame (unique column names, see unique_column_names) with per-column dtypes"""
+    category_dtypes: Dict[tuple, pd.CategoricalDtype] = {}
+    # Plain arrays: a dict of Series would be re-aligned on the index column by column
+    return pd.DataFrame({name: type_column(column, category_dtypes).array for name, column in raw.items()},
+                        index=raw.index, copy=False)
+
+
+def auto_row_group_size(frame: pd.DataFrame, target_bytes: int = TARGET_ROW_GROUP_BYTES) -> int:
+    """Rows per Parquet row group so each group is roughly target_bytes in memory"""
+    if frame.empty:
+        return 1
+    bytes_per_row = max(1, int(frame.memory_usage(deep=True, index=False).sum() / len(frame)))
+    return max(1, min(len(frame), target_bytes // bytes_per_row))
+
+
+def write_columnar(frame: pd.DataFrame, filename: str, row_group_size: Optional[int] = None) -> Dict[str, Any]:
+    """Write Parquet (.parquet) or Feather/Arrow IPC (.feather / .arrow) based on the extension"""
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+
+    if filename.endswith(('.feather', '.arrow')):
+        # Uncompressed so the reader can memory-map it without decoding
+        feather.write_feather(table, filename, compression='uncompressed')
+        row_group_size = None
+    else:
+        row_group_size = row_group_size or auto_row_group_size(frame)
+        pq.write_table(table, filename, row_group_size=row_group_size, compression='zstd')
+
+    categorical = sum(1 for dtype in frame.dtypes if isinstance(dtype, pd.CategoricalDtype))
+    numeric = sum(1 for dtype in frame.dtypes if pd.api.types.is_numeric_dtype(dtype))
+    logger.info(f"Wrote {filename}: {len(frame)} rows, {len(frame.columns)} columns "
+                f"({numeric} numeric, {categorical} categorical), {os.path.getsize(filename)} bytes")
+
+    return {
+        'filename': filename,
+        'rows': len(frame),
+        'columns': len(frame.columns),
+        'numeric_columns': numeric,
+        'categorical_columns': categorical,
+        'row_group_size': row_group_size,
+        'bytes': os.path.getsize(filename)
+    }
+
+
+def read_columnar(filename: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Memory-map a file written by write_columnar back into a DataFrame"""
+    if filename.endswith(('.feather', '.arrow')):
+        table = feather.read_table(filename, columns=columns, memory_map=True)
+    else:
+        table = pq.read_table(filename, columns=columns, memory_map=True)
+    return table.to_pandas()
@@ -0,0 +1,18 @@
+-- Binary document storage for source_documents
+-- Uploads are kept as (optionally gzip-compressed) bytea instead of base64 TEXT,
+-- which is ~33% larger than the file and has to be decoded into a second copy.
+
+ALTER TABLE source_documents
+ADD COLUMN IF NOT EXISTS file_content BYTEA, -- Raw or gzip-compressed file bytes
+ADD COLUMN IF NOT EXISTS file_content_encoding VARCHAR(20), -- 'gzip' or 'identity'
+ADD COLUMN IF NOT EXISTS file_content_size INTEGER; -- Stored (compressed) size in bytes
+
+-- Payload is already compressed client-side (or is an xlsx zip), so skip TOAST compression
+ALTER TABLE source_documents ALTER COLUMN file_content SET STORAGE EXTERNAL;
+
+-- Migrated rows may drop their base64 copy
+ALTER TABLE source_documents ALTER COLUMN file_content_base64 DROP NOT NULL;
+
+-- Find rows still waiting for migration
+CREATE INDEX IF NOT EXISTS idx_source_documents_unmigrated
+    ON source_documents(id) WHERE file_content IS NULL;
@@ -7,14 +7,32 @@ Uses same remote database and Anthropic API as the JavaScript version
 import os
 import sys
 import json
+import time
 import base64
-import pandas as pd
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool
 import anthropic
 from dotenv import load_dotenv
 import logging
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cell_normalization import frame_from_rows, normalize_sheet, to_rows
+from document_storage import fetch_document_content, fetch_document_metadata
+from survey_data_writer import find_respondent_column, write_survey_data
+from survey_waves import WaveRegistry, header_fingerprint, new_respondent_mask, respondent_keys, select_rows
+from excel_loader import open_sheet
+from header_block import concatenate_columns, forward_fill_block, last_filled_column
+from header_detection import detect_header_rows, log_profiles
+from abbreviation_cache import AbbreviationCache
+from bulk_abbreviation import DEFAULT_POLL_SECONDS, STATUS_COLLECTING, BulkAbbreviationJob
+from header_abbreviation import (DEFAULT_CONCURRENCY, AsyncAbbreviator, format_header_list, split_stem,
+                                 strip_code_fence, worked_example)
+from stage_graph import StageGraph, timing_lines
+from stage_metrics import DEFAULT_PROFILE_DIR, StageProfiler, rows_shape
+from request_scheduler import get_scheduler
+
 # Load environment variables
 load_dotenv()
 
@@ -22,17 +40,102 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# The reply repeats every original header, so keep batches smaller than the shared default
+ABBREVIATION_BATCH_SIZE = 25
+
+DEFAULT_BULK_CHECKPOINT = '.cache/bulk_abbreviation.json'
+
+
+ABBREVIATION_RULES = """You are a data analysis expert. I need you to create short, meaningful abbreviated column names for survey data columns.
+
+The user message lists the full column names. For each column, provide a concise abbreviation (max 20 characters) that captures the essence of the question. Focus on the key concept being measured.
+
+Guidelines:
+- Use clear, readable abbreviations 
+- Include question context when important
+- Use underscores for readability
+- Avoid special characters except underscores
+- Make names unique and descriptive
+- Lines under a "Question:" line are sub-labels of that question; give one abbreviation per numbered line
+- Copy each line's number into "column" and its text into "original"
+
+Return ONLY a JSON object with this exact format:
+{
+  "abbreviations": [
+    {"column": 3, "original": "full name", "abbreviated": "short_name"},
+    ...
+  ]
+}"""
+
+
+def build_abbreviation_prompt(batch):
+    """Per-batch part of the abbreviation prompt: the (column, concatenated header) pairs"""
+    return f"Here are the full column names:\n{format_header_list(batch, line_format='{col_idx}. {header}')}"
+
+
+def build_abbreviation_reply(batch, names):
+    """The reply parse_abbreviation_response expects, for the worked example"""
+    return json.dumps({'abbreviations': [{'column': col_idx, 'original': header, 'abbreviated': names[col_idx]}
+                                         for col_idx, header in batch]}, indent=2)
+
+
+ABBREVIATION_INSTRUCTIONS = f"{ABBREVIATION_RULES}\n\n{worked_example(build_abbreviation_prompt, build_abbreviation_reply)}"
+
+
+def parse_abbreviation_response(response_text, batch):
+    """Map the returned abbreviations back onto column numbers by their echoed "column" (or "original")
+
+    Entries that match no column of the batch are dropped, so a skipped or
+    reordered entry leaves its column to the fallback instead of shifting names.
+    """
+    abbreviations = json.loads(strip_code_fence(response_text)).get('abbreviations', [])
+    columns = {col_idx for col_idx, _ in batch}
+    # Sub-labels under a "Question:" line are listed without their stem
+    by_original = {}
+    for col_idx, header in batch:
+        for text in {header.strip(), split_stem(header)[1].strip()}:
+            by_original.setdefault(text, []).append(col_idx)
+
+    names = {}
+    for abbrev in abbreviations:
+        if not isinstance(abbrev, dict) or not abbrev.get('abbreviated'):
+            continue
+        col_idx = abbrev.get('column')
+        try:
+            col_idx = int(col_idx)
+        except (TypeError, ValueError):
+            col_idx = None
+        if col_idx not in columns:
+            # Repeated sub-labels ("Other") go to the first of their columns still unnamed
+            candidates = by_original.get(str(abbrev.get('original', '')).strip(), [])
+            col_idx = next((candidate for candidate in candidates if candidate not in names), None)
+        if col_idx is not None and col_idx not in names:
+            names[col_idx] = abbrev['abbreviated']
+    return names
+
+
 class PythonDataWrangler:
-    def __init__(self):
+    def __init__(self, use_cache=True, incremental=True):
         self.anthropic_client = anthropic.Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY'))
         self.database_url = os.getenv('DATABASE_URL')
         self.connection = None
         self.original_data = None
         self.header_rows = []
         self.data_start_row = None
+        self.header_confidence = None
         self.filled_headers = []
         self.concatenated_headers = []
         self.column_mapping = {}
+        self.persist_result = None
+        self.abbreviation_cache = AbbreviationCache() if use_cache else None
+        self.wave_registry = WaveRegistry() if incremental else None
+        self.previous_wave = None  # Earlier upload with the same header block, if any
+        self.wave_fingerprint = None
+        self.respondent_keys = None
+        self.new_row_mask = None
+        self.stages = None  # StageGraph of the document being processed
+        self.stages_for = None
+        self.profiler = None  # Optional StageProfiler measuring every stage
         
     def connect_database(self):
         """Connect to PostgreSQL database"""
@@ -46,51 +149,38 @@ class PythonDataWrangler:
             return False
     
     def get_document_from_database(self, document_id=1):
-        """Retrieve document from database"""
+        """Retrieve document metadata from database (the file payload is fetched separately)"""
         try:
-            cursor = self.connection.cursor(cursor_factory=RealDictCursor)
-            
-            query = """
-                SELECT id, name, original_filename, file_type, file_size, 
-                       file_content_base64, processing_status, target_demographic, description
-                FROM source_documents 
-                WHERE id = %s
-            """
-            
-            cursor.execute(query, (document_id,))
-            document = cursor.fetchone()
-            
-            if not document:
-                raise Exception(f"Document with ID {document_id} not found")
+            document = fetch_document_metadata(self.connection, document_id)
             
             logger.info(f"Retrieved document: {document['name']}")
             logger.info(f"File size: {document['file_size']} bytes")
             
-            return dict(document)
+            return document
             
         except Exception as e:
             logger.error(f"Failed to retrieve document: {e}")
             raise
-        finally:
-            cursor.close()
     
-    def load_excel_from_base64(self, base64_content):
-        """Load Excel data from base64 string"""
+    def get_document_content(self, document_id=1):
+        """Retrieve the document's file content as a BytesIO (binary column, base64 fallback)"""
         try:
-            logger.info("Decoding base64 content...")
-            
-            # Decode base64 to bytes
-            excel_bytes = base64.b64decode(base64_content)
-            
-            # Load Excel file into pandas
-            df = pd.read_excel(excel_bytes, sheet_name=0, header=None)
-            
-            # Convert to list of lists (like JavaScript version)
-            self.original_data = df.values.tolist()
+            return fetch_document_content(self.connection, document_id)
+        except Exception as e:
+            logger.error(f"Failed to retrieve document content: {e}")
+            raise
+    
+    def load_excel_from_bytes(self, excel_file):
+        """Load Excel data from raw bytes or a file-like object"""
+        try:
+            # Stream the first worksheet into a raw frame
+            with open_sheet(excel_file, sheet=0) as stream:
+                frame = frame_from_rows(stream.rows())
             
-            # Fill NaN with empty strings
-            for i, row in enumerate(self.original_data):
-                self.original_data[i] = [str(cell) if pd.notna(cell) else '' for cell in row]
+            # Convert to list of lists (like JavaScript version): header rows as
+            # strings, data rows keeping their numeric/datetime values
+            headers, data = normalize_sheet(frame)
+            self.original_data = to_rows(headers, data)
             
             logger.info(f"Loaded Excel data: {len(self.original_data)} rows x {len(self.original_data[0]) if self.original_data else 0} columns")
             
@@ -100,44 +190,24 @@ class PythonDataWrangler:
             logger.error(f"Failed to load Excel data: {e}")
             return False
     
+    def load_excel_from_base64(self, base64_content):
+        """Load Excel data from base64 string"""
+        logger.info("Decoding base64 content...")
+        return self.load_excel_from_bytes(base64.b64decode(base64_content))
+    
     def determine_header_rows(self):
-        """Determine how many header rows exist"""
+        """Determine how many header rows exist (vectorized row profiling, any depth)"""
         try:
             logger.info("Determining header rows...")
             
-            max_rows_to_check = min(10, len(self.original_data))
-            
-            for row_idx in range(max_rows_to_check):
-                row = self.original_data[row_idx]
-                
-                # Calculate empty ratio
-                empty_count = sum(1 for cell in row if cell == '' or cell == 'nan')
-                empty_ratio = empty_count / len(row) if row else 1
-                
-                # Calculate numeric ratio  
-                numeric_count = 0
-                for cell in row:
-                    try:
-                        float(cell)
-                        numeric_count += 1
-                    except (ValueError, TypeError):
-                        pass
-                numeric_ratio = numeric_count / len(row) if row else 0
-                
-                logger.info(f"Row {row_idx}: empty_ratio={empty_ratio:.2f}, numeric_ratio={numeric_ratio:.2f}")
-                
-                # If high numeric ratio and low empty ratio, likely data row
-                if numeric_ratio > 0.3 and empty_ratio < 0.5:
-                    self.data_start_row = row_idx
-                    break
-            
-            # If no clear data row found, assume headers are first 2 rows
-            if self.data_start_row is None:
-                self.data_start_row = 2
+            detection = detect_header_rows(self.original_data)
+            log_profiles(detection['profiles'], detection['data_start_row'])
             
-            self.header_rows = list(range(self.data_start_row))
+            self.data_start_row = detection['data_start_row']
+            self.header_rows = detection['header_rows']
+            self.header_confidence = detection['confidence']
             
-            logger.info(f"Determined header rows: {self.header_rows}")
+            logger.info(f"Determined header rows: {self.header_rows} (confidence {self.header_confidence:.2f})")
             logger.info(f"Data starts at row: {self.data_start_row}")
             
             return True
@@ -147,29 +217,15 @@ class PythonDataWrangler:
             return False
     
     def forward_fill_headers(self):
-        """Forward fill blank headers to the right"""
+        """Forward fill blank headers to the right (whole header block at once)"""
         try:
             logger.info("Forward filling header rows...")
             
-            self.filled_headers = []
+            rows = [self.original_data[row_idx] for row_idx in self.header_rows if row_idx < len(self.original_data)]
+            self.filled_headers = forward_fill_block(rows)
             
-            for row_idx in self.header_rows:
-                if row_idx >= len(self.original_data):
-                    continue
-                
-                original_row = self.original_data[row_idx][:]
-                filled_row = original_row[:]
-                
-                # Forward fill: propagate non-empty values to the right
-                last_value = ''
-                for col_idx in range(len(filled_row)):
-                    if filled_row[col_idx] and filled_row[col_idx].strip():
-                        last_value = filled_row[col_idx].strip()
-                    elif last_value:
-                        filled_row[col_idx] = last_value
-                
-                self.filled_headers.append(filled_row)
-                logger.info(f"Row {row_idx} filled: first 5 = {filled_row[:5]}")
+            for row_idx, filled_row in zip(self.header_rows, self.filled_headers):
+                logger.info(f"Row {row_idx} filled: first 5 = {filled_row[:5].tolist()}")
             
             return True
             
@@ -182,36 +238,14 @@ class PythonDataWrangler:
         try:
             logger.info("Concatenating headers with | separator...")
             
-            if not self.filled_headers:
+            if not len(self.filled_headers):
                 raise Exception("No filled headers to concatenate")
             
-            # Find rightmost filled column
-            rightmost_filled_column = 0
-            for header_row in self.filled_headers:
-                for col_idx in range(len(header_row) - 1, -1, -1):
-                    if header_row[col_idx] and header_row[col_idx].strip():
-                        rightmost_filled_column = max(rightmost_filled_column, col_idx)
-                        break
-            
+            # Columns right of the rightmost filled one are dropped
+            rightmost_filled_column = max(last_filled_column(self.filled_headers), 0)
             logger.info(f"Processing columns 0 to {rightmost_filled_column} (rightmost filled column)")
             
-            # Create concatenated headers
-            self.concatenated_headers = []
-            
-            for col_idx in range(rightmost_filled_column + 1):
-                header_parts = []
-                for header_row in self.filled_headers:
-                    if col_idx < len(header_row) and header_row[col_idx] and header_row[col_idx].strip():
-                        header_parts.append(header_row[col_idx].strip())
-                
-                # Join with | separator, remove duplicates
-                unique_parts = []
-                for part in header_parts:
-                    if part not in unique_parts:
-                        unique_parts.append(part)
-                
-                concatenated = ' | '.join(unique_parts) if unique_parts else f'Column_{col_idx}'
-                self.concatenated_headers.append(concatenated)
+            self.concatenated_headers = concatenate_columns(self.filled_headers, num_columns=rightmost_filled_column + 1)
             
             logger.info(f"Created {len(self.concatenated_headers)} concatenated headers")
             logger.info(f"Example: Column 15 = '{self.concatenated_headers[15] if len(self.concatenated_headers) > 15 else 'N/A'}'")
@@ -222,86 +256,182 @@ class PythonDataWrangler:
             logger.error(f"Failed to concatenate headers: {e}")
             return False
     
-    def generate_abbreviated_names_llm(self):
-        """Use Claude to generate abbreviated column names"""
+    def build_abbreviator(self, concurrency=DEFAULT_CONCURRENCY):
+        """Abbreviation engine configured with this pipeline's prompt, parser and cache"""
+        return AsyncAbbreviator(
+            api_key=os.getenv('ANTHROPIC_API_KEY'),
+            concurrency=concurrency,
+            max_tokens=2000,
+            temperature=None,
+            instructions=ABBREVIATION_INSTRUCTIONS,
+            prompt_builder=build_abbreviation_prompt,
+            response_parser=parse_abbreviation_response,
+            cache=self.abbreviation_cache,
+            max_length=20
+        )
+    
+    def set_column_mapping(self, abbreviated_headers):
+        """Build column_mapping from the concatenated headers and their abbreviations"""
+        self.column_mapping = {}
+        for idx, (long_name, short_name) in enumerate(zip(self.concatenated_headers, abbreviated_headers)):
+            self.column_mapping[str(idx)] = {
+                'longName': long_name,
+                'shortName': short_name
+            }
+    
+    def generate_abbreviated_names_llm(self, batch_size=ABBREVIATION_BATCH_SIZE, concurrency=DEFAULT_CONCURRENCY):
+        """Use Claude to generate abbreviated column names (batches sent concurrently)"""
         try:
-            logger.info("Generating abbreviated names with Claude Opus 4.1...")
-            
-            # Process in batches of 25 columns
-            batch_size = 25
-            abbreviated_headers = []
+            logger.info(f"Generating abbreviated names with Claude Opus 4.1 ({concurrency} concurrent batches)...")
             
-            for i in range(0, len(self.concatenated_headers), batch_size):
-                batch = self.concatenated_headers[i:i + batch_size]
-                
-                logger.info(f"Processing batch {i//batch_size + 1}: columns {i}-{i+len(batch)-1}")
-                
-                # Create prompt for this batch
-                batch_list = '\n'.join([f"{i+idx}. {header}" for idx, header in enumerate(batch)])
-                
-                prompt = f"""You are a data analysis expert. I need you to create short, meaningful abbreviated column names for survey data columns.
-
-Here are the full column names:
-{batch_list}
-
-For each column, provide a concise abbreviation (max 20 characters) that captures the essence of the question. Focus on the key concept being measured.
-
-Guidelines:
-- Use clear, readable abbreviations 
-- Include question context when important
-- Use underscores for readability
-- Avoid special characters except underscores
-- Make names unique and descriptive
-
-Return ONLY a JSON object with this exact format:
-{{
-  "abbreviations": [
-    {{"original": "full name", "abbreviated": "short_name"}},
-    ...
-  ]
-}}"""
-
-                # Call Claude API
-                response = self.anthropic_client.messages.create(
-                    model="claude-opus-4-1-20250805",
-                    max_tokens=2000,
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                
-                # Parse response
-                response_text = response.content[0].text.strip()
-                
-                try:
-                    response_json = json.loads(response_text)
-                    abbreviations = response_json.get('abbreviations', [])
-                    
-                    for abbrev in abbreviations:
-                        abbreviated_headers.append(abbrev['abbreviated'])
-                    
-                    logger.info(f"Generated {len(abbreviations)} abbreviations for batch")
-                    
-                except json.JSONDecodeError as e:
-                    logger.warning(f"Failed to parse LLM response as JSON: {e}")
-                    # Fallback: create simple abbreviations
-                    for idx, header in enumerate(batch):
-                        abbreviated_headers.append(f"col_{i+idx}")
+            result = self.build_abbreviator(concurrency).abbreviate(self.concatenated_headers, batch_size=batch_size)
+            abbreviated_headers = result['names']
+            self.abbreviation_batch_stats = result['batch_stats']
+            self.set_column_mapping(abbreviated_headers)
             
-            # Create column mapping
-            self.column_mapping = {}
-            for idx, (long_name, short_name) in enumerate(zip(self.concatenated_headers, abbreviated_headers)):
-                self.column_mapping[str(idx)] = {
-                    'longName': long_name,
-                    'shortName': short_name
-                }
-            
-            logger.info(f"Generated {len(abbreviated_headers)} abbreviated names")
+            logger.info(f"Generated {len(abbreviated_headers)} abbreviated names in {result['wall_seconds']}s "
+                        f"({result['batches']} batches, {result['splits']} splits, {result['local_count']} local, {result['cache_hits']} cache hits, "
+                        f"{result['fallback_count']} fallbacks)")
             return True
             
         except Exception as e:
             logger.error(f"Failed to generate abbreviated names: {e}")
             return False
     
-    def run_complete_pipeline(self, document_id=1):
+    def persist_survey_data(self, document_id):
+        """Bulk-write the wrangled data rows into survey_data (replacing earlier rows)
+
+        For a new wave of a survey already stored, only the new respondents are
+        appended to the first document's survey_data.
+        """
+        try:
+            data_rows = self.original_data[self.data_start_row:]
+            if self.appends_wave():
+                base_document_id = self.previous_wave['document_id']
+                new_rows = select_rows(data_rows, self.new_row_mask)
+                self.persist_result = write_survey_data(self.connection, base_document_id, new_rows, self.column_mapping,
+                                                        replace=False, respondent_offset=self.previous_wave['respondents'])
+                logger.info(f"Appended {len(new_rows)} new respondents of document {document_id} "
+                            f"to document {base_document_id}'s survey_data")
+            else:
+                self.persist_result = write_survey_data(self.connection, document_id, data_rows, self.column_mapping)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to persist survey data: {e}")
+            return False
+    
+    def match_previous_wave(self):
+        """Reuse the column_mapping of an earlier upload with the same header block (skips the LLM)"""
+        if self.wave_registry is None:
+            return False
+        
+        self.wave_fingerprint = header_fingerprint(self.original_data[:self.data_start_row])
+        previous = self.wave_registry.lookup(self.wave_fingerprint)
+        if previous is None or len(previous['column_mapping']) != len(self.concatenated_headers):
+            return False
+        
+        self.previous_wave = previous
+        self.column_mapping = previous['column_mapping']
+        
+        data_rows = self.original_data[self.data_start_row:]
+        self.respondent_keys = respondent_keys(data_rows, previous['respondent_column'])
+        self.new_row_mask = new_respondent_mask(self.respondent_keys, self.wave_registry.known_respondents(self.wave_fingerprint))
+        
+        logger.info(f"Header block matches document {previous['document_id']} (wave {previous['waves'] + 1}): "
+                    f"reusing its column mapping, {int(self.new_row_mask.sum())} of {len(data_rows)} respondents are new")
+        return True
+    
+    def appends_wave(self):
+        """True when the earlier wave's respondents are already in survey_data"""
+        return self.previous_wave is not None and self.previous_wave['respondents'] > 0
+    
+    def record_wave(self, document_id, persisted=False):
+        """Remember this header block (and, once persisted, its respondents) for later waves"""
+        if self.wave_registry is None:
+            return
+        
+        if self.appends_wave():
+            if persisted:
+                self.wave_registry.add_wave(self.wave_fingerprint, self.respondent_keys[self.new_row_mask])
+            return
+        
+        fingerprint = header_fingerprint(self.original_data[:self.data_start_row])
+        respondent_column = find_respondent_column(self.column_mapping)
+        keys = respondent_keys(self.original_data[self.data_start_row:], respondent_column) if persisted else None
+        self.wave_registry.register(fingerprint, document_id, self.column_mapping, self.data_start_row,
+                                    respondent_column, keys)
+    
+    def document_stages(self, document_id, persist=False):
+        """Steps 2-9 for one document as a stage graph (memoized, so prepare then process reuses stages)
+        
+        The metadata query (step 2) runs alongside the content download and parse (step 3).
+        """
+        if self.stages is None or self.stages_for != (document_id, persist):
+            graph = StageGraph(instrument=self.profiler.measure if self.profiler is not None else None)
+            graph.add('document', lambda: self.get_document_from_database(document_id))
+            graph.add('load', lambda: self.load_excel_from_bytes(self.get_document_content(document_id)))
+            graph.add('detect', self.determine_header_rows, after=['load'])
+            graph.add('fill', self.forward_fill_headers, after=['detect'])
+            graph.add('concatenate', self.concatenate_headers, after=['fill'])
+            # Step 7 is skipped when an earlier wave of this survey already has the names. It and step 8
+            # use the wave registry / abbreviation cache, whose sqlite3 connections belong to this thread
+            graph.add('abbreviate', lambda: self.match_previous_wave() or self.generate_abbreviated_names_llm(),
+                      after=['concatenate'], inline=True)
+            graph.add('finish', lambda document: self.finish_document(document_id, document, persist=persist),
+                      inputs=['document'], after=['abbreviate'], inline=True)
+            self.stages, self.stages_for = graph, (document_id, persist)
+        return self.stages
+    
+    def attach_profiler(self, pipeline, profile_dir=None):
+        """Measure every stage from now on; returns the StageProfiler"""
+        self.profiler = StageProfiler(pipeline, profile_dir=profile_dir,
+                                      shape=lambda stage, result: rows_shape(self.original_data))
+        return self.profiler
+    
+    def run_stages(self, document_id, targets, persist=False):
+        """Run the named stages (and what they need) for a document; stage exceptions propagate"""
+        report = self.document_stages(document_id, persist).run(targets, reraise=True)
+        if report['timings']:
+            logger.info(f"Document {document_id} stage timings:")
+            for line in timing_lines(report):
+                logger.info(f"  {line}")
+        return report
+    
+    def prepare_document(self, document_id):
+        """Steps 2-6: fetch, load and build the concatenated headers; returns the document or None"""
+        report = self.run_stages(document_id, ['document', 'concatenate'])
+        return report['results']['document'] if report['success'] else None
+    
+    def process_document(self, document_id, persist=False):
+        """Run steps 2-9 for one document on the already-open connection"""
+        return self.run_stages(document_id, ['finish'], persist=persist)['success']
+    
+    def finish_document(self, document_id, document, persist=False):
+        """Steps 8-9: report the mapping and optionally persist survey_data"""
+        # Step 8: Print results
+        logger.info("=== PIPELINE RESULTS ===")
+        logger.info(f"Document: {document['name']}")
+        logger.info(f"Total rows: {len(self.original_data)}")
+        logger.info(f"Total columns: {len(self.original_data[0]) if self.original_data else 0}")
+        logger.info(f"Header rows: {len(self.header_rows)} (confidence {self.header_confidence:.2f})")
+        logger.info(f"Data start row: {self.data_start_row}")
+        logger.info(f"Concatenated headers: {len(self.concatenated_headers)}")
+        logger.info(f"Column mappings: {len(self.column_mapping)}")
+        
+        # Show sample mappings
+        logger.info("\nSample column mappings:")
+        for i, (col_num, mapping) in enumerate(list(self.column_mapping.items())[:5]):
+            long_name = mapping['longName'][:50] + ('...' if len(mapping['longName']) > 50 else '')
+            logger.info(f"  Column {col_num}: '{long_name}' -> '{mapping['shortName']}'")
+        
+        # Step 9: Persist to survey_data
+        if persist and not self.persist_survey_data(document_id):
+            return False
+        
+        self.record_wave(document_id, persisted=persist)
+        return True
+    
+    def run_complete_pipeline(self, document_id=1, persist=False):
         """Run the complete data wrangling pipeline"""
         try:
             logger.info("Starting complete Python data wrangling pipeline...")
@@ -310,46 +440,10 @@ Return ONLY a JSON object with this exact format:
             if not self.connect_database():
                 return False
             
-            # Step 2: Get document from database
-            document = self.get_document_from_database(document_id)
-            
-            # Step 3: Load Excel data
-            if not self.load_excel_from_base64(document['file_content_base64']):
-                return False
-            
-            # Step 4: Determine header rows
-            if not self.determine_header_rows():
-                return False
-            
-            # Step 5: Forward fill headers
-            if not self.forward_fill_headers():
-                return False
-            
-            # Step 6: Concatenate headers
-            if not self.concatenate_headers():
-                return False
-            
-            # Step 7: Generate abbreviated names
-            if not self.generate_abbreviated_names_llm():
-                return False
-            
-            # Step 8: Print results
-            logger.info("=== PIPELINE RESULTS ===")
-            logger.info(f"Document: {document['name']}")
-            logger.info(f"Total rows: {len(self.original_data)}")
-            logger.info(f"Total columns: {len(self.original_data[0]) if self.original_data else 0}")
-            logger.info(f"Header rows: {len(self.header_rows)}")
-            logger.info(f"Data start row: {self.data_start_row}")
-            logger.info(f"Concatenated headers: {len(self.concatenated_headers)}")
-            logger.info(f"Column mappings: {len(self.column_mapping)}")
-            
-            # Show sample mappings
-            logger.info("\nSample column mappings:")
-            for i, (col_num, mapping) in enumerate(list(self.column_mapping.items())[:5]):
-                long_name = mapping['longName'][:50] + ('...' if len(mapping['longName']) > 50 else '')
-                logger.info(f"  Column {col_num}: '{long_name}' -> '{mapping['shortName']}'")
-            
-            return True
+            success = self.process_document(document_id, persist=persist)
+            # Like the batch worker: keeps what the run wrote, e.g. a backfilled binary copy of the upload
+            self.connection.commit()
+            return success
             
         except Exception as e:
             logger.error(f"Pipeline failed: {e}")
@@ -359,8 +453,253 @@ Return ONLY a JSON object with this exact format:
                 self.connection.close()
                 logger.info("Database connection closed")
 
+# Per-process connection pool, created by _init_batch_worker in each pool process
+_worker_pool = None
+
+def _init_batch_worker(database_url):
+    """Process-pool initializer: open this worker's pooled connection once"""
+    global _worker_pool
+    _worker_pool = ThreadedConnectionPool(1, 1, database_url)
+
+def _process_document_in_worker(document_id, persist=False, use_cache=True, incremental=True, profile_dir=None):
+    """Run one document on the worker's pooled connection and time it (per stage too)"""
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    result = {'document_id': document_id, 'success': False, 'worker_pid': os.getpid()}
+    
+    connection = _worker_pool.getconn()
+    wrangler = None
+    try:
+        wrangler = PythonDataWrangler(use_cache=use_cache, incremental=incremental)
+        wrangler.connection = connection
+        wrangler.attach_profiler(f"document {document_id}",
+                                 os.path.join(profile_dir, f"document_{document_id}") if profile_dir else None)
+        result['success'] = wrangler.process_document(document_id, persist=persist)
+        if wrangler.previous_wave is not None:
+            result['appended_to'] = wrangler.previous_wave['document_id']
+            result['new_respondents'] = int(wrangler.new_row_mask.sum())
+        result['rows'] = len(wrangler.original_data) if wrangler.original_data else 0
+        result['columns'] = len(wrangler.original_data[0]) if wrangler.original_data else 0
+        result['column_mappings'] = len(wrangler.column_mapping)
+        if wrangler.persist_result:
+            result['survey_data'] = wrangler.persist_result
+        connection.commit()
+    except Exception as e:
+        connection.rollback()
+        result['error'] = str(e)
+        logger.error(f"Document {document_id} failed: {e}")
+    finally:
+        _worker_pool.putconn(connection)
+    
+    if wrangler is not None and wrangler.profiler is not None:
+        result['metrics'] = wrangler.profiler.report()
+    
+    result['wall_seconds'] = round(time.perf_counter() - start_wall, 3)
+    result['cpu_seconds'] = round(time.process_time() - start_cpu, 3)
+    return result
+
+def select_document_ids(database_url, status=None):
+    """Ids of source_documents, optionally filtered by processing_status"""
+    connection = psycopg2.connect(database_url)
+    try:
+        cursor = connection.cursor()
+        if status:
+            cursor.execute("SELECT id FROM source_documents WHERE processing_status = %s ORDER BY id", (status,))
+        else:
+            cursor.execute("SELECT id FROM source_documents ORDER BY id")
+        return [row[0] for row in cursor.fetchall()]
+    finally:
+        connection.close()
+
+def run_batch_pipeline(document_ids=None, status=None, max_workers=None, database_url=None, persist=False,
+                       use_cache=True, incremental=True, profile_dir=None):
+    """Run the pipeline over many documents in a process pool, one pooled connection per worker
+
+    Each result carries its document's per-stage metrics; profile_dir adds cProfile dumps per document.
+    """
+    database_url = database_url or os.getenv('DATABASE_URL')
+    
+    if document_ids is None:
+        document_ids = select_document_ids(database_url, status)
+    document_ids = list(document_ids)
+    
+    if not document_ids:
+        logger.info("No documents to process")
+        return {'success': True, 'results': [], 'wall_seconds': 0.0}
+    
+    max_workers = min(max_workers or os.cpu_count() or 1, len(document_ids))
+    logger.info(f"Processing {len(document_ids)} documents with {max_workers} workers")
+    
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_batch_worker,
+                             initargs=(database_url,)) as executor:
+        futures = {executor.submit(_process_document_in_worker, doc_id, persist, use_cache, incremental, profile_dir): doc_id
+                   for doc_id in document_ids}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'document_id': futures[future], 'success': False, 'error': str(e)}
+            results.append(result)
+            logger.info(f"Document {result['document_id']}: {'OK' if result['success'] else 'FAILED'} "
+                        f"in {result.get('wall_seconds', 0):.2f}s")
+    
+    results.sort(key=lambda r: r['document_id'])
+    wall_seconds = time.perf_counter() - start
+    succeeded = sum(1 for r in results if r['success'])
+    
+    logger.info("=== BATCH RESULTS ===")
+    for r in results:
+        logger.info(f"  Document {r['document_id']}: success={r['success']} wall={r.get('wall_seconds', 0):.2f}s "
+                    f"cpu={r.get('cpu_seconds', 0):.2f}s rows={r.get('rows', 0)} cols={r.get('columns', 0)}"
+                    + (f" error={r['error']}" if 'error' in r else ''))
+    logger.info(f"{succeeded}/{len(results)} documents succeeded in {wall_seconds:.2f}s "
+                f"({sum(r.get('wall_seconds', 0) for r in results):.2f}s of document time)")
+    
+    return {'success': succeeded == len(results), 'results': results, 'wall_seconds': round(wall_seconds, 3)}
+
+def bulk_document_key(document_id):
+    """Checkpoint key of a document in the bulk abbreviation job"""
+    return f"doc{document_id}"
+
+def run_bulk_pipeline(document_ids=None, status=None, checkpoint=DEFAULT_BULK_CHECKPOINT, database_url=None,
+                      persist=False, use_cache=True, poll_seconds=DEFAULT_POLL_SECONDS, incremental=True):
+    """Abbreviate many documents through one resumable Message Batches job, then finish each document
+
+    Documents whose header block matches an earlier wave skip the job and reuse its mapping.
+    Documents left uncommitted in the checkpoint by an earlier run are finished too.
+    """
+    database_url = database_url or os.getenv('DATABASE_URL')
+    if document_ids is None:
+        document_ids = select_document_ids(database_url, status)
+    document_ids = list(document_ids)
+    
+    start = time.perf_counter()
+    connection = psycopg2.connect(database_url)
+    results = []
+    try:
+        job = BulkAbbreviationJob(checkpoint, PythonDataWrangler(use_cache=use_cache).build_abbreviator(),
+                                  batch_size=ABBREVIATION_BATCH_SIZE, poll_seconds=poll_seconds)
+        
+        requested = {bulk_document_key(document_id) for document_id in document_ids}
+        carried = [key for key in job.uncommitted if key not in requested]
+        if carried:
+            logger.warning(f"Checkpoint {checkpoint} holds {len(carried)} uncommitted documents from an earlier run "
+                           f"that were not requested ({', '.join(carried)}); finishing them as well")
+            document_ids.extend(int(key[len('doc'):]) for key in carried)
+        
+        # Phase 1: queue every document's headers (skipped for documents already in the checkpoint
+        # and for new waves of surveys already wrangled). The prepared wranglers are kept for Phase 3.
+        prepared = {}
+        incremental_ids = set()
+        for document_id in document_ids:
+            key = bulk_document_key(document_id)
+            if key in job.state['documents']:
+                continue
+            wrangler = PythonDataWrangler(use_cache=False, incremental=incremental)
+            wrangler.connection = connection
+            document = wrangler.prepare_document(document_id)
+            if document is None:
+                results.append({'document_id': document_id, 'success': False, 'error': 'Header preparation failed'})
+                continue
+            if wrangler.match_previous_wave():
+                incremental_ids.add(document_id)
+                prepared[document_id] = (wrangler, document)
+                continue
+            if job.status != STATUS_COLLECTING:
+                logger.warning(f"Document {document_id} is not part of the submitted batch job; run it separately")
+                results.append({'document_id': document_id, 'success': False,
+                                'error': f"Not part of batch job {job.state['batch_id']}; rerun once it has finished"})
+                continue
+            job.add_document(key, wrangler.concatenated_headers)
+            prepared[document_id] = (wrangler, document)
+        
+        # Phase 2: one batch job for all of them
+        names_by_document = job.run()
+        
+        # Phase 3: fan the names back into each document's column_mapping; the checkpoint is
+        # retired only once every document's mapping is committed
+        for document_id in document_ids:
+            key = bulk_document_key(document_id)
+            if key not in names_by_document and document_id not in incremental_ids:
+                if job.state['documents'].get(key, {}).get('committed'):
+                    logger.info(f"Document {document_id} was committed by an earlier run")
+                    results.append({'document_id': document_id, 'success': True, 'committed_earlier': True})
+                continue
+            result = {'document_id': document_id, 'success': False}
+            try:
+                if document_id in prepared:
+                    wrangler, document = prepared.pop(document_id)
+                else:
+                    # Queued by an earlier run that stopped before committing it
+                    wrangler = PythonDataWrangler(use_cache=False, incremental=incremental)
+                    wrangler.connection = connection
+                    document = wrangler.prepare_document(document_id)
+                    if document is None:
+                        raise Exception('Header preparation failed')
+                if document_id in incremental_ids:
+                    result['appended_to'] = wrangler.previous_wave['document_id']
+                    result['new_respondents'] = int(wrangler.new_row_mask.sum())
+                else:
+                    wrangler.set_column_mapping(names_by_document[key]['names'])
+                    result.update({k: v for k, v in names_by_document[key].items() if k != 'names'})
+                result['success'] = wrangler.finish_document(document_id, document, persist=persist)
+                result['column_mappings'] = len(wrangler.column_mapping)
+                if wrangler.persist_result:
+                    result['survey_data'] = wrangler.persist_result
+                connection.commit()
+                if result['success'] and key in names_by_document:
+                    job.mark_committed(key)
+            except Exception as e:
+                connection.rollback()
+                result['error'] = str(e)
+                logger.error(f"Document {document_id} failed: {e}")
+            results.append(result)
+        
+        job.retire()
+    finally:
+        connection.close()
+    
+    results.sort(key=lambda r: r['document_id'])
+    succeeded = sum(1 for r in results if r['success'])
+    logger.info(f"Bulk abbreviation: {succeeded}/{len(results)} documents succeeded "
+                f"in {time.perf_counter() - start:.2f}s (batch {job.state['batch_id']})")
+    return {'success': succeeded == len(results), 'results': results, 'batch_id': job.state['batch_id'],
+            'wall_seconds': round(time.perf_counter() - start, 3)}
+
+def parse_document_ids(values):
+    """Expand CLI id arguments such as ['1', '4-7', '12'] into a list of ints"""
+    document_ids = []
+    for value in values:
+        if '-' in value:
+            first, last = value.split('-', 1)
+            document_ids.extend(range(int(first), int(last) + 1))
+        else:
+            document_ids.append(int(value))
+    return document_ids
+
 def main():
     """Main function to run the pipeline"""
+    parser = argparse.ArgumentParser(description="Python Data Wrangling Pipeline")
+    parser.add_argument('--document-id', type=int, default=1, help="Single document to process")
+    parser.add_argument('--ids', nargs='+', help="Batch mode: document ids and/or ranges, e.g. 3 5-9")
+    parser.add_argument('--status', help="Batch mode: every document with this processing_status")
+    parser.add_argument('--workers', type=int, default=None, help="Batch mode: worker processes (default: CPU count)")
+    parser.add_argument('--persist', action='store_true', help="Bulk-write wrangled rows into survey_data (COPY)")
+    parser.add_argument('--no-cache', action='store_true', help="Bypass the header-abbreviation cache")
+    parser.add_argument('--bulk', action='store_true',
+                        help="Batch mode: abbreviate all selected documents through one Message Batches job")
+    parser.add_argument('--checkpoint', default=DEFAULT_BULK_CHECKPOINT, help="Bulk mode: resumable checkpoint file")
+    parser.add_argument('--poll-seconds', type=float, default=DEFAULT_POLL_SECONDS, help="Bulk mode: status poll interval")
+    parser.add_argument('--report', help="Batch mode: write per-document results to this JSON file")
+    parser.add_argument('--no-incremental', action='store_true',
+                        help="Re-wrangle fully even when an earlier wave of the same survey was processed")
+    parser.add_argument('--metrics', default='python_pipeline_metrics.json', help="Per-stage metrics report (JSON)")
+    parser.add_argument('--profile', nargs='?', const=DEFAULT_PROFILE_DIR,
+                        help="Dump a cProfile per stage into this directory and trace memory peaks")
+    args = parser.parse_args()
+    
     logger.info("Starting Python Data Wrangling Pipeline Debug")
     
     # Check environment variables
@@ -372,9 +711,33 @@ def main():
         logger.error("ANTHROPIC_API_KEY environment variable not set")
         return False
     
-    # Create wrangler and run pipeline
-    wrangler = PythonDataWrangler()
-    success = wrangler.run_complete_pipeline(document_id=1)
+    if args.ids or args.status:
+        document_ids = parse_document_ids(args.ids) if args.ids else None
+        if args.bulk:
+            batch = run_bulk_pipeline(document_ids=document_ids, status=args.status, checkpoint=args.checkpoint,
+                                      persist=args.persist, use_cache=not args.no_cache, poll_seconds=args.poll_seconds,
+                                      incremental=not args.no_incremental)
+        else:
+            batch = run_batch_pipeline(document_ids=document_ids, status=args.status, max_workers=args.workers,
+                                       persist=args.persist, use_cache=not args.no_cache,
+                                       incremental=not args.no_incremental, profile_dir=args.profile)
+            with open(args.metrics, 'w', encoding='utf-8') as f:
+                json.dump({'pipeline': 'python_pipeline', 'wall_seconds': batch['wall_seconds'],
+                           'documents': {r['document_id']: r.get('metrics') for r in batch['results']}}, f, indent=2)
+            logger.info(f"Stage metrics saved to {args.metrics}")
+        if args.report:
+            with open(args.report, 'w', encoding='utf-8') as f:
+                json.dump(batch, f, indent=2)
+            logger.info(f"Batch report saved to {args.report}")
+        success = batch['success']
+    else:
+        # Create wrangler and run pipeline
+        wrangler = PythonDataWrangler(use_cache=not args.no_cache, incremental=not args.no_incremental)
+        profiler = wrangler.attach_profiler('python_pipeline', args.profile)
+        try:
+            success = wrangler.run_complete_pipeline(document_id=args.document_id, persist=args.persist)
+        finally:
+            profiler.write(args.metrics, document_id=args.document_id, scheduler=get_scheduler().summary())
     
     if success:
         logger.info("✅ Python pipeline completed successfully!")
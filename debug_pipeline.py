@@ -4,6 +4,7 @@ Local Python Data Wrangling Pipeline Debugger
 Replicates the JavaScript pipeline for easier debugging
 """
 
+import argparse
 import pandas as pd
 import json
 import sys
@@ -12,12 +13,72 @@ from pathlib import Path
 import anthropic
 from dotenv import load_dotenv
 
+from cell_normalization import to_rows
+from prompt_caching import usage_stats
+from request_scheduler import PRIORITY_ANALYSIS, estimate_tokens, get_scheduler
+from stage_graph import StageGraph, timing_lines
+from stage_metrics import DEFAULT_PROFILE_DIR, StageProfiler, rows_shape
+from workbook_cache import WorkbookCache, load_sheet
+
 # Load environment variables
 load_dotenv()
 
+# Static part of the analysis prompt: sent as the system block, the data sample follows per file
+ANALYSIS_INSTRUCTIONS = """# Generic Survey Data Structure Analysis
+
+You are an expert data analyst. Analyze the tabular data in the user message and determine how to clean it into a proper survey format.
+
+## Your Task:
+1. Identify which rows contain question headers vs actual response data
+2. Determine if headers span multiple rows and need combining
+3. Detect any matrix questions that should be split into separate columns
+4. Create a plan to extract clean, concise question headers
+5. Ensure all response data is preserved
+
+## Required JSON Response Format:
+{
+  "success": true,
+  "analysis": {
+    "structure_type": "<describe what you see>",
+    "question_rows": [<array of row indices containing headers>],
+    "data_start_row": <first row with actual responses>,
+    "header_issues": ["<list of problems found>"],
+    "recommended_approach": "<your strategy>"
+  },
+  "wrangling_plan": {
+    "step_1": {
+      "action": "<action_name>",
+      "description": "<what this step does>",
+      "target_rows": [<affected rows>]
+    },
+    "step_2": {
+      "action": "<action_name>",
+      "description": "<what this step does>"
+    }
+  }
+}"""
+
+
 class DataWranglingDebugger:
-    def __init__(self):
-        self.client = anthropic.Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY'))
+    def __init__(self, use_cache=True):
+        # Retries and rate limiting are handled by the shared request scheduler
+        self.client = anthropic.Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY'), max_retries=0)
+        self.cache = WorkbookCache() if use_cache else None
+    
+    def stage_graph(self, file_path, instrument=None):
+        """Steps 1-5 as a stage graph: the structure stats and the LLM analysis both only need the raw data
+        
+        Every step runs even when an earlier one reports failure (the later steps
+        report it in turn), as in the original sequential run; only an exception stops it.
+        """
+        graph = StageGraph(instrument=instrument)
+        graph.add('step_1', lambda: self.step_1_load_file(file_path), check=None)
+        graph.add('step_2', lambda loaded: self.step_2_analyze_structure(loaded['raw_data']), inputs=['step_1'], check=None)
+        graph.add('step_3', lambda loaded: self.step_3_llm_analysis(loaded['raw_data']), inputs=['step_1'], check=None)
+        graph.add('step_4', lambda loaded, analysis: self.step_4_apply_wrangling(loaded['raw_data'], analysis),
+                  inputs=['step_1', 'step_3'], check=None)
+        graph.add('step_5', self.step_5_validate_output, inputs=['step_4'], check=None)
+        return graph
         
     def step_1_load_file(self, file_path):
         """Step 1: Load and examine raw file structure"""
@@ -28,9 +89,9 @@ class DataWranglingDebugger:
             
         # Load Excel file preserving structure
         if file_path.endswith(('.xlsx', '.xls')):
-            # Read as raw data preserving empty cells
-            df_raw = pd.read_excel(file_path, header=None, engine='openpyxl')
-            raw_data = df_raw.fillna('').values.tolist()
+            # Read as raw data preserving empty cells (parsed grid is cached by content hash)
+            headers, data = load_sheet(file_path, cache=self.cache)
+            raw_data = to_rows(headers, data)
         elif file_path.endswith('.csv'):
             df_raw = pd.read_csv(file_path, header=None, encoding='utf-8')
             raw_data = df_raw.fillna('').values.tolist()
@@ -94,21 +155,31 @@ class DataWranglingDebugger:
         data_sample = [row[:20] for row in raw_data[:5]]
         
         prompt = self._build_analysis_prompt(data_sample)
-        print(f"[INFO] Prompt length: {len(prompt)} characters")
+        print(f"[INFO] Prompt length: {len(ANALYSIS_INSTRUCTIONS) + len(prompt)} characters "
+              f"({len(ANALYSIS_INSTRUCTIONS)} static instructions)")
         
         try:
-            response = self.client.messages.create(
-                model='claude-opus-4-1-20250805',
-                max_tokens=4000,
-                temperature=0.2,
-                messages=[{
-                    'role': 'user',
-                    'content': prompt
-                }]
+            response = get_scheduler().call(
+                lambda: self.client.messages.create(
+                    model='claude-opus-4-1-20250805',
+                    max_tokens=4000,
+                    temperature=0.2,
+                    system=ANALYSIS_INSTRUCTIONS,
+                    messages=[{
+                        'role': 'user',
+                        'content': prompt
+                    }]
+                ),
+                priority=PRIORITY_ANALYSIS,
+                tokens=estimate_tokens(ANALYSIS_INSTRUCTIONS + prompt),
+                label='Structure analysis'
             )
             
             response_text = response.content[0].text
+            usage = usage_stats(response)
             print(f"[OK] LLM response received: {len(response_text)} characters")
+            print(f"[INFO] Input tokens: {usage.get('input_tokens')} uncached, "
+                  f"{usage.get('cache_read_input_tokens')} read from cache")
             
             # Try to extract JSON
             try:
@@ -128,7 +199,8 @@ class DataWranglingDebugger:
                 print("[OK] Successfully parsed LLM analysis")
                 
                 result = {
-                    'prompt_sent': prompt,
+                    'prompt_sent': ANALYSIS_INSTRUCTIONS + "\n\n" + prompt,
+                    'usage': usage,
                     'raw_response': response_text,
                     'parsed_analysis': analysis,
                     'success': True
@@ -146,7 +218,8 @@ class DataWranglingDebugger:
                 print(f"[ERROR] Failed to parse LLM response as JSON: {e}")
                 print(f"Raw response: {response_text[:500]}...")
                 return {
-                    'prompt_sent': prompt,
+                    'prompt_sent': ANALYSIS_INSTRUCTIONS + "\n\n" + prompt,
+                    'usage': usage,
                     'raw_response': response_text,
                     'parsed_analysis': None,
                     'success': False,
@@ -282,88 +355,55 @@ class DataWranglingDebugger:
         return validation
     
     def _build_analysis_prompt(self, data_sample):
-        """Build the generic data analysis prompt"""
+        """Build the per-file part of the analysis prompt (the task is ANALYSIS_INSTRUCTIONS)"""
         sample_text = ""
         for i, row in enumerate(data_sample):
             sample_text += f"Row {i}: [{', '.join(f'\"{cell}\"' for cell in row)}]\n"
         
-        return f"""# Generic Survey Data Structure Analysis
-
-You are an expert data analyst. Analyze this tabular data and determine how to clean it into a proper survey format.
-
-## Data Sample (first 5 rows, up to 20 columns):
+        return f"""## Data Sample (first 5 rows, up to 20 columns):
 {sample_text}
-
-## Your Task:
-1. Identify which rows contain question headers vs actual response data
-2. Determine if headers span multiple rows and need combining
-3. Detect any matrix questions that should be split into separate columns
-4. Create a plan to extract clean, concise question headers
-5. Ensure all response data is preserved
-
-## Required JSON Response Format:
-{{
-  "success": true,
-  "analysis": {{
-    "structure_type": "<describe what you see>",
-    "question_rows": [<array of row indices containing headers>],
-    "data_start_row": <first row with actual responses>,
-    "header_issues": ["<list of problems found>"],
-    "recommended_approach": "<your strategy>"
-  }},
-  "wrangling_plan": {{
-    "step_1": {{
-      "action": "<action_name>",
-      "description": "<what this step does>",
-      "target_rows": [<affected rows>]
-    }},
-    "step_2": {{
-      "action": "<action_name>",
-      "description": "<what this step does>"
-    }}
-  }}
-}}
-
 Analyze the structure and provide a generic cleaning approach that would work for similar datasets."""
 
 def main():
     """Main function to run the pipeline"""
-    if len(sys.argv) != 2:
-        print("Usage: python debug_pipeline.py <file_path>")
-        print("Example: python debug_pipeline.py 'C:\\\\code\\\\digital-twins\\\\data\\\\datasets\\\\mums\\\\Detail_Parents Survey.xlsx'")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(
+        description="Local Python Data Wrangling Pipeline Debugger",
+        epilog="Example: python debug_pipeline.py 'C:\\\\code\\\\digital-twins\\\\data\\\\datasets\\\\mums\\\\Detail_Parents Survey.xlsx'"
+    )
+    parser.add_argument('file_path', help="Excel or CSV file to debug")
+    parser.add_argument('--no-cache', action='store_true', help="Bypass the parsed-workbook cache and re-parse the Excel file")
+    parser.add_argument('--metrics', default='debug_pipeline_metrics.json', help="Per-stage metrics report (JSON)")
+    parser.add_argument('--profile', nargs='?', const=DEFAULT_PROFILE_DIR,
+                        help="Dump a cProfile per stage into this directory and trace memory peaks")
+    args = parser.parse_args()
     
-    file_path = sys.argv[1]
+    file_path = args.file_path
     
     try:
-        debugger = DataWranglingDebugger()
-        
-        # Step 1: Load file
-        step1_result = debugger.step_1_load_file(file_path)
-        
-        # Step 2: Analyze structure  
-        step2_result = debugger.step_2_analyze_structure(step1_result['raw_data'])
+        debugger = DataWranglingDebugger(use_cache=not args.no_cache)
         
-        # Step 3: LLM analysis
-        step3_result = debugger.step_3_llm_analysis(step1_result['raw_data'])
+        # Steps 1-5: load, then structure stats alongside the LLM analysis, then wrangle and validate
+        def loaded_shape(stage, result):
+            # Every step works on the loaded raw data, so that is the shape recorded for each
+            loaded = result if stage == 'step_1' else graph.results.get('step_1')
+            return rows_shape(loaded['raw_data'] if loaded else None)
         
-        # Step 4: Apply wrangling
-        step4_result = debugger.step_4_apply_wrangling(step1_result['raw_data'], step3_result)
-        
-        # Step 5: Validate output
-        step5_result = debugger.step_5_validate_output(step4_result)
+        profiler = StageProfiler('debug_pipeline', profile_dir=args.profile, shape=loaded_shape)
+        graph = debugger.stage_graph(file_path, instrument=profiler.measure)
+        try:
+            report = graph.run(reraise=True)
+        finally:
+            profiler.write(args.metrics, input_file=file_path, scheduler=get_scheduler().summary())
         
         print(f"\n[COMPLETE] Pipeline completed!")
         print(f"Results saved in variables for inspection")
+        print("\n[INFO] Stage timings:")
+        for line in timing_lines(report):
+            print(f"  {line}")
         
         # Save results to JSON for inspection
-        results = {
-            'step_1': step1_result,
-            'step_2': step2_result, 
-            'step_3': step3_result,
-            'step_4': step4_result,
-            'step_5': step5_result
-        }
+        results = dict(report['results'])
+        results['stage_timings'] = report['timings']
         
         # Remove raw_data from saved results to keep file size manageable
         if 'raw_data' in results['step_1']:
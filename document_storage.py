@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Binary Document Storage for source_documents
+1. Documents are stored as bytea, gzip-compressed when that actually saves space
+2. Metadata lookups never select the file payload
+3. Content is fetched as bytes and handed to the loader as a BytesIO, with no base64 step
+4. The JavaScript upload path still writes base64: fetch_document_content()
+   converts such a row the first time it reads it (the caller's commit keeps
+   it), and migrate_source_documents() converts all of them in bulk
+Whether the binary columns exist is looked up once per database in
+information_schema, so a read never has to fail and roll back to find out.
+"""
+
+import argparse
+import base64
+import gzip
+import io
+import logging
+import os
+import sys
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import psycopg2
+from dotenv import load_dotenv
+from psycopg2 import Binary
+from psycopg2.extras import RealDictCursor
+
+logger = logging.getLogger(__name__)
+
+ENCODING_GZIP = 'gzip'
+ENCODING_IDENTITY = 'identity'
+
+# Only keep the gzip form when it is at least this much smaller (xlsx files are already zipped)
+MIN_COMPRESSION_SAVING = 0.05
+
+MIGRATION_SQL = Path(__file__).resolve().parent / 'database' / 'binary-document-storage.sql'
+
+BACKFILL_SAVEPOINT = 'backfill_document_content'
+
+# connection.dsn -> whether source_documents has the binary columns
+_binary_columns: Dict[str, bool] = {}
+
+METADATA_COLUMNS = """
+    id, name, original_filename, file_type, file_size, processing_status,
+    target_demographic, description
+"""
+
+
+def compress_document(file_bytes: bytes, level: int = 6) -> Dict[str, Any]:
+    """Return the stored form of a file: gzip when it saves space, raw bytes otherwise"""
+    compressed = gzip.compress(file_bytes, compresslevel=level)
+    if len(compressed) <= len(file_bytes) * (1 - MIN_COMPRESSION_SAVING):
+        return {'content': compressed, 'encoding': ENCODING_GZIP}
+    return {'content': file_bytes, 'encoding': ENCODING_IDENTITY}
+
+
+def decompress_document(content, encoding: Optional[str]) -> io.BytesIO:
+    """Wrap stored content (bytes or the memoryview psycopg2 returns for bytea) as a file object"""
+    view = memoryview(content)
+    if encoding == ENCODING_GZIP:
+        return io.BytesIO(gzip.decompress(view))
+    return io.BytesIO(view)
+
+
+def fetch_document_metadata(connection, document_id: int) -> Dict[str, Any]:
+    """Document metadata only; the file payload is never transferred"""
+    cursor = connection.cursor(cursor_factory=RealDictCursor)
+    try:
+        cursor.execute(f"SELECT {METADATA_COLUMNS} FROM source_documents WHERE id = %s", (document_id,))
+        document = cursor.fetchone()
+        if not document:
+            raise Exception(f"Document with ID {document_id} not found")
+        return dict(document)
+    finally:
+        cursor.close()
+
+
+def has_binary_columns(connection) -> bool:
+    """Whether binary-document-storage.sql has been applied (looked up once per database)"""
+    if connection.dsn not in _binary_columns:
+        cursor = connection.cursor()
+        try:
+            cursor.execute(
+                """
+                SELECT 1 FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = 'source_documents'
+                  AND column_name = 'file_content'
+                """
+            )
+            _binary_columns[connection.dsn] = cursor.fetchone() is not None
+        finally:
+            cursor.close()
+    return _binary_columns[connection.dsn]
+
+
+def fetch_document_content(connection, document_id: int) -> io.BytesIO:
+    """File payload as a BytesIO, falling back to the legacy base64 column for unmigrated rows
+
+    A base64 row is converted to binary storage on the way (see backfill_document_content).
+    """
+    binary = has_binary_columns(connection)
+    cursor = connection.cursor()
+    try:
+        if binary:
+            cursor.execute(
+                "SELECT file_content, file_content_encoding FROM source_documents WHERE id = %s",
+                (document_id,)
+            )
+            row = cursor.fetchone()
+            if not row:
+                raise Exception(f"Document with ID {document_id} not found")
+            content, encoding = row
+            if content is not None:
+                return decompress_document(content, encoding)
+            logger.warning(f"Document {document_id} has no binary content yet, reading legacy base64 column")
+
+        cursor.execute("SELECT file_content_base64 FROM source_documents WHERE id = %s", (document_id,))
+        row = cursor.fetchone()
+        if not row or not row[0]:
+            raise Exception(f"Document with ID {document_id} has no file content")
+        file_bytes = base64.b64decode(row[0])
+    finally:
+        cursor.close()
+
+    if binary:
+        backfill_document_content(connection, document_id, file_bytes)
+    return io.BytesIO(file_bytes)
+
+
+def backfill_document_content(connection, document_id: int, file_bytes: bytes) -> Optional[Dict[str, Any]]:
+    """Store a base64-only document's binary content in the caller's transaction
+
+    The write runs in a savepoint, so if it fails only the backfill is undone;
+    the document is still served and the caller's transaction stays usable.
+    """
+    if connection.autocommit:
+        return store_document_content(connection, document_id, file_bytes)
+
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"SAVEPOINT {BACKFILL_SAVEPOINT}")
+        try:
+            result = store_document_content(connection, document_id, file_bytes)
+        except psycopg2.Error as e:
+            cursor.execute(f"ROLLBACK TO SAVEPOINT {BACKFILL_SAVEPOINT}")
+            logger.warning(f"Could not store binary content of document {document_id}: {e}")
+            return None
+        cursor.execute(f"RELEASE SAVEPOINT {BACKFILL_SAVEPOINT}")
+    finally:
+        cursor.close()
+
+    logger.info(f"Stored binary content of document {document_id}: {result['stored_size']} bytes ({result['encoding']})")
+    return result
+
+
+def store_document_content(connection, document_id: int, file_bytes: bytes, clear_base64: bool = False) -> Dict[str, Any]:
+    """Write a document's binary content (caller commits)"""
+    stored = compress_document(file_bytes)
+
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            f"""
+            UPDATE source_documents
+            SET file_content = %s, file_content_encoding = %s, file_content_size = %s
+                {', file_content_base64 = NULL' if clear_base64 else ''}
+            WHERE id = %s
+            """,
+            (Binary(stored['content']), stored['encoding'], len(stored['content']), document_id)
+        )
+    finally:
+        cursor.close()
+
+    return {'document_id': document_id, 'encoding': stored['encoding'],
+            'original_size': len(file_bytes), 'stored_size': len(stored['content'])}
+
+
+def ensure_binary_columns(connection):
+    """Apply database/binary-document-storage.sql (idempotent)"""
+    cursor = connection.cursor()
+    try:
+        cursor.execute(MIGRATION_SQL.read_text(encoding='utf-8'))
+        connection.commit()
+    finally:
+        cursor.close()
+    _binary_columns[connection.dsn] = True
+
+
+def migrate_source_documents(connection, batch_size: int = 20, clear_base64: bool = False) -> Dict[str, Any]:
+    """Move legacy base64 rows to binary storage, one committed batch at a time
+
+    The base64 column is kept by default because the JavaScript API still reads it.
+    """
+    ensure_binary_columns(connection)
+
+    migrated = []
+    while True:
+        cursor = connection.cursor()
+        try:
+            cursor.execute(
+                """
+                SELECT id, file_content_base64 FROM source_documents
+                WHERE file_content IS NULL AND file_content_base64 IS NOT NULL
+                ORDER BY id LIMIT %s
+                """,
+                (batch_size,)
+            )
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+
+        if not rows:
+            break
+
+        for document_id, content_base64 in rows:
+            result = store_document_content(connection, document_id, base64.b64decode(content_base64), clear_base64)
+            migrated.append(result)
+            logger.info(f"Migrated document {document_id}: {len(content_base64)} base64 chars -> "
+                        f"{result['stored_size']} bytes ({result['encoding']})")
+        connection.commit()
+
+    base64_bytes = sum((r['original_size'] + 2) // 3 * 4 for r in migrated)
+    stored_bytes = sum(r['stored_size'] for r in migrated)
+    logger.info(f"Migrated {len(migrated)} documents: {base64_bytes} base64 bytes -> {stored_bytes} stored bytes")
+
+    return {'success': True, 'migrated': len(migrated), 'base64_bytes': base64_bytes, 'stored_bytes': stored_bytes}
+
+
+def main():
+    """Migrate existing source_documents rows to binary storage"""
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="Migrate source_documents from base64 TEXT to binary storage")
+    parser.add_argument('--batch-size', type=int, default=20, help="Documents per committed batch")
+    parser.add_argument('--clear-base64', action='store_true',
+                        help="Drop the base64 copy after migrating (only once nothing reads file_content_base64)")
+    args = parser.parse_args()
+
+    if not os.getenv('DATABASE_URL'):
+        logger.error("DATABASE_URL environment variable not set")
+        return False
+
+    connection = psycopg2.connect(os.getenv('DATABASE_URL'))
+    try:
+        result = migrate_source_documents(connection, batch_size=args.batch_size, clear_base64=args.clear_base64)
+    finally:
+        connection.close()
+
+    print(f"Migrated {result['migrated']} documents")
+    return result['success']
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
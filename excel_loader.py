@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Streaming Excel Loader
+Reads worksheets with openpyxl's read-only / values-only mode so rows arrive
+as a generator instead of a fully materialised grid.
+1. head(n) buffers only the first n rows for header sniffing
+2. rows(start) replays the buffered head and then streams the remaining body
+"""
+
+import io
+import logging
+from typing import Any, Iterator, List, Tuple, Union
+
+from openpyxl import load_workbook
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SNIFF_ROWS = 10
+
+
+class SheetStream:
+    """Single-pass row stream over one worksheet of an .xlsx workbook"""
+
+    def __init__(self, source: Union[str, bytes, io.IOBase], sheet: Union[int, str] = 0):
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = io.BytesIO(source)
+
+        self.workbook = load_workbook(source, read_only=True, data_only=True)
+        self.worksheet = self.workbook.worksheets[sheet] if isinstance(sheet, int) else self.workbook[sheet]
+        self.max_row = self.worksheet.max_row
+        self.max_column = self.worksheet.max_column
+
+        self._row_iter = self.worksheet.iter_rows(values_only=True)
+        self._buffer: List[Tuple[Any, ...]] = []
+        self._streaming = False
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        """Release the workbook's file handle"""
+        if not self._closed:
+            self.workbook.close()
+            self._closed = True
+
+    def _pad(self, row: Tuple[Any, ...]) -> Tuple[Any, ...]:
+        """Read-only rows can be ragged; pad them to the sheet width"""
+        if self.max_column and len(row) < self.max_column:
+            return row + (None,) * (self.max_column - len(row))
+        return row
+
+    def head(self, n: int = DEFAULT_SNIFF_ROWS) -> List[Tuple[Any, ...]]:
+        """Return the first n rows, reading only as far as needed"""
+        if self._streaming:
+            raise RuntimeError("head() cannot be called once the body is streaming")
+
+        while len(self._buffer) < n:
+            try:
+                self._buffer.append(self._pad(next(self._row_iter)))
+            except StopIteration:
+                break
+
+        return self._buffer[:n]
+
+    def rows(self, start: int = 0) -> Iterator[Tuple[Any, ...]]:
+        """Yield rows from index start onward; the stream can only be consumed once"""
+        if self._streaming:
+            raise RuntimeError("Sheet body has already been streamed")
+        # Set here rather than in the generator, so head() is refused as soon as rows() is called
+        self._streaming = True
+        return self._stream_rows(start)
+
+    def _stream_rows(self, start: int) -> Iterator[Tuple[Any, ...]]:
+        try:
+            for row_idx, row in enumerate(self._buffer):
+                if row_idx >= start:
+                    yield row
+
+            row_idx = len(self._buffer)
+            self._buffer = []
+            for row in self._row_iter:
+                if row_idx >= start:
+                    yield self._pad(row)
+                row_idx += 1
+        finally:
+            self.close()
+
+
+def open_sheet(source: Union[str, bytes, io.IOBase], sheet: Union[int, str] = 0) -> SheetStream:
+    """Open a worksheet for streaming"""
+    logger.info(f"Opening worksheet {sheet!r} in read-only streaming mode")
+    return SheetStream(source, sheet)
+
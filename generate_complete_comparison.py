@@ -4,25 +4,22 @@ Generate complete column comparison for all 253 columns
 Shows LLM result vs forward-fill approach for every column
 """
 
+import argparse
 import pandas as pd
 import numpy as np
 
-def create_complete_comparison():
+from cell_normalization import stringify_rows
+from workbook_cache import WorkbookCache, load_sheet
+
+def create_complete_comparison(use_cache=True):
     """Create a complete comparison table for all 253 columns"""
     
     print("Loading actual Excel data...")
-    df = pd.read_excel('data/datasets/mums/Detail_Parents Survey.xlsx', header=None)
+    cache = WorkbookCache() if use_cache else None
+    headers, body = load_sheet('data/datasets/mums/Detail_Parents Survey.xlsx', cache=cache)
     
     # Convert to string and handle NaN
-    data = []
-    for _, row in df.iterrows():
-        row_data = []
-        for cell in row:
-            if pd.isna(cell):
-                row_data.append('')
-            else:
-                row_data.append(str(cell))
-        data.append(row_data)
+    data = headers + stringify_rows(body)
     
     print(f"Loaded data: {len(data)} rows x {len(data[0])} columns")
     
@@ -121,4 +118,8 @@ def create_complete_comparison():
     print(f"- Empty Original Row 1: {empty_original_1}")
 
 if __name__ == "__main__":
-    create_complete_comparison()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate complete column comparison")
+    parser.add_argument('--no-cache', action='store_true', help="Bypass the parsed-workbook cache and re-parse the Excel file")
+    args = parser.parse_args()
+    
+    create_complete_comparison(use_cache=not args.no_cache)
\ No newline at end of file
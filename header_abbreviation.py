@@ -0,0 +1,495 @@
+#!/usr/bin/env python3
+"""
+Concurrent LLM Header Abbreviation
+Sends batches of concatenated headers to Claude in parallel (bounded by a
+concurrency limit) and reassembles the short names in column order.
+1. Each batch is one messages.create call on an AsyncAnthropic client
+2. Results are keyed by column index, so completion order does not matter
+3. Batches are packed up to a token budget; a failed batch is split in half and
+   the halves retried, and columns a reply left out are re-requested on their own.
+   Only what is still missing after that falls back to col_N
+4. Short, plain headers ("Respondent ID", "Email Address") are snake_cased
+   locally and never reach the model
+5. With an AbbreviationCache, only longNames the cache has not seen are sent
+6. Columns sharing a question stem (matrix questions) are batched together and
+   the stem is written once, followed by the numbered sub-labels
+7. The static rules, naming conventions and a worked example go in the system
+   prompt and the headers come last, so every batch shares a cached prefix
+Requests go through the shared RequestScheduler (abbreviation priority).
+The client honours ANTHROPIC_BASE_URL (or base_url=...), so a local stub
+server can stand in for the API.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import time
+from collections import Counter
+from itertools import groupby
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from anthropic import AsyncAnthropic
+
+from abbreviation_cache import AbbreviationCache, cache_keys
+from header_block import HEADER_SEPARATOR
+from prompt_caching import cached_system, usage_stats
+from request_scheduler import PRIORITY_ABBREVIATION, RequestScheduler, estimate_tokens, get_scheduler
+
+logger = logging.getLogger(__name__)
+
+ABBREVIATION_MODEL = "claude-opus-4-1-20250805"
+# Column cap per batch (bounds the reply size); the token budget usually decides first
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_CONCURRENCY = 4
+DEFAULT_MAX_LENGTH = 30
+
+# Estimated tokens of header listing per batch (the fixed instructions come on top)
+DEFAULT_MAX_BATCH_TOKENS = 700
+# How many times a failed batch may be halved (or its missing columns re-requested)
+DEFAULT_MAX_SPLIT_DEPTH = 3
+
+# Local fast path: a header is abbreviated without the model when it is a single
+# segment (after dropping a generic SurveyMonkey sub-label) of at most this many words
+MAX_LOCAL_WORDS = 4
+GENERIC_SUB_LABELS = {'response', 'open-ended response'}
+
+# A batch is a list of (column number, concatenated header) pairs
+Batch = List[Tuple[int, str]]
+PromptBuilder = Callable[[Batch], str]
+ResponseParser = Callable[[str, Batch], Dict[int, str]]
+BatchCallback = Callable[[Dict[int, str]], None]
+
+
+def split_stem(header: str) -> Tuple[Optional[str], str]:
+    """'Stem | Sub-label' -> ('Stem', 'Sub-label'); single-segment headers have no stem"""
+    if HEADER_SEPARATOR not in header:
+        return None, header
+    stem, label = header.rsplit(HEADER_SEPARATOR, 1)
+    return stem, label
+
+
+def group_by_stem(entries: Batch) -> List[Batch]:
+    """Runs of consecutive columns that share a question stem"""
+    return [list(group) for _, group in groupby(entries, key=lambda entry: split_stem(entry[1])[0])]
+
+
+def pack_batches(entries: Batch, batch_size: int, max_tokens: Optional[int] = None) -> List[Batch]:
+    """Batches of at most batch_size columns and about max_tokens of listing each,
+    keeping stem groups together where they fit"""
+    batches: List[Batch] = []
+    current: Batch = []
+    current_tokens = 0
+
+    def over_budget(columns: int, tokens: int) -> bool:
+        return columns > batch_size or (max_tokens is not None and tokens > max_tokens)
+
+    for group in group_by_stem(entries):
+        stem = split_stem(group[0][1])[0] if len(group) > 1 else None
+        stem_tokens = estimate_tokens(f"Question: {stem}") if stem else 0
+        costs = [estimate_tokens(f"{col_idx}: {split_stem(header)[1] if stem else header}") for col_idx, header in group]
+
+        # Start a fresh batch rather than split a group that would fit in one
+        if current and over_budget(len(current) + len(group), current_tokens + stem_tokens + sum(costs)):
+            batches.append(current)
+            current, current_tokens = [], 0
+
+        stem_written = False
+        for entry, cost in zip(group, costs):
+            extra = cost if stem_written else cost + stem_tokens
+            if current and over_budget(len(current) + 1, current_tokens + extra):
+                batches.append(current)
+                current, current_tokens = [], 0
+                extra = cost + stem_tokens
+            current.append(entry)
+            current_tokens += extra
+            stem_written = True
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+def format_header_list(batch: Batch, line_format: str = "{col_idx}: {header}") -> str:
+    """Numbered header lines, with each shared stem written once above its sub-labels"""
+    lines = []
+    for group in group_by_stem(batch):
+        stem = split_stem(group[0][1])[0]
+        if stem is None or len(group) == 1:
+            lines.extend(line_format.format(col_idx=col_idx, header=header) for col_idx, header in group)
+        else:
+            lines.append(f"Question: {stem}")
+            lines.extend("  " + line_format.format(col_idx=col_idx, header=split_stem(header)[1])
+                         for col_idx, header in group)
+    return "\n".join(lines)
+
+
+# Shared by every abbreviation prompt: naming conventions plus one worked example
+# (rendered in each prompt's own request/reply format). Together with the rules
+# they make the system block long enough to be cached (see prompt_caching), so
+# every batch after the first reads the prefix from the cache.
+NAMING_CONVENTIONS = """Naming conventions:
+- Start from the words that distinguish the column, not from the question wording ("How satisfied are you with..." is implied by a sat_ prefix)
+- Rating and satisfaction matrices: sat_<aspect> (e.g. sat_staff_friendly); agreement scales: agree_<statement>; importance: imp_<aspect>
+- Net Promoter ("How likely is it that you would recommend...") is nps_score; its follow-up "reason for your score" is nps_reason
+- Multiple-choice "select all that apply" questions: one column per option, named <topic>_<option> (e.g. bought_laptop)
+- "Other (please specify)" options become <topic>_other, and their free-text column <topic>_other_text
+- "Open-Ended Response" and "Response" sub-labels carry no meaning: name the column after its question
+- Ranking questions: rank_<item>
+- Demographics use the plain noun: age, gender, region, income, education, job_role
+- Keep quantities and time frames that tell columns apart, in short form: 12m for "in the last 12 months", 6m, per_month
+- Drop articles, "please", "currently", "approximately" and other filler words
+- Abbreviate only where the short form stays obvious (sat, imp, freq, num, pct, mgmt, dept); otherwise keep the whole word
+- Never start a name with a digit; prefix q_ instead (q_2023_spend)
+- Follow-ups that only make sense after the previous question ("If yes, ...") borrow its topic (support_resolved_sat)
+- When the same sub-label appears under several questions, put the question's topic first so the names differ
+- Give every column in the request its own name, even when two headers read the same"""
+
+EXAMPLE_BATCH: Batch = [
+    (3, 'How satisfied are you with each of the following? | Speed of service'),
+    (4, 'How satisfied are you with each of the following? | Staff friendliness'),
+    (5, 'How satisfied are you with each of the following? | Value for money'),
+    (6, 'How satisfied are you with each of the following? | Cleanliness of the store'),
+    (7, 'How likely is it that you would recommend our company to a friend or colleague?'),
+    (8, 'What is the main reason for your score? | Open-Ended Response'),
+    (9, 'Which of the following products have you purchased in the last 12 months? | Laptop'),
+    (10, 'Which of the following products have you purchased in the last 12 months? | Tablet'),
+    (11, 'Which of the following products have you purchased in the last 12 months? | Other (please specify)'),
+    (12, 'Please rank the following features in order of importance to you (1 = most important) | Battery life'),
+    (13, 'Please rank the following features in order of importance to you (1 = most important) | Screen quality'),
+    (14, 'Please rank the following features in order of importance to you (1 = most important) | Price'),
+    (15, 'Approximately how many times per month do you visit our website or mobile app?'),
+    (16, 'Did you contact our customer support team in the last 6 months?'),
+    (17, 'If yes, how satisfied were you with how your issue was resolved?'),
+    (18, 'In which region do you currently live?'),
+    (19, 'Is there anything else you would like to tell us about your experience? | Open-Ended Response'),
+    (20, 'To what extent do you agree or disagree with the following statements? | The checkout process was easy'),
+    (21, 'To what extent do you agree or disagree with the following statements? | I found what I was looking for'),
+    (22, 'To what extent do you agree or disagree with the following statements? | My delivery arrived on time'),
+    (23, 'What is your age?'),
+    (24, 'Which of the following best describes your current employment status?'),
+    (25, 'What was your total household income before taxes last year?'),
+    (26, 'How did you first hear about us? | Other (please specify)'),
+]
+EXAMPLE_NAMES = {
+    3: 'sat_service_speed', 4: 'sat_staff_friendly', 5: 'sat_value_for_money', 6: 'sat_store_clean',
+    7: 'nps_score', 8: 'nps_reason', 9: 'bought_12m_laptop', 10: 'bought_12m_tablet', 11: 'bought_12m_other',
+    12: 'rank_battery_life', 13: 'rank_screen_quality', 14: 'rank_price', 15: 'web_visits_per_month',
+    16: 'support_contact_6m', 17: 'support_resolved_sat', 18: 'region', 19: 'other_comments',
+    20: 'agree_checkout_easy', 21: 'agree_found_items', 22: 'agree_delivery_time', 23: 'age',
+    24: 'employment_status', 25: 'household_income', 26: 'heard_about_other'
+}
+
+
+def worked_example(prompt_builder: PromptBuilder, reply_builder: Callable[[Batch, Dict[int, str]], str]) -> str:
+    """The conventions and the example batch, written the way a given prompt asks and answers"""
+    return (f"{NAMING_CONVENTIONS}\n\nExample user message:\n{prompt_builder(EXAMPLE_BATCH)}\n\n"
+            f"Example reply:\n{reply_builder(EXAMPLE_BATCH, EXAMPLE_NAMES)}")
+
+
+ABBREVIATION_RULES = """You are abbreviating survey column headers to make them concise and readable.
+
+For each header in the user message, create a short, clear column name that captures the essential meaning.
+Rules:
+- Use snake_case format (lowercase with underscores)
+- Maximum 30 characters
+- Preserve key information but remove redundancy
+- For matrix questions, focus on the specific aspect being measured
+- Make names unique and descriptive
+- Lines under a "Question:" line are sub-labels of that question; each numbered line is its own column
+
+Return ONLY a JSON object with the format:
+{
+  "0": "abbreviated_name_1",
+  "1": "abbreviated_name_2",
+  ...
+}
+
+Use the original column numbers (not 0-indexed for this batch)."""
+
+
+def build_abbreviation_prompt(batch: Batch) -> str:
+    """Per-batch part of the ImprovedDataWrangler prompt (the rules are ABBREVIATION_INSTRUCTIONS)"""
+    return f"Headers to abbreviate:\n{format_header_list(batch)}"
+
+
+def build_abbreviation_reply(batch: Batch, names: Dict[int, str]) -> str:
+    """The reply parse_abbreviation_response expects, for the worked example"""
+    return json.dumps({str(col_idx): names[col_idx] for col_idx, _ in batch}, indent=2)
+
+
+ABBREVIATION_INSTRUCTIONS = (f"{ABBREVIATION_RULES}\n\n"
+                             f"{worked_example(build_abbreviation_prompt, build_abbreviation_reply)}")
+
+
+def strip_code_fence(response_text: str) -> str:
+    """Remove ```json fences the model sometimes adds"""
+    response_text = response_text.strip()
+    if response_text.startswith('```json'):
+        response_text = response_text.replace('```json', '').replace('```', '').strip()
+    elif response_text.startswith('```'):
+        response_text = response_text.replace('```', '').strip()
+    return response_text
+
+
+def parse_abbreviation_response(response_text: str, batch: Batch) -> Dict[int, str]:
+    """Parse the {"<column>": "<short_name>"} object returned for one batch"""
+    batch_result = json.loads(strip_code_fence(response_text))
+    return {col_idx: batch_result[str(col_idx)] for col_idx, _ in batch if str(col_idx) in batch_result}
+
+
+def snake_case(text: str) -> str:
+    """'Email Address' -> 'email_address'"""
+    return re.sub(r'[^a-z0-9]+', '_', text.lower()).strip('_')
+
+
+def local_abbreviation(header: str, max_length: int = DEFAULT_MAX_LENGTH) -> Optional[str]:
+    """Rule-based shortName for trivially abbreviable headers, or None if the model is needed"""
+    parts = [part.strip() for part in header.split(HEADER_SEPARATOR)]
+    if len(parts) > 1 and parts[-1].lower() in GENERIC_SUB_LABELS:
+        parts = parts[:-1]
+    # Questions and follow-up prompts ("Reason(s) Why:") need the surrounding context
+    if len(parts) != 1 or parts[0].endswith(('?', ':')) or '?' in parts[0] or len(parts[0].split()) > MAX_LOCAL_WORDS:
+        return None
+
+    name = snake_case(parts[0])
+    if not name or len(name) > max_length:
+        return None
+    if name[0].isdigit():
+        name = f'q_{name}'[:max_length]
+    return name
+
+
+def resolve_collisions(names: List[str], max_length: int = DEFAULT_MAX_LENGTH) -> List[str]:
+    """Make names unique by suffixing repeats with _2, _3, ... (trimmed to max_length)"""
+    taken = set(names)
+    seen = set()
+    unique = []
+    for name in names:
+        if name in seen:
+            counter = 2
+            while True:
+                suffix = f'_{counter}'
+                candidate = f'{name[:max_length - len(suffix)]}{suffix}'
+                if candidate not in taken:
+                    break
+                counter += 1
+            logger.info(f"Renamed duplicate column name {name} -> {candidate}")
+            name = candidate
+            taken.add(name)
+        seen.add(name)
+        unique.append(name)
+    return unique
+
+
+def prompt_version(prompt_builder: PromptBuilder, instructions: str = '') -> str:
+    """Fingerprint of a prompt template, so editing the prompt invalidates cached answers"""
+    sample = instructions + prompt_builder([(0, '{header}')])
+    return hashlib.sha256(sample.encode('utf-8')).hexdigest()[:16]
+
+
+class AsyncAbbreviator:
+    """Runs abbreviation batches concurrently against the Messages API"""
+
+    def __init__(self, api_key: Optional[str] = None, concurrency: int = DEFAULT_CONCURRENCY,
+                 model: str = ABBREVIATION_MODEL, max_tokens: int = 3000, temperature: Optional[float] = 0.2,
+                 base_url: Optional[str] = None, instructions: str = ABBREVIATION_INSTRUCTIONS,
+                 prompt_builder: PromptBuilder = build_abbreviation_prompt,
+                 response_parser: ResponseParser = parse_abbreviation_response,
+                 cache: Optional[AbbreviationCache] = None, local_fast_path: bool = True,
+                 max_length: int = DEFAULT_MAX_LENGTH, max_batch_tokens: Optional[int] = DEFAULT_MAX_BATCH_TOKENS,
+                 max_split_depth: int = DEFAULT_MAX_SPLIT_DEPTH, scheduler: Optional[RequestScheduler] = None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.concurrency = max(1, concurrency)
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.instructions = instructions
+        self.prompt_builder = prompt_builder
+        self.response_parser = response_parser
+        self.cache = cache
+        self.local_fast_path = local_fast_path
+        self.max_length = max_length
+        self.max_batch_tokens = max_batch_tokens
+        self.max_split_depth = max_split_depth
+        self.scheduler = scheduler or get_scheduler()
+        self.prompt_version = prompt_version(prompt_builder, instructions)
+
+    def build_request(self, batch: Batch) -> Dict[str, Any]:
+        """messages.create parameters for one batch (also used for Message Batches requests)"""
+        request = {
+            'model': self.model,
+            'max_tokens': self.max_tokens,
+            'system': cached_system(self.instructions),
+            'messages': [{'role': 'user', 'content': self.prompt_builder(batch)}]
+        }
+        if self.temperature is not None:
+            request['temperature'] = self.temperature
+        return request
+
+    def prefill(self, headers: List[str]) -> Tuple[Dict[int, str], int]:
+        """Names that need no request: local fast path, then the cache. Returns (names, local_count)"""
+        abbreviations: Dict[int, str] = {}
+        if self.local_fast_path:
+            repeated = {header for header, count in Counter(headers).items() if count > 1}
+            for col_idx, header in enumerate(headers):
+                if header in repeated:
+                    continue  # Same label on several columns: let the model tell them apart
+                name = local_abbreviation(header, self.max_length)
+                if name:
+                    abbreviations[col_idx] = name
+            logger.info(f"Local fast path: {len(abbreviations)} of {len(headers)} headers skip the model")
+        local_count = len(abbreviations)
+
+        if self.cache is not None:
+            keys = cache_keys(headers)
+            remaining = [col_idx for col_idx in range(len(headers)) if col_idx not in abbreviations]
+            cached = self.cache.get_many([keys[col_idx] for col_idx in remaining], self.prompt_version, self.model)
+            abbreviations.update({col_idx: cached[keys[col_idx]] for col_idx in remaining if keys[col_idx] in cached})
+            logger.info(f"Abbreviation cache: {len(abbreviations) - local_count} of {len(remaining)} headers already known")
+
+        return abbreviations, local_count
+
+    def remember(self, headers: List[str], abbreviations: Dict[int, str]):
+        """Store model answers in the cache (if any)"""
+        if self.cache is not None:
+            keys = cache_keys(headers)
+            self.cache.put_many({keys[col_idx]: name for col_idx, name in abbreviations.items()},
+                                self.prompt_version, self.model)
+
+    def assemble(self, headers: List[str], abbreviations: Dict[int, str]) -> List[str]:
+        """Names in column order: col_N where nothing was returned, then de-duplicated"""
+        names = []
+        for col_idx in range(len(headers)):
+            if col_idx in abbreviations:
+                names.append(abbreviations[col_idx])
+            else:
+                fallback_name = f"col_{col_idx}"
+                names.append(fallback_name)
+                logger.warning(f"No abbreviation for column {col_idx}, using fallback: {fallback_name}")
+        return resolve_collisions(names, self.max_length)
+
+    async def _send_batch(self, client: AsyncAnthropic, semaphore: asyncio.Semaphore,
+                          batch_index: int, batch: Batch, depth: int) -> Tuple[Dict[int, str], Dict[str, Any]]:
+        """Send one request once a concurrency slot is free"""
+        batch_start, batch_end = batch[0][0], batch[-1][0]
+        stats = {'batch': batch_index, 'depth': depth, 'start_column': batch_start, 'end_column': batch_end,
+                 'headers': len(batch), 'success': False}
+
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                request = self.build_request(batch)
+                prompt = self.instructions + request['messages'][0]['content']
+                stats['prompt_chars'] = len(prompt)
+                stats['estimated_tokens'] = estimate_tokens(prompt)
+
+                response = await self.scheduler.call_async(
+                    lambda: client.messages.create(**request),
+                    priority=PRIORITY_ABBREVIATION,
+                    tokens=stats['estimated_tokens'],
+                    label=f"Abbreviation batch {batch_start}-{batch_end}"
+                )
+                abbreviations = self.response_parser(response.content[0].text, batch)
+
+                stats['success'] = True
+                stats['returned'] = len(abbreviations)
+                stats.update(usage_stats(response))
+                logger.info(f"Batch {batch_start}-{batch_end} completed successfully")
+            except Exception as e:
+                abbreviations = {}
+                stats['error'] = str(e)
+                logger.error(f"LLM abbreviation failed for batch {batch_start}-{batch_end}: {e}")
+            finally:
+                stats['latency_seconds'] = round(time.perf_counter() - started, 3)
+
+        return abbreviations, stats
+
+    async def _run_batch(self, client: AsyncAnthropic, semaphore: asyncio.Semaphore,
+                         batch_index: int, batch: Batch, depth: int = 0,
+                         on_batch: Optional[BatchCallback] = None) -> Tuple[Dict[int, str], List[Dict[str, Any]]]:
+        """Send a batch, then bisect it on failure or re-request the columns its reply left out"""
+        abbreviations, stats = await self._send_batch(client, semaphore, batch_index, batch, depth)
+        batch_stats = [stats]
+        if on_batch is not None and abbreviations:
+            on_batch(abbreviations)
+
+        missing = [entry for entry in batch if entry[0] not in abbreviations]
+        if missing and depth < self.max_split_depth:
+            if not stats['success'] and len(missing) > 1:
+                middle = len(missing) // 2
+                retries = [missing[:middle], missing[middle:]]
+            else:
+                retries = [missing]
+            stats['split_into'] = [len(retry) for retry in retries]
+            logger.info(f"Retrying {len(missing)} columns of batch {stats['start_column']}-{stats['end_column']} "
+                        f"as {stats['split_into']}")
+
+            results = await asyncio.gather(*[
+                self._run_batch(client, semaphore, batch_index, retry, depth + 1, on_batch) for retry in retries
+            ])
+            for retry_abbreviations, retry_stats in results:
+                abbreviations.update(retry_abbreviations)
+                batch_stats.extend(retry_stats)
+
+        return abbreviations, batch_stats
+
+    async def abbreviate_async(self, headers: List[str], batch_size: int = DEFAULT_BATCH_SIZE,
+                               known: Optional[Dict[int, str]] = None,
+                               on_batch: Optional[BatchCallback] = None) -> Dict[str, Any]:
+        """Abbreviate all headers; returns names in column order plus per-batch stats
+
+        `known` names (e.g. from a Message Batches job or a checkpoint) are used
+        as-is and not re-requested. `on_batch` is called with each request's
+        names as soon as it succeeds, so progress can be saved mid-run.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        started = time.perf_counter()
+
+        abbreviations, local_count = self.prefill(headers)
+        cache_hits = len(abbreviations) - local_count
+        abbreviations.update(known or {})
+
+        pending = [(col_idx, header) for col_idx, header in enumerate(headers) if col_idx not in abbreviations]
+        batches = pack_batches(pending, batch_size, self.max_batch_tokens)
+
+        results = []
+        if batches:
+            # The scheduler owns retries, so the SDK must not retry underneath it
+            async with AsyncAnthropic(api_key=self.api_key, base_url=self.base_url, max_retries=0) as client:
+                tasks = [
+                    self._run_batch(client, semaphore, batch_index, batch, on_batch=on_batch)
+                    for batch_index, batch in enumerate(batches)
+                ]
+                results = await asyncio.gather(*tasks)
+
+        batch_stats = []
+        for batch_abbreviations, request_stats in results:
+            abbreviations.update(batch_abbreviations)
+            batch_stats.extend(request_stats)
+            self.remember(headers, batch_abbreviations)
+
+        return {
+            'names': self.assemble(headers, abbreviations),
+            'batch_stats': batch_stats,
+            'batches': len(batches),
+            'batch_sizes': [len(batch) for batch in batches],
+            'requests': len(batch_stats),
+            'splits': sum(1 for stats in batch_stats if 'split_into' in stats),
+            'input_tokens': sum(stats.get('input_tokens', 0) for stats in batch_stats),
+            'cache_read_input_tokens': sum(stats.get('cache_read_input_tokens', 0) for stats in batch_stats),
+            'cache_creation_input_tokens': sum(stats.get('cache_creation_input_tokens', 0) for stats in batch_stats),
+            'wall_seconds': round(time.perf_counter() - started, 3),
+            'fallback_count': len(headers) - len(abbreviations),
+            'local_count': local_count,
+            'cache_hits': cache_hits,
+            'sent_to_model': len(pending)
+        }
+
+    def abbreviate(self, headers: List[str], batch_size: int = DEFAULT_BATCH_SIZE,
+                   known: Optional[Dict[int, str]] = None,
+                   on_batch: Optional[BatchCallback] = None) -> Dict[str, Any]:
+        """Synchronous entry point for the (non-async) wranglers"""
+        return asyncio.run(self.abbreviate_async(headers, batch_size, known, on_batch))
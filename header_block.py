@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Columnar Header Block Operations
+Forward fill and concatenation of the header rows, done on the whole block at
+once so very wide exports (conjoint / MaxDiff dumps with 10,000+ columns) stay
+well under a second.
+1. forward_fill_block() strips the cells once, then carries the last non-empty
+   value of each row to the right with a running index max (no per-cell loop)
+2. concatenate_columns() joins the upper rows once per run of identical columns
+   (a matrix question's block), then appends the bottom row to every column at
+   once, skipping parts already used higher up in the column
+"""
+
+import logging
+from typing import Any, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+HEADER_SEPARATOR = ' | '
+
+
+def cell_text(cell: Any) -> str:
+    """Stripped text of one header cell; None and NaN are blank"""
+    if cell is None or (isinstance(cell, float) and cell != cell):
+        return ''
+    return str(cell).strip()
+
+
+def header_block(rows: Sequence[Sequence[Any]]) -> np.ndarray:
+    """Header rows as a 2-D array of stripped strings; ragged rows are padded with ''"""
+    if not rows:
+        return np.empty((0, 0), dtype=object)
+
+    # A few rows by thousands of columns: one flat comprehension per row beats a
+    # DataFrame (one Series per column) or pandas string ops on an object array
+    width = max(len(row) for row in rows)
+    block = np.full((len(rows), width), '', dtype=object)
+    for row_idx, row in enumerate(rows):
+        block[row_idx, :len(row)] = [cell.strip() if type(cell) is str else cell_text(cell) for cell in row]
+    return block
+
+
+def forward_fill_block(rows: Sequence[Sequence[Any]]) -> np.ndarray:
+    """Fill blank header cells to the right with the last non-empty value in the same row"""
+    block = header_block(rows)
+    if block.size == 0:
+        return block
+
+    filled = block != ''
+    # Index of the most recent non-empty cell at or left of each position (0 before any)
+    source = np.maximum.accumulate(np.where(filled, np.arange(block.shape[1]), 0), axis=1)
+    result = np.take_along_axis(block, source, axis=1)
+    # Cells left of a row's first value stay blank (column 0 may itself be blank)
+    return np.where(filled.cumsum(axis=1) > 0, result, '')
+
+
+def last_filled_column(block: np.ndarray) -> int:
+    """Index of the rightmost column with a value in any row (-1 if the block is blank)"""
+    filled = (block != '').any(axis=0) if block.size else np.zeros(0, dtype=bool)
+    return int(np.flatnonzero(filled)[-1]) if filled.any() else -1
+
+
+def _append_row(names: np.ndarray, named: np.ndarray, part: np.ndarray, above: np.ndarray,
+                separator: str):
+    """Append one header row to every column's name, skipping blanks and parts used higher up"""
+    keep = part != ''
+    for above_part in above:
+        keep &= part != above_part
+    names = np.where(keep, np.where(named, names + (separator + part), part), names)
+    return names, named | keep
+
+
+def concatenate_columns(block: np.ndarray, separator: str = HEADER_SEPARATOR,
+                        num_columns: Optional[int] = None) -> List[str]:
+    """One longName per column: its non-empty parts top to bottom, repeats dropped
+
+    The forward-filled rows above the bottom one repeat across each question
+    block, so their joined prefix is built once per run of identical columns and
+    only the bottom row is appended column by column. Columns with no parts are
+    named Column_<n>; num_columns limits the output width.
+    """
+    if not block.size:
+        return []
+    if num_columns is not None:
+        block = block[:, :num_columns]
+
+    upper = block[:-1]
+    # Runs of adjacent columns whose upper rows are identical share one prefix
+    run_start = np.ones(block.shape[1], dtype=bool)
+    if len(upper):
+        run_start[1:] = (upper[:, 1:] != upper[:, :-1]).any(axis=0)
+    runs = upper[:, run_start]
+
+    prefixes = runs[0] if len(runs) else np.full(int(run_start.sum()), '', dtype=object)
+    prefixed = prefixes != ''
+    for row_idx in range(1, len(runs)):
+        prefixes, prefixed = _append_row(prefixes, prefixed, runs[row_idx], runs[:row_idx], separator)
+
+    run_of = np.cumsum(run_start) - 1
+    names, named = _append_row(prefixes[run_of], prefixed[run_of], block[-1], upper, separator)
+
+    names = names.tolist()
+    for col_idx in np.flatnonzero(~named).tolist():
+        names[col_idx] = f'Column_{col_idx}'
+    return names
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Vectorized Header Row Detection
+Profiles every scanned row in one pass over a flattened cell array, then picks
+the header/data split that best separates the two kinds of row.
+1. Row profiles: empty, numeric/date, mean text length and distinct-value ratios
+2. Typed columns (mostly numbers or dates) should hold typed cells in data rows;
+   a row's header score is the share of its cells there that are text. Rows with
+   nothing in a typed column are scored by how many of their values recur
+   further down the same column (answers repeat, question text does not)
+3. The split minimises the number of rows that disagree with their side; the
+   confidence is the gap between mean header and mean data scores
+4. The scan window doubles (pulling more rows if a source is given) until the
+   data rows outnumber the header rows, so deep header blocks are still found
+"""
+
+import logging
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+INITIAL_SCAN_ROWS = 50
+DEFAULT_MAX_SCAN_ROWS = 10000
+# The data rows in the window must number at least this many (and outnumber the headers)
+MIN_DATA_ROWS = 10
+# A column is typed when at least this share of its non-empty scanned cells are numbers/dates
+TYPED_COLUMN_SHARE = 0.5
+LOW_CONFIDENCE = 0.5
+
+EMPTY_MARKERS = ['', 'nan', 'NaN', 'None', 'NaT', '<NA>']
+# Integers, decimals, percentages, dates (2024-01-31, 31/01/2024) and times, optionally combined
+TYPED_CELL_PATTERN = (
+    r'[-+]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][-+]?\d+)?%?'
+    r'|\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}(?:[ T]\d{1,2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?'
+    r'|\d{1,2}:\d{2}(?::\d{2})?(?:\s?[AaPp][Mm])?'
+)
+
+RowSource = Callable[[int], List[Sequence[Any]]]
+
+
+def _cell_strings(rows: Sequence[Sequence[Any]]) -> pd.Series:
+    """All cells as one flat string Series (row-major); ragged rows are padded with ''"""
+    frame = pd.DataFrame.from_records(list(rows))
+    block = frame.astype(object).where(frame.notna(), '')
+    return pd.Series(block.to_numpy().ravel(), dtype=object).astype(str).str.strip()
+
+
+def _row_distinct(codes: np.ndarray) -> np.ndarray:
+    """Distinct non-empty values per row (codes < 0 are empty cells)"""
+    if codes.shape[1] == 0:
+        return np.zeros(len(codes), dtype=int)
+    ordered = np.sort(codes, axis=1)
+    changes = (ordered[:, 1:] != ordered[:, :-1]) & (ordered[:, 1:] >= 0)
+    return changes.sum(axis=1) + (ordered[:, 0] >= 0)
+
+
+def _column_counts(codes: np.ndarray) -> np.ndarray:
+    """How often each cell's value occurs in its own column (within the scanned rows)"""
+    n_rows, n_cols = codes.shape
+    keys = codes.astype(np.int64) * n_cols + np.arange(n_cols)
+    _, inverse, counts = np.unique(keys.ravel(), return_inverse=True, return_counts=True)
+    return counts[inverse].reshape(n_rows, n_cols)
+
+
+def profile_rows(rows: Sequence[Sequence[Any]]) -> pd.DataFrame:
+    """Per-row profile and header score for the given rows (one vectorized pass)"""
+    if not rows:
+        return pd.DataFrame(columns=['non_empty', 'empty_ratio', 'numeric_ratio', 'mean_text_length',
+                                     'distinct_ratio', 'repeat_ratio', 'typed_share', 'header_score'])
+
+    cells = _cell_strings(rows)
+    n_rows = len(rows)
+    n_cols = len(cells) // n_rows
+
+    empty = cells.isin(EMPTY_MARKERS).to_numpy()
+    typed = cells.str.fullmatch(TYPED_CELL_PATTERN).to_numpy(dtype=bool) & ~empty
+    lengths = np.where(empty, 0, cells.str.len().to_numpy())
+    codes = np.where(empty, -1, pd.factorize(cells)[0])
+
+    empty = empty.reshape(n_rows, n_cols)
+    typed = typed.reshape(n_rows, n_cols)
+    lengths = lengths.reshape(n_rows, n_cols)
+    codes = codes.reshape(n_rows, n_cols)
+    filled = ~empty
+
+    non_empty = filled.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Typed columns: mostly numbers/dates over the scanned window
+        typed_columns = typed.sum(axis=0) >= TYPED_COLUMN_SHARE * np.maximum(filled.sum(axis=0), 1)
+        typed_columns &= filled.any(axis=0)
+        in_typed = filled & typed_columns
+        typed_share = np.where(in_typed.sum(axis=1) > 0,
+                               (typed & typed_columns).sum(axis=1) / in_typed.sum(axis=1), np.nan)
+
+        repeated = (_column_counts(codes) > 1) & filled
+        repeat_ratio = np.where(non_empty > 0, repeated.sum(axis=1) / non_empty, np.nan)
+
+        profiles = pd.DataFrame({
+            'non_empty': non_empty,
+            'empty_ratio': 1 - non_empty / n_cols if n_cols else 1.0,
+            'numeric_ratio': typed.sum(axis=1) / n_cols if n_cols else 0.0,
+            'mean_text_length': np.where(non_empty > 0, lengths.sum(axis=1) / non_empty, 0.0),
+            'distinct_ratio': np.where(non_empty > 0, _row_distinct(codes) / non_empty, np.nan),
+            'repeat_ratio': repeat_ratio,
+            'typed_share': typed_share
+        })
+
+    # Typed columns decide where they have content; otherwise fall back to value repetition
+    score = 1 - profiles['typed_share'].fillna(profiles['repeat_ratio'])
+    # Blank rows take the score of the row above (a blank leading row counts as header)
+    profiles['header_score'] = score.ffill().fillna(1.0)
+    return profiles
+
+
+def best_split(scores: np.ndarray) -> int:
+    """Data start row minimising header rows that look like data plus data rows that look like headers"""
+    n_rows = len(scores)
+    if n_rows < 2:
+        return n_rows
+    # cost(k) = sum(1 - s[:k]) + sum(s[k:]) for k = 1 .. n_rows - 1
+    header_cost = np.cumsum(1 - scores)[:-1]
+    data_cost = scores.sum() - np.cumsum(scores)[:-1]
+    return int(np.argmin(header_cost + data_cost)) + 1
+
+
+def detect_header_rows(rows: Sequence[Sequence[Any]], more_rows: Optional[RowSource] = None,
+                       max_scan_rows: int = DEFAULT_MAX_SCAN_ROWS) -> Dict[str, Any]:
+    """Find the header block of a sheet
+
+    rows are the rows already in memory; more_rows(n), if given, returns up to n
+    further rows (fewer once the sheet is exhausted) when the window needs to grow.
+    Returns header_rows, data_start_row, a 0-1 confidence, the scanned row count
+    and the row profiles.
+    """
+    rows = list(rows)
+    window = min(INITIAL_SCAN_ROWS, max_scan_rows)
+
+    while True:
+        if len(rows) < window and more_rows is not None:
+            extra = more_rows(window - len(rows))
+            rows.extend(extra)
+            if len(rows) < window:
+                more_rows = None  # Sheet exhausted
+
+        scanned = rows[:window]
+        profiles = profile_rows(scanned)
+        scores = profiles['header_score'].to_numpy(dtype=float)
+        data_start_row = best_split(scores)
+
+        data_rows = len(scanned) - data_start_row
+        exhausted = len(scanned) < window or (len(rows) <= window and more_rows is None)
+        if (data_rows >= MIN_DATA_ROWS and data_rows > data_start_row) or exhausted or window >= max_scan_rows:
+            break
+        window = min(window * 2, max_scan_rows)
+        logger.info(f"Header block not settled in {len(scanned)} rows (split at {data_start_row}); scanning {window}")
+
+    if data_start_row and data_start_row < len(scores):
+        confidence = float(np.clip(scores[:data_start_row].mean() - scores[data_start_row:].mean(), 0.0, 1.0))
+    else:
+        confidence = 0.0
+
+    if confidence < LOW_CONFIDENCE:
+        logger.warning(f"Low confidence ({confidence:.2f}) in header detection: data assumed to start at row {data_start_row}")
+
+    return {
+        'header_rows': list(range(data_start_row)),
+        'data_start_row': data_start_row,
+        'confidence': round(confidence, 3),
+        'scanned_rows': len(profiles),
+        'profiles': profiles
+    }
+
+
+def log_profiles(profiles: pd.DataFrame, data_start_row: int, rows: int = 3):
+    """Log the header rows plus the first few data rows of a profile"""
+    for row_idx, profile in profiles.iloc[:data_start_row + rows].iterrows():
+        logger.info(f"Row {row_idx}: empty_ratio={profile['empty_ratio']:.2f}, numeric_ratio={profile['numeric_ratio']:.2f}, "
+                    f"mean_len={profile['mean_text_length']:.1f}, distinct={profile['distinct_ratio']:.2f}, "
+                    f"header_score={profile['header_score']:.2f}{' (header)' if row_idx < data_start_row else ''}")
@@ -8,14 +8,24 @@ Improved Data Wrangling Pipeline
 5. Save column mapping: number, longName (pure concatenate), shortName (LLM abbreviated)
 """
 
+import argparse
 import json
 import pandas as pd
-import numpy as np
-from anthropic import Anthropic
 import os
-from typing import Dict, List, Any, Tuple
+from itertools import islice
 import logging
 from dotenv import load_dotenv
+from cell_normalization import frame_from_rows, stringify_rows
+from excel_loader import DEFAULT_SNIFF_ROWS, open_sheet
+from header_block import concatenate_columns, forward_fill_block, header_block
+from header_detection import detect_header_rows, log_profiles
+from abbreviation_cache import AbbreviationCache
+from header_abbreviation import DEFAULT_BATCH_SIZE, DEFAULT_CONCURRENCY, DEFAULT_MAX_BATCH_TOKENS, AsyncAbbreviator
+from stage_checkpoint import StageCheckpoint
+from stage_graph import StageGraph, timing_lines
+from stage_metrics import DEFAULT_PROFILE_DIR, StageProfiler, rows_shape
+from request_scheduler import get_scheduler
+from workbook_cache import WorkbookCache, load_sheet
 
 # Load environment variables
 load_dotenv()
@@ -24,146 +34,140 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+DEFAULT_EXCEL_FILE = 'data/datasets/mums/Detail_Parents Survey.xlsx'
+
+# Bump a stage's version when its output changes; that stage and every later one re-run on --resume
+STAGE_VERSIONS = {
+    'load': 1,
+    'detect': 1,
+    'fill': 1,
+    'concatenate': 1,
+    'abbreviate': 1,
+    'mapping': 1,
+    'comparison': 1
+}
+
 class ImprovedDataWrangler:
     def __init__(self, api_key: str):
-        self.anthropic = Anthropic(api_key=api_key)
+        self.api_key = api_key
         self.original_data = None
+        self.data_rows = None  # Generator over rows after the buffered head (header detection only)
+        self.stream = None  # Open SheetStream behind data_rows, closed once detection is done
         self.header_rows = []
         self.data_start_row = None
+        self.header_confidence = None
         self.column_mapping = {}  # {col_num: {'longName': str, 'shortName': str}}
         
-    def load_excel_data(self, file_path='data/datasets/mums/Detail_Parents Survey.xlsx'):
-        """Load actual Excel data from the project"""
+    def load_excel_data(self, file_path=DEFAULT_EXCEL_FILE, sniff_rows=DEFAULT_SNIFF_ROWS, cache=None):
+        """Load actual Excel data from the project
+
+        Only the first sniff_rows rows are materialised (for header detection);
+        the rest stays on self.data_rows as a row generator, in case the header
+        block runs deeper, until determine_header_rows() releases it. When a
+        WorkbookCache is given the parsed sheet is read from / written to it.
+        """
         try:
             logger.info(f"Loading Excel file: {file_path}")
-            df = pd.read_excel(file_path, header=None)
-            
-            # Convert DataFrame to list of lists
-            self.original_data = df.values.tolist()
+            self.release_stream()
             
-            # Replace NaN values with empty strings
-            for row in self.original_data:
-                for i, cell in enumerate(row):
-                    if pd.isna(cell):
-                        row[i] = ''
-                    else:
-                        row[i] = str(cell).strip()
+            if cache is not None:
+                headers, data = load_sheet(file_path, cache=cache)
+                body_start = max(sniff_rows - len(headers), 0)
+                
+                self.original_data = (headers + stringify_rows(data.iloc[:body_start]))[:sniff_rows]
+                self.data_rows = data.iloc[body_start:].itertuples(index=False, name=None)
+                
+                total_rows = len(headers) + len(data)
+                total_columns = len(data.columns)
+            else:
+                stream = self.stream = open_sheet(file_path)
+                
+                # Header sniffing only needs the first rows, stringified as header candidates
+                self.original_data = stringify_rows(frame_from_rows(stream.head(sniff_rows)))
+                
+                # Further rows are read only if header detection asks for them
+                self.data_rows = stream.rows(start=len(self.original_data))
+                
+                total_rows = stream.max_row or len(self.original_data)
+                total_columns = stream.max_column or (len(self.original_data[0]) if self.original_data else 0)
             
-            logger.info(f"Loaded Excel data: {len(self.original_data)} rows, {len(self.original_data[0])} columns")
+            logger.info(f"Loaded Excel data: {total_rows} rows, {total_columns} columns ({len(self.original_data)} buffered for header detection)")
             
-            return {'success': True, 'rows': len(self.original_data), 'columns': len(self.original_data[0])}
+            return {'success': True, 'rows': total_rows, 'columns': total_columns}
             
         except Exception as e:
+            self.release_stream()
             logger.error(f"Failed to load Excel file: {e}")
             return {'success': False, 'error': str(e)}
     
+    def release_stream(self):
+        """Close the workbook behind data_rows (read-only mode keeps the file open until then)"""
+        self.data_rows = None
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+    
     def determine_header_rows(self):
-        """Step 1: Determine number of header rows by analyzing data patterns"""
+        """Step 1: Determine number of header rows by profiling every row in one vectorized pass
+
+        The sniffed head is extended from the data stream when the header block
+        runs deeper than the rows buffered so far.
+        """
         if not self.original_data:
             return {'success': False, 'error': 'No data loaded'}
         
         logger.info("Determining header rows...")
         
-        # Look for patterns that indicate data vs headers
-        # Headers typically have more text, data rows have more consistent patterns
-        data_start_candidates = []
-        
-        for row_idx in range(min(10, len(self.original_data))):  # Check first 10 rows
-            row = self.original_data[row_idx]
-            
-            # Count empty cells
-            empty_count = sum(1 for cell in row if not cell or cell == '')
-            # Count numeric-like cells
-            numeric_count = 0
-            for cell in row:
-                if cell and str(cell).replace('.', '').replace('-', '').isdigit():
-                    numeric_count += 1
-            
-            # Calculate ratios
-            total_cells = len(row)
-            empty_ratio = empty_count / total_cells if total_cells > 0 else 0
-            numeric_ratio = numeric_count / total_cells if total_cells > 0 else 0
-            
-            logger.info(f"Row {row_idx}: empty_ratio={empty_ratio:.2f}, numeric_ratio={numeric_ratio:.2f}")
-            
-            # Data rows typically have lower empty ratio and higher numeric ratio
-            if empty_ratio < 0.7 and numeric_ratio > 0.1:
-                data_start_candidates.append(row_idx)
-        
-        # Use the earliest candidate as data start
-        if data_start_candidates:
-            self.data_start_row = min(data_start_candidates)
-        else:
-            self.data_start_row = 2  # Default assumption
+        def read_more(count):
+            extra = stringify_rows(frame_from_rows(islice(self.data_rows, count))) if self.data_rows is not None else []
+            self.original_data.extend(extra)
+            return extra
         
-        # Header rows are everything before data start
-        self.header_rows = list(range(self.data_start_row))
-        
-        logger.info(f"Determined header rows: {self.header_rows}")
+        try:
+            detection = detect_header_rows(self.original_data, more_rows=read_more)
+        finally:
+            # No later stage reads the body, so the file handle is not held for the rest of the run
+            self.release_stream()
+        log_profiles(detection['profiles'], detection['data_start_row'])
+        
+        self.data_start_row = detection['data_start_row']
+        self.header_rows = detection['header_rows']
+        self.header_confidence = detection['confidence']
+        
+        logger.info(f"Determined header rows: {self.header_rows} (confidence {self.header_confidence:.2f}, "
+                    f"{detection['scanned_rows']} rows scanned)")
         logger.info(f"Data starts at row: {self.data_start_row}")
         
         return {
             'success': True, 
             'header_rows': self.header_rows,
-            'data_start_row': self.data_start_row
+            'data_start_row': self.data_start_row,
+            'confidence': self.header_confidence
         }
     
     def forward_fill_headers(self):
-        """Step 2: Fill forward to the right for blank columns in header rows"""
+        """Step 2: Fill forward to the right for blank columns in header rows (whole block at once)"""
         if not self.header_rows:
             return {'success': False, 'error': 'Header rows not determined'}
         
         logger.info("Forward filling header rows...")
         
-        filled_headers = []
+        rows = [self.original_data[row_idx] for row_idx in self.header_rows if row_idx < len(self.original_data)]
+        self.filled_headers = forward_fill_block(rows)
         
-        for row_idx in self.header_rows:
-            if row_idx >= len(self.original_data):
-                continue
-                
-            row = self.original_data[row_idx][:]  # Copy
-            filled_row = []
-            last_value = ''
-            
-            for cell in row:
-                if cell and cell.strip():
-                    last_value = cell.strip()
-                    filled_row.append(last_value)
-                else:
-                    filled_row.append(last_value)
-            
-            filled_headers.append(filled_row)
-            logger.info(f"Row {row_idx} filled: first 5 = {filled_row[:5]}")
+        for row_idx, filled_row in zip(self.header_rows, self.filled_headers):
+            logger.info(f"Row {row_idx} filled: first 5 = {filled_row[:5].tolist()}")
         
-        self.filled_headers = filled_headers
-        return {'success': True, 'filled_headers': len(filled_headers)}
+        return {'success': True, 'filled_headers': len(self.filled_headers)}
     
     def concatenate_headers(self):
         """Step 3: Bottom row concatenates itself and rows above, separated by |"""
-        if not hasattr(self, 'filled_headers') or not self.filled_headers:
+        if getattr(self, 'filled_headers', None) is None or not self.filled_headers.size:
             return {'success': False, 'error': 'Headers not forward filled'}
         
         logger.info("Concatenating headers with | separator...")
         
-        num_columns = len(self.filled_headers[0]) if self.filled_headers else 0
-        concatenated_headers = []
-        
-        for col_idx in range(num_columns):
-            # Collect all header values for this column
-            column_parts = []
-            for row_data in self.filled_headers:
-                if col_idx < len(row_data) and row_data[col_idx]:
-                    column_parts.append(row_data[col_idx])
-            
-            # Remove duplicates while preserving order
-            unique_parts = []
-            for part in column_parts:
-                if part not in unique_parts:
-                    unique_parts.append(part)
-            
-            # Join with | separator
-            long_name = ' | '.join(unique_parts) if unique_parts else f'Column_{col_idx}'
-            concatenated_headers.append(long_name)
+        concatenated_headers = concatenate_columns(self.filled_headers)
         
         self.concatenated_headers = concatenated_headers
         logger.info(f"Created {len(concatenated_headers)} concatenated headers")
@@ -171,96 +175,67 @@ class ImprovedDataWrangler:
         
         return {'success': True, 'concatenated_count': len(concatenated_headers)}
     
-    def llm_abbreviate_headers(self, batch_size=25):
-        """Step 4: LLM cycles through concatenated text and makes each section more concise"""
+    def llm_abbreviate_headers(self, batch_size=DEFAULT_BATCH_SIZE, concurrency=DEFAULT_CONCURRENCY, cache=None,
+                               max_batch_tokens=DEFAULT_MAX_BATCH_TOKENS, checkpoint=None):
+        """Step 4: LLM cycles through concatenated text and makes each section more concise
+
+        Batches hold at most batch_size columns and about max_batch_tokens of
+        headers, are sent concurrently (at most `concurrency` in flight) and
+        reassembled in column order. A failed batch is split and retried.
+        When an AbbreviationCache is given, only headers it has not seen
+        before are sent to the model. With a StageCheckpoint every finished
+        batch is saved as it arrives, and a resumed run only requests the rest.
+        """
         if not hasattr(self, 'concatenated_headers') or not self.concatenated_headers:
             return {'success': False, 'error': 'Headers not concatenated'}
         
-        logger.info(f"LLM abbreviating {len(self.concatenated_headers)} headers in batches of {batch_size}...")
+        logger.info(f"LLM abbreviating {len(self.concatenated_headers)} headers in batches of up to {batch_size} "
+                    f"/ ~{max_batch_tokens} tokens ({concurrency} concurrent)...")
         
-        abbreviated_headers = []
+        abbreviator = AsyncAbbreviator(api_key=self.api_key, concurrency=concurrency, cache=cache,
+                                       max_batch_tokens=max_batch_tokens)
         
-        # Process in batches to avoid overwhelming the LLM
-        for batch_start in range(0, len(self.concatenated_headers), batch_size):
-            batch_end = min(batch_start + batch_size, len(self.concatenated_headers))
-            batch_headers = self.concatenated_headers[batch_start:batch_end]
-            
-            logger.info(f"Processing batch {batch_start}-{batch_end-1}")
-            
-            # Build prompt for this batch
-            header_list = "\n".join([
-                f"{i + batch_start}: {header}" 
-                for i, header in enumerate(batch_headers)
-            ])
-            
-            prompt = f"""You are abbreviating survey column headers to make them concise and readable.
-
-For each header below, create a short, clear column name that captures the essential meaning.
-Rules:
-- Use snake_case format (lowercase with underscores)
-- Maximum 30 characters
-- Preserve key information but remove redundancy
-- For matrix questions, focus on the specific aspect being measured
-- Make names unique and descriptive
-
-Headers to abbreviate:
-{header_list}
-
-Return ONLY a JSON object with the format:
-{{
-  "0": "abbreviated_name_1",
-  "1": "abbreviated_name_2",
-  ...
-}}
-
-Use the original column numbers (not 0-indexed for this batch)."""
-
-            try:
-                response = self.anthropic.messages.create(
-                    model="claude-opus-4-1-20250805",
-                    max_tokens=3000,
-                    temperature=0.2,
-                    messages=[{
-                        "role": "user",
-                        "content": prompt
-                    }]
-                )
-                
-                response_text = response.content[0].text.strip()
-                
-                # Parse JSON response
-                if response_text.startswith('```json'):
-                    response_text = response_text.replace('```json', '').replace('```', '').strip()
-                elif response_text.startswith('```'):
-                    response_text = response_text.replace('```', '').strip()
-                
-                batch_result = json.loads(response_text)
-                
-                # Convert back to list format
-                for i, header in enumerate(batch_headers):
-                    col_idx = batch_start + i
-                    if str(col_idx) in batch_result:
-                        abbreviated_headers.append(batch_result[str(col_idx)])
-                    else:
-                        # Fallback if LLM didn't provide abbreviation
-                        fallback_name = f"col_{col_idx}"
-                        abbreviated_headers.append(fallback_name)
-                        logger.warning(f"No abbreviation for column {col_idx}, using fallback: {fallback_name}")
-                
-                logger.info(f"Batch {batch_start}-{batch_end-1} completed successfully")
-                
-            except Exception as e:
-                logger.error(f"LLM abbreviation failed for batch {batch_start}-{batch_end-1}: {e}")
-                # Fallback for this batch
-                for i, header in enumerate(batch_headers):
-                    col_idx = batch_start + i
-                    fallback_name = f"col_{col_idx}"
-                    abbreviated_headers.append(fallback_name)
-        
-        self.abbreviated_headers = abbreviated_headers
-        logger.info(f"LLM abbreviation completed: {len(abbreviated_headers)} headers")
-        
-        return {'success': True, 'abbreviated_count': len(abbreviated_headers)}
+        known, on_batch = None, None
+        if checkpoint is not None:
+            progress_key = f"{abbreviator.model}:{abbreviator.prompt_version}"
+            known = {int(col_idx): name for col_idx, name in checkpoint.load_progress('abbreviate', progress_key).items()}
+            checkpoint.start_progress('abbreviate', progress_key, keep=bool(known))
+            on_batch = lambda names: checkpoint.append_progress('abbreviate', names)
+            if known:
+                logger.info(f"Resuming abbreviation: {len(known)} headers already done in an earlier run")
+        
+        result = abbreviator.abbreviate(self.concatenated_headers, batch_size=batch_size, known=known, on_batch=on_batch)
+        
+        self.abbreviated_headers = result['names']
+        self.abbreviation_batch_stats = result['batch_stats']
+        
+        latencies = [stats['latency_seconds'] for stats in result['batch_stats']]
+        logger.info(f"LLM abbreviation completed: {len(self.abbreviated_headers)} headers in {result['wall_seconds']}s "
+                    f"({result['batches']} batches, {result['requests']} requests, {result['splits']} splits, "
+                    f"slowest {max(latencies, default=0)}s)")
+        for stats in result['batch_stats']:
+            logger.info(f"  Batch {stats['batch']} (depth {stats['depth']}): {stats['headers']} headers, "
+                        f"~{stats.get('estimated_tokens', 0)} est. / {stats.get('input_tokens', '?')} uncached + "
+                        f"{stats.get('cache_read_input_tokens', 0)} cached input tokens, "
+                        f"{stats['latency_seconds']}s{' -> split ' + str(stats['split_into']) if 'split_into' in stats else ''}")
+        
+        return {
+            'success': True,
+            'abbreviated_count': len(self.abbreviated_headers),
+            'fallback_count': result['fallback_count'],
+            'local_count': result['local_count'],
+            'cache_hits': result['cache_hits'],
+            'sent_to_model': result['sent_to_model'],
+            'batches': result['batches'],
+            'batch_sizes': result['batch_sizes'],
+            'requests': result['requests'],
+            'splits': result['splits'],
+            'input_tokens': result['input_tokens'],
+            'cache_read_input_tokens': result['cache_read_input_tokens'],
+            'cache_creation_input_tokens': result['cache_creation_input_tokens'],
+            'wall_seconds': result['wall_seconds'],
+            'batch_latencies': latencies
+        }
     
     def create_column_mapping(self):
         """Step 5: Save column mapping with number, longName, shortName"""
@@ -324,7 +299,6 @@ Use the original column numbers (not 0-indexed for this batch)."""
         comparison_df.to_csv('improved_column_comparison.csv', index=False)
         
         # Create markdown format with full field content (no truncation)
-        num_header_rows = min(4, len(self.header_rows))
         markdown_content = f"# Improved Column Comparison - All {len(comparison_data)} Columns\n\n"
         
         # Dynamic header based on actual number of header rows
@@ -360,10 +334,71 @@ Use the original column numbers (not 0-indexed for this batch)."""
         logger.info("- improved_column_comparison.md")
         
         return {'success': True, 'rows': len(comparison_data)}
+    
+    def stage_state(self, stage):
+        """JSON-ready wrangler state a stage produced, for its checkpoint"""
+        if stage == 'load':
+            return {'original_data': self.original_data}
+        if stage == 'detect':
+            return {'original_data': self.original_data, 'header_rows': self.header_rows,
+                    'data_start_row': self.data_start_row, 'confidence': self.header_confidence}
+        if stage == 'fill':
+            return {'filled_headers': self.filled_headers.tolist()}
+        if stage == 'concatenate':
+            return {'concatenated_headers': self.concatenated_headers}
+        if stage == 'abbreviate':
+            return {'abbreviated_headers': self.abbreviated_headers, 'batch_stats': self.abbreviation_batch_stats}
+        if stage == 'mapping':
+            return {'column_mapping': self.column_mapping}
+        return {}
+    
+    def restore_stage(self, stage, state):
+        """Put back the state stage_state() saved for a completed stage"""
+        if stage in ('load', 'detect'):
+            self.original_data = state['original_data']
+            self.release_stream()  # The streamed body is not checkpointed
+        if stage == 'detect':
+            self.header_rows = state['header_rows']
+            self.data_start_row = state['data_start_row']
+            self.header_confidence = state['confidence']
+        elif stage == 'fill':
+            self.filled_headers = header_block(state['filled_headers'])
+        elif stage == 'concatenate':
+            self.concatenated_headers = state['concatenated_headers']
+        elif stage == 'abbreviate':
+            self.abbreviated_headers = state['abbreviated_headers']
+            self.abbreviation_batch_stats = state['batch_stats']
+        elif stage == 'mapping':
+            # JSON object keys are strings; the mapping is keyed by column number
+            self.column_mapping = {int(col_idx): mapping for col_idx, mapping in state['column_mapping'].items()}
+
+def run_stage(wrangler, checkpoint, stage, run, reuse=True):
+    """Run one stage and checkpoint it, or restore it when an earlier run already completed it"""
+    saved = checkpoint.load(stage) if checkpoint is not None and reuse else None
+    if saved is not None:
+        wrangler.restore_stage(stage, saved['state'])
+        print(f"RESUMED: '{stage}' restored from checkpoint")
+        return saved['result']
+    
+    result = run()
+    if result['success'] and checkpoint is not None:
+        checkpoint.save(stage, {'result': result, 'state': wrangler.stage_state(stage)})
+    return result
 
 def main():
     """Run the improved pipeline"""
     
+    parser = argparse.ArgumentParser(description="Improved Data Wrangling Pipeline")
+    parser.add_argument('--no-cache', action='store_true', help="Bypass the parsed-workbook and header-abbreviation caches")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help="Abbreviation batches in flight at once")
+    parser.add_argument('--file', default=DEFAULT_EXCEL_FILE, help="Survey workbook to wrangle")
+    parser.add_argument('--resume', action='store_true', help="Skip stages (and abbreviation batches) an interrupted run already finished")
+    parser.add_argument('--no-checkpoint', action='store_true', help="Do not write stage checkpoints")
+    parser.add_argument('--metrics', default='improved_pipeline_metrics.json', help="Per-stage metrics report (JSON)")
+    parser.add_argument('--profile', nargs='?', const=DEFAULT_PROFILE_DIR,
+                        help="Dump a cProfile per stage into this directory and trace memory peaks")
+    args = parser.parse_args()
+    
     # Get API key from environment
     api_key = os.getenv('ANTHROPIC_API_KEY')
     if not api_key:
@@ -375,68 +410,84 @@ def main():
     
     # Initialize the wrangler
     wrangler = ImprovedDataWrangler(api_key)
+    checkpoint = None if args.no_checkpoint else StageCheckpoint(args.file, STAGE_VERSIONS, resume=args.resume)
     
-    # Step 1: Load data
-    print("\nStep 1: Loading Excel data...")
-    load_result = wrangler.load_excel_data()
-    if not load_result['success']:
-        print(f"ERROR: {load_result['error']}")
-        return
-    print(f"SUCCESS: Loaded {load_result['rows']} rows x {load_result['columns']} columns")
-    
-    # Step 2: Determine header rows
-    print("\nStep 2: Determining header rows...")
-    header_result = wrangler.determine_header_rows()
-    if not header_result['success']:
-        print(f"ERROR: {header_result['error']}")
-        return
-    print(f"SUCCESS: Header rows: {header_result['header_rows']}, Data starts: {header_result['data_start_row']}")
+    cache = None if args.no_cache else WorkbookCache()
+    abbreviation_cache = None if args.no_cache else AbbreviationCache()
     
-    # Step 3: Forward fill headers
-    print("\nStep 3: Forward filling headers...")
-    fill_result = wrangler.forward_fill_headers()
-    if not fill_result['success']:
-        print(f"ERROR: {fill_result['error']}")
-        return
-    print(f"SUCCESS: Forward filled {fill_result['filled_headers']} header rows")
+    def describe_abbreviation(result):
+        lines = [f"Abbreviated {result['abbreviated_count']} headers "
+                 f"({result['batches']} batches, {result['splits']} splits, in {result['wall_seconds']}s)",
+                 f"Local fast path: {result['local_count']} columns skipped the model",
+                 f"Input tokens: {result['input_tokens']} uncached, {result['cache_read_input_tokens']} read from "
+                 f"and {result['cache_creation_input_tokens']} written to the prompt cache"]
+        if abbreviation_cache is not None:
+            lines.append(f"Abbreviation cache: {result['cache_hits']} hits, {result['sent_to_model']} sent to the model "
+                         f"({abbreviation_cache.stats()['entries']} entries stored)")
+        return lines
     
-    # Step 4: Concatenate headers
-    print("\nStep 4: Concatenating headers...")
-    concat_result = wrangler.concatenate_headers()
-    if not concat_result['success']:
-        print(f"ERROR: {concat_result['error']}")
-        return
-    print(f"SUCCESS: Created {concat_result['concatenated_count']} concatenated headers")
+    def step(number, title, stage, run, describe, reuse=True):
+        """A graph stage that prints its step header and outcome, checkpointed through run_stage"""
+        def run_step():
+            print(f"\nStep {number}: {title}...")
+            result = run_stage(wrangler, checkpoint, stage, run, reuse=reuse)
+            if result['success']:
+                lines = describe(result)
+                print(f"SUCCESS: {lines[0]}")
+                for line in lines[1:]:
+                    print(line)
+            else:
+                print(f"ERROR: {result['error']}")
+            return result
+        return run_step
     
-    # Step 5: LLM abbreviation
-    print("\nStep 5: LLM abbreviating headers...")
-    abbrev_result = wrangler.llm_abbreviate_headers()
-    if not abbrev_result['success']:
-        print(f"ERROR: {abbrev_result['error']}")
-        return
-    print(f"SUCCESS: Abbreviated {abbrev_result['abbreviated_count']} headers")
-    
-    # Step 6: Create column mapping
-    print("\nStep 6: Creating column mapping...")
-    mapping_result = wrangler.create_column_mapping()
-    if not mapping_result['success']:
-        print(f"ERROR: {mapping_result['error']}")
-        return
-    print(f"SUCCESS: Created mapping for {mapping_result['mapping_count']} columns")
+    # Steps 1-7 as a stage graph: each stage waits only for the stages it reads from
+    profiler = StageProfiler('improved_pipeline', profile_dir=args.profile,
+                             shape=lambda stage, result: rows_shape(wrangler.original_data))
+    graph = StageGraph(instrument=profiler.measure)
+    # Detection may read past the buffered head, so a saved load is only reused once detection finished too
+    graph.add('load', step(1, "Loading Excel data", 'load',
+                           lambda: wrangler.load_excel_data(file_path=args.file, cache=cache),
+                           lambda result: [f"Loaded {result['rows']} rows x {result['columns']} columns"],
+                           reuse=checkpoint is not None and checkpoint.completed(['detect'])))
+    graph.add('detect', step(2, "Determining header rows", 'detect', wrangler.determine_header_rows,
+                             lambda result: [f"Header rows: {result['header_rows']}, Data starts: {result['data_start_row']} "
+                                             f"(confidence {result['confidence']:.2f})"]),
+              after=['load'])
+    graph.add('fill', step(3, "Forward filling headers", 'fill', wrangler.forward_fill_headers,
+                           lambda result: [f"Forward filled {result['filled_headers']} header rows"]),
+              after=['detect'])
+    graph.add('concatenate', step(4, "Concatenating headers", 'concatenate', wrangler.concatenate_headers,
+                                  lambda result: [f"Created {result['concatenated_count']} concatenated headers"]),
+              after=['fill'])
+    graph.add('abbreviate', step(5, "LLM abbreviating headers", 'abbreviate',
+                                 lambda: wrangler.llm_abbreviate_headers(concurrency=args.concurrency, cache=abbreviation_cache,
+                                                                         checkpoint=checkpoint),
+                                 describe_abbreviation),
+              after=['concatenate'], inline=True)  # The abbreviation cache's sqlite3 connection is thread-bound
+    graph.add('mapping', step(6, "Creating column mapping", 'mapping', wrangler.create_column_mapping,
+                              lambda result: [f"Created mapping for {result['mapping_count']} columns"]),
+              after=['abbreviate'])
+    graph.add('comparison', step(7, "Generating comparison table", 'comparison', wrangler.generate_comparison_table,
+                                 lambda result: [f"Generated comparison table with {result['rows']} rows"]),
+              after=['mapping'])
     
-    # Step 7: Generate comparison table
-    print("\nStep 7: Generating comparison table...")
-    table_result = wrangler.generate_comparison_table()
-    if not table_result['success']:
-        print(f"ERROR: {table_result['error']}")
+    try:
+        report = graph.run(reraise=True)
+    finally:
+        profiler.write(args.metrics, input_file=args.file, scheduler=get_scheduler().summary())
+    print("\nStage timings:")
+    for line in timing_lines(report):
+        print(f"  {line}")
+    if not report['success']:
         return
-    print(f"SUCCESS: Generated comparison table with {table_result['rows']} rows")
     
     print("\nPipeline completed successfully!")
     print("Files generated:")
     print("- column_mapping.json (column number -> longName, shortName)")
     print("- improved_column_comparison.csv (spreadsheet format)")
     print("- improved_column_comparison.md (markdown format)")
+    print(f"- {args.metrics} (per-stage metrics)")
     print("=" * 60)
 
 if __name__ == "__main__":
@@ -0,0 +1,492 @@
+#!/usr/bin/env python3
+"""
+Anthropic-Compatible LLM Stand-In
+A local Messages API server, so the LLM-bound stages (llm_abbreviate_headers,
+get_llm_analysis, step_3_llm_analysis) can be measured without the network.
+Point a pipeline at it with ANTHROPIC_BASE_URL=http://127.0.0.1:<port>.
+1. record: forward each POST /v1/messages to the real API and append the
+   request / response pair and its latency to a JSONL cassette
+2. replay: answer from the cassette by a hash of the request body; repeats of
+   the same request get its recordings in recorded order, unknown requests a 404
+3. synthetic: no cassette; numbered header lines ("12: ...") are answered with
+   snake_cased names, anything else with --reply. System blocks marked
+   cache_control report a cache write the first time and cache reads after that
+4. Message Batches: POST /v1/messages/batches answers every request at once the
+   way the mode answers /v1/messages, and reports the batch in progress for
+   --batch-seconds; GET /v1/messages/batches/<id> and .../<id>/results follow
+Faults apply in every mode: a fixed latency plus jitter (in replay, plus the
+recorded latency times --latency-scale), a share of error responses (529
+overloaded by default), random 429s, and a requests-per-minute window that
+answers 429 with retry-after and anthropic-ratelimit-* headers. Inside a
+message batch the error share marks individual requests errored.
+GET /stats returns the request and fault counters.
+Example: python llm_standin.py replay --cassette .cache/llm_cassette.jsonl --latency 0.8 --rate-limit-rate 0.05
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter, deque
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+from header_abbreviation import DEFAULT_MAX_LENGTH, snake_case
+from request_scheduler import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+MODES = ('record', 'replay', 'synthetic')
+DEFAULT_PORT = 8765
+DEFAULT_UPSTREAM = 'https://api.anthropic.com'
+DEFAULT_CASSETTE = os.path.join('.cache', 'llm_cassette.jsonl')
+MESSAGES_PATH = '/v1/messages'
+BATCHES_PATH = '/v1/messages/batches'
+BATCH_EXPIRY_SECONDS = 24 * 3600
+
+ERROR_TYPES = {400: 'invalid_request_error', 404: 'not_found_error', 429: 'rate_limit_error',
+               500: 'api_error', 503: 'api_error', 529: 'overloaded_error'}
+FORWARDED_HEADERS = ('x-api-key', 'authorization', 'anthropic-version', 'anthropic-beta', 'content-type')
+RETURNED_HEADER_PREFIXES = ('retry-after', 'anthropic-ratelimit-', 'request-id')
+VOLATILE_FIELDS = ('metadata', 'stream')  # Not part of what the model is asked
+HEADER_LINE = re.compile(r'^\s*(\d+): (.+)$', re.M)
+
+Reply = Tuple[int, Dict[str, str], Dict[str, Any]]  # status, extra headers, JSON body
+Answer = Tuple[int, Dict[str, str], Dict[str, Any], float]  # Reply plus the seconds to wait before sending it
+
+
+def request_key(body: Dict[str, Any]) -> str:
+    """Hash of the request fields that determine the answer"""
+    stable = {name: value for name, value in body.items() if name not in VOLATILE_FIELDS}
+    return hashlib.sha256(json.dumps(stable, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def error_body(status: int, message: str) -> Dict[str, Any]:
+    """Error payload in the Messages API format"""
+    return {'type': 'error', 'error': {'type': ERROR_TYPES.get(status, 'api_error'), 'message': message}}
+
+
+def _timestamp(seconds: float) -> str:
+    return datetime.fromtimestamp(seconds, timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+def _text(content: Union[str, List[Dict[str, Any]], None]) -> str:
+    if isinstance(content, str):
+        return content
+    return ''.join(block.get('text', '') for block in content or [] if isinstance(block, dict))
+
+
+class Cassette:
+    """Recorded request / response pairs, one JSON object per line"""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.recordings: Dict[str, List[Dict[str, Any]]] = {}
+        self.served: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+        if self.path.exists():
+            with open(self.path, encoding='utf-8') as f:
+                for line_number, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        logger.warning(f"Skipping unreadable cassette line {line_number} in {self.path}")
+                        continue
+                    self.recordings.setdefault(entry['key'], []).append(entry)
+        logger.info(f"Cassette {self.path}: {len(self)} recordings of {len(self.recordings)} distinct requests")
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self.recordings.values())
+
+    def next_for(self, key: str) -> Optional[Dict[str, Any]]:
+        """The next recording of this request; the last one repeats once they run out"""
+        with self._lock:
+            entries = self.recordings.get(key)
+            if not entries:
+                return None
+            index = self.served.get(key, 0)
+            self.served[key] = index + 1
+            return entries[min(index, len(entries) - 1)]
+
+    def append(self, entry: Dict[str, Any]):
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self.recordings.setdefault(entry['key'], []).append(entry)
+
+
+class FaultInjector:
+    """Latency, error and rate-limit injection, seeded so a run can be repeated"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, latency_scale: float = 0.0,
+                 error_rate: float = 0.0, error_status: int = 529, rate_limit_rate: float = 0.0,
+                 retry_after: float = 1.0, requests_per_minute: Optional[int] = None, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.latency_scale = latency_scale  # Multiplies the recorded latency in replay mode
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.requests_per_minute = requests_per_minute
+        self.random = random.Random(seed)
+        self._window: deque = deque()  # Admission times within the last minute
+        self._lock = threading.Lock()
+
+    def delay(self, recorded_latency: float = 0.0) -> float:
+        """Seconds to wait before answering"""
+        with self._lock:
+            jitter = self.random.uniform(0, self.jitter) if self.jitter else 0.0
+        return self.latency + jitter + recorded_latency * self.latency_scale
+
+    def _limit_headers(self, now: float) -> Dict[str, str]:
+        reset = self._window[0] + 60 if self._window else now
+        return {
+            'anthropic-ratelimit-requests-limit': str(self.requests_per_minute),
+            'anthropic-ratelimit-requests-remaining': str(max(0, self.requests_per_minute - len(self._window))),
+            'anthropic-ratelimit-requests-reset': _timestamp(reset)
+        }
+
+    def admit(self) -> Tuple[Optional[Reply], Dict[str, str]]:
+        """(injected failure or None, rate-limit headers for the reply)"""
+        with self._lock:
+            now = time.time()
+            headers: Dict[str, str] = {}
+            if self.requests_per_minute:
+                while self._window and now - self._window[0] >= 60:
+                    self._window.popleft()
+                if len(self._window) >= self.requests_per_minute:
+                    headers = self._limit_headers(now)
+                    headers['retry-after'] = str(max(1, math.ceil(self._window[0] + 60 - now)))
+                    message = f"Stand-in limit of {self.requests_per_minute} requests per minute reached"
+                    return (429, headers, error_body(429, message)), headers
+                self._window.append(now)
+                headers = self._limit_headers(now)
+
+            roll = self.random.random()
+            if roll < self.rate_limit_rate:
+                fault_headers = dict(headers, **{'retry-after': f"{self.retry_after:g}"})
+                return (429, fault_headers, error_body(429, "Injected rate limit")), headers
+            if roll < self.rate_limit_rate + self.error_rate:
+                return (self.error_status, {}, error_body(self.error_status, "Injected error")), headers
+        return None, headers
+
+    def batch_error(self) -> Optional[Dict[str, Any]]:
+        """Injected error for one request inside a message batch, or None"""
+        with self._lock:
+            if self.random.random() < self.error_rate:
+                return error_body(self.error_status, "Injected error")
+        return None
+
+
+class LLMStandIn:
+    """The stand-in's request handling; start() serves it on a background thread"""
+
+    def __init__(self, mode: str = 'synthetic', cassette: Union[str, Path] = DEFAULT_CASSETTE,
+                 faults: Optional[FaultInjector] = None, upstream: str = DEFAULT_UPSTREAM, reply: str = '{}',
+                 timeout: float = 600.0, batch_seconds: float = 0.0):
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode '{mode}' (expected one of {', '.join(MODES)})")
+        self.mode = mode
+        self.cassette = Cassette(cassette) if mode != 'synthetic' else None
+        if mode == 'replay' and not len(self.cassette):
+            logger.warning(f"Replaying from an empty cassette ({cassette}): every request will miss")
+        self.faults = faults or FaultInjector()
+        self.upstream = upstream.rstrip('/')
+        self.reply = reply
+        self.timeout = timeout
+        self.batch_seconds = batch_seconds  # How long a message batch reports in_progress
+        self.stats: Counter = Counter()
+        self.base_url: Optional[str] = None
+        self._cached_prefixes = set()
+        self._batches: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def handle(self, path: str, raw: bytes, headers) -> Reply:
+        """Answer one POST request"""
+        self._count('requests')
+        route = urlsplit(path).path.rstrip('/')
+        if route not in (MESSAGES_PATH, BATCHES_PATH):
+            return 404, {}, error_body(404, f"The stand-in only serves POST {MESSAGES_PATH} and {BATCHES_PATH}")
+        try:
+            body = json.loads(raw)
+        except ValueError as e:
+            return 400, {}, error_body(400, f"Request body is not JSON: {e}")
+
+        fault, limit_headers = self.faults.admit()
+        if fault is not None:
+            self._count('rate_limited' if fault[0] == 429 else 'errors')
+            return fault
+
+        if route == BATCHES_PATH:
+            return self.create_batch(body, headers, limit_headers)
+
+        status, returned, payload, delay = self.answer(body, raw, headers, path)
+        time.sleep(delay)
+        return status, dict(limit_headers, **returned), payload
+
+    def answer(self, body: Dict[str, Any], raw: bytes, headers, path: str = MESSAGES_PATH) -> Answer:
+        """One Messages API request answered the way the mode says"""
+        key = request_key(body)
+        if self.mode == 'record':
+            status, returned, payload, latency = self._forward(path, raw, headers)
+            if status == 200:
+                self.cassette.append({'key': key, 'request': body, 'status': status, 'response': payload,
+                                      'latency_seconds': round(latency, 3),
+                                      'recorded_at': datetime.now(timezone.utc).isoformat()})
+                self._count('recorded')
+            else:
+                self._count('upstream_errors')
+            return status, returned, payload, self.faults.delay()
+
+        if self.mode == 'replay':
+            entry = self.cassette.next_for(key)
+            if entry is None:
+                self._count('misses')
+                message = f"No recording of request {key[:12]} (model {body.get('model')})"
+                return 404, {}, error_body(404, message), 0.0
+            self._count('replayed')
+            return entry.get('status', 200), {}, entry['response'], self.faults.delay(entry.get('latency_seconds', 0.0))
+
+        self._count('synthetic')
+        return 200, {}, self.synthetic_response(body), self.faults.delay()
+
+    def create_batch(self, body: Dict[str, Any], headers, limit_headers: Dict[str, str]) -> Reply:
+        """POST /v1/messages/batches: answer every request now, release the results after batch_seconds"""
+        requests = body.get('requests')
+        if not isinstance(requests, list) or not requests:
+            return 400, {}, error_body(400, "requests must be a non-empty list")
+
+        results = []
+        for request in requests:
+            params = request.get('params') or {}
+            error = self.faults.batch_error()
+            if error is None:
+                status, _, payload, _ = self.answer(params, json.dumps(params).encode('utf-8'), headers)
+                error = None if status == 200 else payload
+            result = {'type': 'errored', 'error': error} if error else {'type': 'succeeded', 'message': payload}
+            results.append({'custom_id': request.get('custom_id'), 'result': result})
+
+        with self._lock:
+            self.stats['batches'] += 1
+            batch_id = f"msgbatch_standin_{self.stats['batches']:06d}"
+            self._batches[batch_id] = {'created': time.time(), 'results': results}
+        logger.info(f"Created {batch_id} with {len(results)} requests")
+        return 200, limit_headers, self.batch_object(batch_id)
+
+    def batch_object(self, batch_id: str) -> Dict[str, Any]:
+        """The MessageBatch resource: in_progress for batch_seconds after creation, then ended"""
+        batch = self._batches[batch_id]
+        ends = batch['created'] + self.batch_seconds
+        ended = time.time() >= ends
+        counts = Counter(entry['result']['type'] for entry in batch['results']) if ended else Counter()
+        return {
+            'id': batch_id, 'type': 'message_batch',
+            'processing_status': 'ended' if ended else 'in_progress',
+            'request_counts': {'processing': 0 if ended else len(batch['results']), 'succeeded': counts['succeeded'],
+                               'errored': counts['errored'], 'canceled': 0, 'expired': 0},
+            'created_at': _timestamp(batch['created']), 'ended_at': _timestamp(ends) if ended else None,
+            'expires_at': _timestamp(batch['created'] + BATCH_EXPIRY_SECONDS),
+            'archived_at': None, 'cancel_initiated_at': None,
+            'results_url': f"{self.base_url}{BATCHES_PATH}/{batch_id}/results" if ended else None
+        }
+
+    def handle_get(self, path: str) -> Tuple[int, Union[Dict[str, Any], List[Dict[str, Any]]]]:
+        """Answer one GET request; a list is sent as JSON lines"""
+        route = urlsplit(path).path.rstrip('/')
+        if route == '/stats':
+            return 200, dict(self.stats, mode=self.mode)
+        if not route.startswith(BATCHES_PATH + '/'):
+            return 404, error_body(404, f"Only GET /stats and {BATCHES_PATH}/<id>[/results] are served")
+
+        batch_id, _, tail = route[len(BATCHES_PATH) + 1:].partition('/')
+        if batch_id not in self._batches or tail not in ('', 'results'):
+            return 404, error_body(404, f"No message batch {batch_id}")
+        batch = self.batch_object(batch_id)
+        if not tail:
+            return 200, batch
+        if batch['processing_status'] != 'ended':
+            return 400, error_body(400, f"Batch {batch_id} is still {batch['processing_status']}")
+        return 200, self._batches[batch_id]['results']
+
+    def _forward(self, path: str, raw: bytes, headers) -> Tuple[int, Dict[str, str], Dict[str, Any], float]:
+        """Send the request on to the real API: (status, headers to pass back, body, latency)"""
+        request = urllib.request.Request(self.upstream + path, data=raw, method='POST', headers={
+            name: headers[name] for name in FORWARDED_HEADERS if headers.get(name)
+        })
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                status, response_headers, content = response.status, response.headers, response.read()
+        except urllib.error.HTTPError as e:
+            status, response_headers, content = e.code, e.headers, e.read()
+        except urllib.error.URLError as e:
+            logger.error(f"Upstream {self.upstream} unreachable: {e.reason}")
+            return 500, {}, error_body(500, f"Upstream unreachable: {e.reason}"), time.perf_counter() - started
+        latency = time.perf_counter() - started
+
+        returned = {name: value for name, value in response_headers.items()
+                    if name.lower().startswith(RETURNED_HEADER_PREFIXES)}
+        try:
+            payload = json.loads(content)
+        except ValueError:
+            return 500, returned, error_body(500, f"Upstream returned non-JSON ({status})"), latency
+        return status, returned, payload, latency
+
+    def synthetic_response(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """A Messages API reply made up locally, with plausible token usage"""
+        prompt = ''.join(_text(message.get('content')) for message in body.get('messages', [])
+                         if message.get('role') == 'user')
+        numbered = HEADER_LINE.findall(prompt)
+        if numbered:
+            text = json.dumps({col: snake_case(header)[:DEFAULT_MAX_LENGTH] or f"col_{col}" for col, header in numbered})
+        else:
+            text = self.reply
+
+        system = body.get('system')
+        system_text = _text(system)
+        usage = {'input_tokens': estimate_tokens(prompt), 'cache_creation_input_tokens': 0,
+                 'cache_read_input_tokens': 0, 'output_tokens': estimate_tokens(text)}
+        if isinstance(system, list) and any('cache_control' in block for block in system):
+            prefix = hashlib.sha256(system_text.encode('utf-8')).hexdigest()
+            with self._lock:
+                cached = prefix in self._cached_prefixes
+                self._cached_prefixes.add(prefix)
+            usage['cache_read_input_tokens' if cached else 'cache_creation_input_tokens'] = estimate_tokens(system_text)
+        else:
+            usage['input_tokens'] += estimate_tokens(system_text)
+
+        return {'id': f"msg_standin_{self.stats['synthetic']:06d}", 'type': 'message', 'role': 'assistant',
+                'model': body.get('model'), 'content': [{'type': 'text', 'text': text}],
+                'stop_reason': 'end_turn', 'stop_sequence': None, 'usage': usage}
+
+    def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """Serve on a daemon thread (port 0 picks a free port); returns the base URL"""
+        self._server = ThreadingHTTPServer((host, port), StandInHandler)
+        self._server.daemon_threads = True
+        self._server.standin = self
+        self._thread = threading.Thread(target=self._server.serve_forever, name='llm-standin', daemon=True)
+        self._thread.start()
+        self.base_url = f"http://{host}:{self._server.server_address[1]}"
+        logger.info(f"LLM stand-in ({self.mode}) listening on {self.base_url}")
+        return self.base_url
+
+    def wait(self):
+        """Block until the server stops (Ctrl-C returns)"""
+        try:
+            while self._thread is not None and self._thread.is_alive():
+                self._thread.join(0.5)
+        except KeyboardInterrupt:
+            pass
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> 'LLMStandIn':
+        if self._server is None:
+            self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, as the SDK's connection pool expects
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def _send(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        content = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        status, payload = self.server.standin.handle_get(self.path)
+        if isinstance(payload, list):
+            content = ''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/binary')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        else:
+            self._send(status, payload)
+
+    def do_POST(self):
+        raw = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        status, headers, payload = self.server.standin.handle(self.path, raw, self.headers)
+        self._send(status, payload, headers)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Local Anthropic Messages API stand-in (record / replay / synthetic)")
+    parser.add_argument('mode', choices=MODES)
+    parser.add_argument('--cassette', default=DEFAULT_CASSETTE, help="JSONL file of recorded requests")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--upstream', default=DEFAULT_UPSTREAM, help="API to record from")
+    parser.add_argument('--reply', default='{}', help="Synthetic reply to prompts without numbered headers")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every answer")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Up to this many random seconds on top")
+    parser.add_argument('--latency-scale', type=float, default=0.0,
+                        help="Replay: also wait the recorded latency times this factor")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of requests answered with --error-status")
+    parser.add_argument('--error-status', type=int, choices=[500, 503, 529], default=529)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument('--retry-after', type=float, default=1.0, help="retry-after seconds of injected 429s")
+    parser.add_argument('--requests-per-minute', type=int, help="Answer 429 above this many requests per minute")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the latency / fault generator")
+    parser.add_argument('--batch-seconds', type=float, default=0.0,
+                        help="Seconds a message batch stays in_progress before its results are ready")
+    args = parser.parse_args()
+
+    faults = FaultInjector(latency=args.latency, jitter=args.jitter, latency_scale=args.latency_scale,
+                           error_rate=args.error_rate, error_status=args.error_status,
+                           rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+                           requests_per_minute=args.requests_per_minute, seed=args.seed)
+    standin = LLMStandIn(args.mode, cassette=args.cassette, faults=faults, upstream=args.upstream, reply=args.reply,
+                         batch_seconds=args.batch_seconds)
+    base_url = standin.start(args.host, args.port)
+    print(f"export ANTHROPIC_BASE_URL={base_url}")
+
+    try:
+        standin.wait()
+    finally:
+        standin.stop()
+        print(f"Requests: {dict(standin.stats)}")
+
+
+if __name__ == "__main__":
+    main()
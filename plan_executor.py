@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Columnar Transformation Plan Executor
+Applies the executablePlan returned by LLMDataWrangler.get_llm_analysis to a
+WorkingTable column by column, so million-row sheets transform in seconds.
+1. removeRows drops every listed row with one boolean mask (no repeated list.pop)
+2. renameColumns and combineHeaders only touch the header row
+3. dataValidation converts each numeric column with pd.to_numeric(errors='coerce');
+   dictionary-encoded text columns are parsed once per distinct value. Cells that
+   fail keep their value and are summarized per column, not logged per cell
+"""
+
+import logging
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from working_table import WorkingTable
+
+logger = logging.getLogger(__name__)
+
+# Failing values quoted in each column's conversion summary
+MAX_FAILURE_EXAMPLES = 5
+
+
+def rename_columns(header: List[Any], renames: Dict[str, str]) -> int:
+    """Apply {"column index": "new name"} to the header row in place"""
+    renamed = 0
+    for col_idx_str, new_name in renames.items():
+        col_idx = int(col_idx_str)
+        if 0 <= col_idx < len(header):
+            logger.debug(f"Renamed column {col_idx}: '{header[col_idx]}' → '{new_name}'")
+            header[col_idx] = new_name
+            renamed += 1
+    return renamed
+
+
+def combine_headers(header: List[Any], config: Dict[str, Any]) -> int:
+    """Name a matrix question's columns prefix + sub-label, starting at startColumn"""
+    start_col = config.get('startColumn', 2)
+    prefix = config.get('prefix', 'Q_')
+    combined = 0
+    for i, label in enumerate(config.get('subLabels', [])):
+        col_idx = start_col + i
+        if col_idx < len(header):
+            header[col_idx] = f"{prefix}{label}"
+            combined += 1
+    return combined
+
+
+def categorical_to_numeric(column: pd.Series) -> Dict[str, Any]:
+    """to_numeric_column for a categorical: parse each distinct value once, then map the codes"""
+    categories = pd.Series(column.cat.categories)
+    # Code -1 (missing) indexes the appended NaN / blank entry
+    numbers = np.append(pd.to_numeric(categories, errors='coerce').to_numpy(dtype='float64', na_value=np.nan), np.nan)
+    blank = np.append(categories.astype(str).str.strip().eq('').to_numpy(dtype=bool), True)
+
+    codes = column.cat.codes.to_numpy()
+    values = numbers[codes]
+    converted = ~np.isnan(values)
+    failed = ~converted & ~blank[codes]
+
+    if failed.any():
+        # Stay dictionary-encoded: numeric categories become floats, the rest keep their text
+        mapped = categories.where(np.isnan(numbers[:-1]), numbers[:-1]).where(~blank[:-1], np.nan)
+        mapped_codes, uniques = pd.factorize(mapped.astype(object))
+        result = pd.Series(pd.Categorical.from_codes(np.append(mapped_codes, -1)[codes], categories=uniques))
+    else:
+        result = pd.Series(values)
+
+    return {'column': result, 'converted': int(converted.sum()), 'failed': int(failed.sum()),
+            'examples': categories.iloc[np.unique(codes[failed])[:MAX_FAILURE_EXAMPLES]].tolist()}
+
+
+def to_numeric_column(column: pd.Series) -> Dict[str, Any]:
+    """Convert one column's non-empty cells to numbers; unconvertible cells keep their value"""
+    if pd.api.types.is_numeric_dtype(column):
+        # Already typed by the working table: nothing to replace
+        return {'column': None, 'converted': int(column.notna().sum()), 'failed': 0, 'examples': []}
+
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return categorical_to_numeric(column)
+
+    # to_numeric parses numbers and numeric text (surrounding spaces included) in C;
+    # blanks come back NaN, so only the few unparsed cells are stringified
+    numbers = pd.to_numeric(column, errors='coerce')
+    converted = numbers.notna()
+
+    leftover = column[~converted].dropna()
+    failed = leftover[leftover.astype(str).str.strip().ne('')]
+
+    result = column.astype(object).where(~converted, numbers) if len(failed) else numbers
+
+    return {'column': result, 'converted': int(converted.sum()), 'failed': len(failed),
+            'examples': pd.unique(failed)[:MAX_FAILURE_EXAMPLES].tolist()}
+
+
+def execute_plan(table: WorkingTable, plan: Dict[str, Any]) -> Dict[str, Any]:
+    """Run an executablePlan; the top row left after removeRows becomes the header"""
+    results = []
+
+    if plan.get('removeRows'):
+        before = len(table)
+        table = table.drop_rows(plan['removeRows'])
+        logger.info(f"Removed {before - len(table)} of {len(plan['removeRows'])} listed rows")
+        results.append(f"Removed {len(plan['removeRows'])} header rows")
+
+    if not len(table):
+        return {'table': table, 'results': results, 'numeric_columns': {}}
+
+    table = table.single_header()
+    header = table.header
+
+    if plan.get('renameColumns'):
+        renamed = rename_columns(header, plan['renameColumns'])
+        logger.info(f"Renamed {renamed} columns")
+        results.append(f"Renamed {len(plan['renameColumns'])} columns")
+
+    combine = plan.get('combineHeaders') or {}
+    if combine.get('enabled') and 'subLabels' in combine:
+        combined = combine_headers(header, combine)
+        logger.info(f"Combined {combined} headers from column {combine.get('startColumn', 2)}")
+        results.append(f"Combined {combined} headers")
+
+    numeric_columns = {}
+    replacements = {}
+    validation = plan.get('dataValidation') or {}
+    if 'numericColumns' in validation:
+        converted_values = 0
+        validation_issues = 0
+        for col_idx in validation['numericColumns']:
+            if not 0 <= col_idx < table.width:
+                continue
+            outcome = to_numeric_column(table.column(col_idx))
+            values = outcome.pop('column')
+            if values is not None:
+                replacements[col_idx] = values
+            numeric_columns[col_idx] = outcome
+            converted_values += outcome['converted']
+            validation_issues += outcome['failed']
+            if outcome['failed']:
+                logger.warning(f"Column {col_idx} ('{header[col_idx]}'): {outcome['failed']} values could not be "
+                               f"converted to numeric, e.g. {outcome['examples']}")
+
+        results.append(f"Converted {converted_values} values to numeric, {validation_issues} validation issues")
+
+    table = table.with_columns(replacements).with_header(header)
+    return {'table': table, 'results': results, 'numeric_columns': numeric_columns}
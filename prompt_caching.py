@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Prompt Caching Helpers
+The abbreviation prompts send the same system block on every batch (rules,
+naming conventions and a worked example, about 1.1-1.9k tokens) and only the
+headers in the user message, so the system block is a stable prefix.
+1. cached_system() marks the instruction block with cache_control once it
+   clears the API's minimum cacheable prefix (1024 tokens for Opus/Sonnet);
+   below that a marker has no effect, so none is sent
+2. usage_stats() records cached vs uncached input tokens for every call
+The structure analysis prompt is sent once per file, so it is not marked.
+"""
+
+from typing import Any, Dict, List
+
+from request_scheduler import estimate_tokens
+
+CACHE_CONTROL = {'type': 'ephemeral'}
+MIN_CACHEABLE_TOKENS = 1024
+
+
+def cached_system(instructions: str, min_tokens: int = MIN_CACHEABLE_TOKENS) -> List[Dict[str, Any]]:
+    """System prompt blocks; the instructions are marked for caching only when long enough to be cached"""
+    block = {'type': 'text', 'text': instructions}
+    if estimate_tokens(instructions) >= min_tokens:
+        block['cache_control'] = CACHE_CONTROL
+    return [block]
+
+
+def usage_stats(response) -> Dict[str, int]:
+    """Input/output token counts of a Messages API response, split by cache status
+
+    input_tokens is the uncached part; cache_creation_input_tokens were written to
+    the cache on this call and cache_read_input_tokens were served from it.
+    """
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return {}
+    stats = {
+        'input_tokens': usage.input_tokens,
+        'cache_creation_input_tokens': getattr(usage, 'cache_creation_input_tokens', None) or 0,
+        'cache_read_input_tokens': getattr(usage, 'cache_read_input_tokens', None) or 0,
+        'output_tokens': usage.output_tokens
+    }
+    stats['total_input_tokens'] = (stats['input_tokens'] + stats['cache_creation_input_tokens']
+                                   + stats['cache_read_input_tokens'])
+    return stats
@@ -12,6 +12,13 @@ import os
 from typing import Dict, List, Any
 import logging
 from dotenv import load_dotenv
+from cell_normalization import frame_from_rows, normalize_sheet
+from columnar_export import type_columns, unique_column_names, write_columnar
+from excel_loader import open_sheet
+from plan_executor import execute_plan
+from prompt_caching import usage_stats
+from request_scheduler import PRIORITY_ANALYSIS, estimate_tokens, get_scheduler
+from working_table import WorkingTable
 
 # Load environment variables
 load_dotenv()
@@ -20,9 +27,59 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+ANALYSIS_INSTRUCTIONS = """# Data Structure Analysis for Survey Data Wrangling
+
+You are analyzing survey data to create an EXECUTABLE cleaning plan with specific instructions.
+The data sample and analysis parameters are in the user message.
+
+## Your Task:
+Return a JSON object with EXECUTABLE cleaning instructions:
+
+{
+  "headerAnalysis": {
+    "headerRows": [array of row indexes that are headers],
+    "dataStartRow": number,
+    "explanation": "brief explanation"
+  },
+  "executablePlan": {
+    "removeRows": [array of row indexes to remove],
+    "renameColumns": {
+      "0": "new_name_for_column_0",
+      "1": "new_name_for_column_1"
+    },
+    "combineHeaders": {
+      "enabled": true/false,
+      "startColumn": number,
+      "endColumn": number,
+      "prefix": "prefix_for_combined_headers",
+      "questionText": "main question text",
+      "subLabels": ["array", "of", "sublabels"]
+    },
+    "dataValidation": {
+      "numericColumns": [array of column indexes that should be numeric],
+      "expectedRange": {"min": 1, "max": 5},
+      "missingValueHandling": "strategy"
+    }
+  },
+  "matrixQuestions": {
+    "detected": true/false,
+    "count": number,
+    "details": [array of matrix question objects]
+  },
+  "qualityAssessment": {
+    "completeness": "percentage or assessment",
+    "issues": ["array of issues found"],
+    "recommendations": ["array of recommendations"]
+  }
+}
+
+CRITICAL: Return ONLY valid JSON. No markdown formatting, no explanatory text, just the JSON object."""
+
+
 class LLMDataWrangler:
     def __init__(self, api_key: str):
-        self.anthropic = Anthropic(api_key=api_key)
+        # Retries and rate limiting are handled by the shared request scheduler
+        self.anthropic = Anthropic(api_key=api_key, max_retries=0)
         self.original_data = None
         self.working_data = None
         self.transformation_log = []
@@ -31,23 +88,18 @@ class LLMDataWrangler:
         """Load actual Excel data from the project"""
         try:
             logger.info(f"Loading Excel file: {file_path}")
-            df = pd.read_excel(file_path, header=None)
             
-            # Convert DataFrame to list of lists
-            self.original_data = df.values.tolist()
+            with open_sheet(file_path) as stream:
+                frame = frame_from_rows(stream.rows())
             
-            # Replace NaN values with empty strings
-            for row in self.original_data:
-                for i, cell in enumerate(row):
-                    if pd.isna(cell):
-                        row[i] = ''
-                    else:
-                        row[i] = str(cell)
+            # Header rows become strings; data rows keep their numeric/datetime values
+            headers, data = normalize_sheet(frame)
+            self.original_data = WorkingTable.from_sheet(headers, data)
             
-            self.working_data = [row[:] for row in self.original_data]  # Deep copy
-            logger.info(f"Loaded Excel data: {len(self.original_data)} rows, {len(self.original_data[0])} columns")
+            self.working_data = self.original_data.copy()  # Copy-on-write: shares the column arrays
+            logger.info(f"Loaded Excel data: {len(self.original_data)} rows, {self.original_data.width} columns")
             
-            return {'success': True, 'rows': len(self.original_data), 'columns': len(self.original_data[0])}
+            return {'success': True, 'rows': len(self.original_data), 'columns': self.original_data.width}
             
         except Exception as e:
             logger.error(f"Failed to load Excel file: {e}")
@@ -60,7 +112,7 @@ class LLMDataWrangler:
         sample_data = []
         max_sample_cols = 20  # Limit columns for LLM analysis
         
-        for i, row in enumerate(self.working_data[:5]):
+        for i, row in enumerate(self.working_data.head(5)):
             # Take first 20 columns + sample of remaining columns to show structure
             if len(row) > max_sample_cols:
                 sample_row = row[:max_sample_cols] + ['...'] + row[-3:] if len(row) > max_sample_cols + 3 else row[:max_sample_cols]
@@ -74,77 +126,40 @@ class LLMDataWrangler:
             for i, row in enumerate(sample_data)
         ])
         
-        prompt = f"""# Data Structure Analysis for Survey Data Wrangling
-
-You are analyzing survey data to create an EXECUTABLE cleaning plan with specific instructions.
-
-## Data Sample (first 5 rows):
+        prompt = f"""## Data Sample (first 5 rows):
 {data_sample}
 
 ## Analysis Parameters:
 - Total rows: {len(self.working_data)}
-- Total columns: {len(self.working_data[0]) if self.working_data else 0}
-
-## Your Task:
-Return a JSON object with EXECUTABLE cleaning instructions:
-
-{{
-  "headerAnalysis": {{
-    "headerRows": [array of row indexes that are headers],
-    "dataStartRow": number,
-    "explanation": "brief explanation"
-  }},
-  "executablePlan": {{
-    "removeRows": [array of row indexes to remove],
-    "renameColumns": {{
-      "0": "new_name_for_column_0",
-      "1": "new_name_for_column_1"
-    }},
-    "combineHeaders": {{
-      "enabled": true/false,
-      "startColumn": number,
-      "endColumn": number,
-      "prefix": "prefix_for_combined_headers",
-      "questionText": "main question text",
-      "subLabels": ["array", "of", "sublabels"]
-    }},
-    "dataValidation": {{
-      "numericColumns": [array of column indexes that should be numeric],
-      "expectedRange": {{"min": 1, "max": 5}},
-      "missingValueHandling": "strategy"
-    }}
-  }},
-  "matrixQuestions": {{
-    "detected": true/false,
-    "count": number,
-    "details": [array of matrix question objects]
-  }},
-  "qualityAssessment": {{
-    "completeness": "percentage or assessment",
-    "issues": ["array of issues found"],
-    "recommendations": ["array of recommendations"]
-  }}
-}}
-
-CRITICAL: Return ONLY valid JSON. No markdown formatting, no explanatory text, just the JSON object."""
+- Total columns: {self.working_data.width}"""
 
         for attempt in range(max_retries):
             try:
                 logger.info(f"Sending analysis request to Claude (attempt {attempt + 1})")
-                logger.info(f"Prompt length: {len(prompt)} characters")
+                logger.info(f"Prompt length: {len(ANALYSIS_INSTRUCTIONS) + len(prompt)} characters "
+                            f"({len(ANALYSIS_INSTRUCTIONS)} static instructions)")
                 
-                response = self.anthropic.messages.create(
-                    model="claude-opus-4-1-20250805",
-                    max_tokens=4000,
-                    temperature=0.2,
-                    messages=[{
-                        "role": "user",
-                        "content": prompt
-                    }]
+                response = get_scheduler().call(
+                    lambda: self.anthropic.messages.create(
+                        model="claude-opus-4-1-20250805",
+                        max_tokens=4000,
+                        temperature=0.2,
+                        system=ANALYSIS_INSTRUCTIONS,
+                        messages=[{
+                            "role": "user",
+                            "content": prompt
+                        }]
+                    ),
+                    priority=PRIORITY_ANALYSIS,
+                    tokens=estimate_tokens(ANALYSIS_INSTRUCTIONS + prompt),
+                    label="Structure analysis"
                 )
                 
                 response_text = response.content[0].text.strip()
-                logger.info(f"Received response: {len(response_text)} characters")
+                usage = usage_stats(response)
+                logger.info(f"Received response: {len(response_text)} characters "
+                            f"(input tokens: {usage.get('input_tokens')} uncached, "
+                            f"{usage.get('cache_read_input_tokens')} cached)")
                 
                 # Try to parse JSON
                 try:
@@ -160,7 +175,8 @@ CRITICAL: Return ONLY valid JSON. No markdown formatting, no explanatory text, j
                         'success': True,
                         'analysis': analysis,
                         'raw_response': response_text[:500] + '...' if len(response_text) > 500 else response_text,
-                        'prompt_length': len(prompt)
+                        'prompt_length': len(ANALYSIS_INSTRUCTIONS) + len(prompt),
+                        'usage': usage
                     }
                     
                 except json.JSONDecodeError as e:
@@ -174,12 +190,12 @@ CRITICAL: Return ONLY valid JSON. No markdown formatting, no explanatory text, j
                         }
                         
             except Exception as e:
+                # The scheduler has already retried transient errors; only bad JSON is retried here
                 logger.error(f"API call failed (attempt {attempt + 1}): {e}")
-                if attempt == max_retries - 1:
-                    return {
-                        'success': False,
-                        'error': f'API call failed after {max_retries} attempts: {str(e)}'
-                    }
+                return {
+                    'success': False,
+                    'error': f'API call failed: {str(e)}'
+                }
                     
         return {'success': False, 'error': 'Unexpected error in LLM analysis'}
     
@@ -196,71 +212,10 @@ CRITICAL: Return ONLY valid JSON. No markdown formatting, no explanatory text, j
             try:
                 logger.info(f"Applying transformation plan (attempt {attempt + 1})")
                 
-                # Step 1: Remove header rows
-                if 'removeRows' in executable_plan and executable_plan['removeRows']:
-                    rows_to_remove = sorted(executable_plan['removeRows'], reverse=True)
-                    for row_idx in rows_to_remove:
-                        if 0 <= row_idx < len(self.working_data):
-                            removed_row = self.working_data.pop(row_idx)
-                            logger.info(f"Removed row {row_idx}: {removed_row[:3]}...")
-                    transformation_results.append(f"Removed {len(rows_to_remove)} header rows")
-                
-                # Step 2: Rename columns
-                if 'renameColumns' in executable_plan and executable_plan['renameColumns']:
-                    if self.working_data:
-                        for col_idx_str, new_name in executable_plan['renameColumns'].items():
-                            col_idx = int(col_idx_str)
-                            if 0 <= col_idx < len(self.working_data[0]):
-                                old_name = self.working_data[0][col_idx]
-                                self.working_data[0][col_idx] = new_name
-                                logger.info(f"Renamed column {col_idx}: '{old_name}' → '{new_name}'")
-                        transformation_results.append(f"Renamed {len(executable_plan['renameColumns'])} columns")
-                
-                # Step 3: Combine headers
-                if ('combineHeaders' in executable_plan and 
-                    executable_plan['combineHeaders'].get('enabled') and
-                    'subLabels' in executable_plan['combineHeaders']):
-                    
-                    config = executable_plan['combineHeaders']
-                    if self.working_data:
-                        start_col = config.get('startColumn', 2)
-                        sub_labels = config.get('subLabels', [])
-                        prefix = config.get('prefix', 'Q_')
-                        
-                        combined_count = 0
-                        for i, label in enumerate(sub_labels):
-                            col_idx = start_col + i
-                            if col_idx < len(self.working_data[0]):
-                                new_header = f"{prefix}{label}"
-                                old_header = self.working_data[0][col_idx]
-                                self.working_data[0][col_idx] = new_header
-                                logger.info(f"Combined header at column {col_idx}: '{old_header}' → '{new_header}'")
-                                combined_count += 1
-                        
-                        transformation_results.append(f"Combined {combined_count} headers")
-                
-                # Step 4: Data type validation
-                if ('dataValidation' in executable_plan and 
-                    'numericColumns' in executable_plan['dataValidation']):
-                    
-                    numeric_cols = executable_plan['dataValidation']['numericColumns']
-                    validation_issues = 0
-                    converted_values = 0
-                    
-                    for row_idx in range(1, len(self.working_data)):  # Skip header row
-                        for col_idx in numeric_cols:
-                            if col_idx < len(self.working_data[row_idx]):
-                                value = self.working_data[row_idx][col_idx]
-                                try:
-                                    if value and str(value).strip():
-                                        numeric_value = float(str(value).strip())
-                                        self.working_data[row_idx][col_idx] = numeric_value
-                                        converted_values += 1
-                                except (ValueError, TypeError):
-                                    validation_issues += 1
-                                    logger.warning(f"Could not convert '{value}' to numeric at row {row_idx}, col {col_idx}")
-                    
-                    transformation_results.append(f"Converted {converted_values} values to numeric, {validation_issues} validation issues")
+                # Columnar pass: row masks, header edits and per-column numeric conversion
+                outcome = execute_plan(self.working_data, executable_plan)
+                transformation_results = outcome['results']
+                self.working_data = outcome['table']
                 
                 # Success!
                 logger.info("SUCCESS: Transformation completed successfully")
@@ -268,8 +223,9 @@ CRITICAL: Return ONLY valid JSON. No markdown formatting, no explanatory text, j
                     'success': True,
                     'transformed_data': self.working_data,
                     'transformation_results': transformation_results,
+                    'numeric_columns': outcome['numeric_columns'],
                     'rows_processed': len(self.working_data) - 1,  # Exclude header
-                    'columns_processed': len(self.working_data[0]) if self.working_data else 0,
+                    'columns_processed': self.working_data.width,
                     'attempt_used': attempt + 1
                 }
                 
@@ -287,7 +243,7 @@ CRITICAL: Return ONLY valid JSON. No markdown formatting, no explanatory text, j
     def export_to_csv(self, filename='cleaned_data.csv'):
         """Export cleaned data to CSV"""
         try:
-            df = pd.DataFrame(self.working_data[1:], columns=self.working_data[0])
+            df = self.working_data.data_frame(self.working_data.header)
             df.to_csv(filename, index=False)
             logger.info(f"SUCCESS: Exported cleaned data to {filename}")
             return {'success': True, 'filename': filename, 'rows': len(df), 'columns': len(df.columns)}
@@ -295,15 +251,27 @@ CRITICAL: Return ONLY valid JSON. No markdown formatting, no explanatory text, j
             logger.error(f"CSV export failed: {e}")
             return {'success': False, 'error': str(e)}
     
+    def export_columnar(self, filename='cleaned_data.parquet', row_group_size=None):
+        """Export cleaned data to Parquet (.parquet) or Feather (.feather) with typed columns"""
+        try:
+            names = unique_column_names(self.working_data.header)
+            frame = type_columns(self.working_data.data_frame(names))
+            result = write_columnar(frame, filename, row_group_size=row_group_size)
+            logger.info(f"SUCCESS: Exported cleaned data to {filename}")
+            return {'success': True, **result}
+        except Exception as e:
+            logger.error(f"Columnar export failed: {e}")
+            return {'success': False, 'error': str(e)}
+    
     def print_data_preview(self, title="Data Preview", max_rows=5):
         """Print a preview of the current data"""
         print(f"\n{'='*50}")
         print(f"{title}")
         print(f"{'='*50}")
-        print(f"Shape: {len(self.working_data)} rows × {len(self.working_data[0]) if self.working_data else 0} columns")
+        print(f"Shape: {len(self.working_data)} rows × {self.working_data.width} columns")
         print()
         
-        for i, row in enumerate(self.working_data[:max_rows]):
+        for i, row in enumerate(self.working_data.head(max_rows)):
             row_preview = [str(cell)[:15] + '...' if len(str(cell)) > 15 else str(cell) for cell in row[:5]]
             print(f"Row {i}: {row_preview}")
         
@@ -390,6 +358,16 @@ def main():
     else:
         print(f"ERROR: Export failed: {export_result.get('error', 'Unknown error')}")
     
+    # Step 5: Columnar export for analytics
+    print("\nStep 5: Exporting to Parquet...")
+    columnar_result = wrangler.export_columnar()
+    
+    if columnar_result['success']:
+        print(f"SUCCESS: Exported to {columnar_result['filename']}")
+        print(f"Typed columns: {columnar_result['numeric_columns']} numeric, {columnar_result['categorical_columns']} categorical")
+    else:
+        print(f"ERROR: Columnar export failed: {columnar_result.get('error', 'Unknown error')}")
+    
     print("\nPipeline completed!")
     print("=" * 60)
 
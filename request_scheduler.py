@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Rate-Limit-Aware Scheduler for Anthropic Requests
+Every Messages API call in the Python pipeline goes through one scheduler per
+process, so concurrent stages share the account's limits instead of racing
+into 429s.
+1. Token buckets pace requests per minute and input tokens per minute
+2. Waiting callers are served by priority: structural analysis before abbreviation
+3. A 429 pauses every caller for the server's retry-after (or the rate-limit
+   reset headers) and syncs the buckets to the anthropic-ratelimit-*-remaining
+   headers; overloaded/5xx and connection errors back off exponentially
+4. Call listeners (see add_call_listener) hear about every successful call,
+   e.g. for per-stage LLM metrics
+Limits come from ANTHROPIC_REQUESTS_PER_MINUTE / ANTHROPIC_INPUT_TOKENS_PER_MINUTE.
+Clients used through the scheduler should be created with max_retries=0 so the
+SDK does not retry underneath it.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import anthropic
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_ANALYSIS = 0
+PRIORITY_ABBREVIATION = 10
+
+DEFAULT_REQUESTS_PER_MINUTE = int(os.getenv('ANTHROPIC_REQUESTS_PER_MINUTE', '50'))
+DEFAULT_INPUT_TOKENS_PER_MINUTE = int(os.getenv('ANTHROPIC_INPUT_TOKENS_PER_MINUTE', '30000'))
+DEFAULT_MAX_RETRIES = int(os.getenv('ANTHROPIC_MAX_RETRIES', '6'))
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+CHARS_PER_TOKEN = 4
+
+_default_scheduler = None
+_default_lock = threading.Lock()
+
+# Called as listener(label, latency_seconds, response) on the caller's thread / task
+CallListener = Callable[[str, float, Any], None]
+_call_listeners: List[CallListener] = []
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English survey text)"""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+class TokenBucket:
+    """Continuously refilled allowance of `per_minute` units"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` units are available (0 if they already are)"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float, now: float):
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+
+    def sync(self, remaining: float, now: float):
+        """Never believe we have more allowance than the server reports"""
+        self._refill(now)
+        self.tokens = min(self.tokens, remaining)
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, anthropic.APIConnectionError):
+        return True
+    return isinstance(error, anthropic.APIStatusError) and error.status_code in RETRYABLE_STATUS
+
+
+def _headers(error: Exception):
+    response = getattr(error, 'response', None)
+    return getattr(response, 'headers', None)
+
+
+def _reset_seconds(value: str) -> Optional[float]:
+    """anthropic-ratelimit-*-reset headers are RFC 3339 timestamps"""
+    try:
+        reset = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return max(0.0, (reset - datetime.now(timezone.utc)).total_seconds())
+
+
+def server_retry_delay(error: Exception) -> Optional[float]:
+    """Delay the server asked for, from retry-after(-ms) or the rate-limit reset headers"""
+    headers = _headers(error)
+    if not headers:
+        return None
+
+    for header, scale in (('retry-after-ms', 0.001), ('retry-after', 1.0)):
+        value = headers.get(header)
+        if value:
+            try:
+                return float(value) * scale
+            except ValueError:
+                pass
+
+    resets = [_reset_seconds(headers[name]) for name in (
+        'anthropic-ratelimit-requests-reset',
+        'anthropic-ratelimit-input-tokens-reset',
+        'anthropic-ratelimit-tokens-reset'
+    ) if headers.get(name)]
+    resets = [reset for reset in resets if reset is not None]
+    return max(resets) if resets else None
+
+
+class RequestScheduler:
+    """Shared pacing, prioritisation and retry for Messages API calls"""
+
+    def __init__(self, requests_per_minute: int = DEFAULT_REQUESTS_PER_MINUTE,
+                 input_tokens_per_minute: int = DEFAULT_INPUT_TOKENS_PER_MINUTE,
+                 max_retries: int = DEFAULT_MAX_RETRIES, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.requests = TokenBucket(requests_per_minute)
+        self.input_tokens = TokenBucket(input_tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._condition = threading.Condition()
+        self._waiting = []  # heap of (priority, sequence)
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+        self.stats = {'requests': 0, 'rate_limited': 0, 'retries': 0, 'failed': 0, 'queued_seconds': 0.0}
+
+    def acquire(self, priority: int, tokens: int):
+        """Block until this caller is the highest-priority waiter and the limits allow it"""
+        ticket = (priority, next(self._sequence))
+        started = time.monotonic()
+        with self._condition:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    delay = None  # Not at the head of the queue: wait to be notified
+                    if self._waiting[0] == ticket:
+                        now = time.monotonic()
+                        delay = max(self._paused_until - now,
+                                    self.requests.wait_time(1, now),
+                                    self.input_tokens.wait_time(tokens, now))
+                        if delay <= 0:
+                            self.requests.consume(1, now)
+                            self.input_tokens.consume(tokens, now)
+                            return
+                    self._condition.wait(timeout=delay)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self.stats['queued_seconds'] += time.monotonic() - started
+                self._condition.notify_all()
+
+    def pause(self, seconds: float, headers=None):
+        """Hold every caller back after a 429, syncing the buckets to what the server reports"""
+        with self._condition:
+            now = time.monotonic()
+            self._paused_until = max(self._paused_until, now + seconds)
+            for bucket, header in ((self.requests, 'anthropic-ratelimit-requests-remaining'),
+                                   (self.input_tokens, 'anthropic-ratelimit-input-tokens-remaining')):
+                try:
+                    bucket.sync(float(headers[header]), now)
+                except (KeyError, TypeError, ValueError):
+                    pass
+            self._condition.notify_all()
+
+    def _handle_failure(self, error: Exception, attempt: int, label: str) -> Optional[float]:
+        """Seconds this caller should wait before retrying, or None to give up"""
+        if not is_retryable(error) or attempt >= self.max_retries:
+            self.stats['failed'] += 1
+            return None
+
+        self.stats['retries'] += 1
+        delay = server_retry_delay(error)
+        if delay is None:
+            delay = min(self.max_delay, self.base_delay * 2 ** attempt) * (0.5 + random.random() / 2)
+
+        if getattr(error, 'status_code', None) == 429:
+            self.stats['rate_limited'] += 1
+            self.pause(delay, _headers(error))
+            logger.warning(f"{label}: rate limited, pausing all requests for {delay:.1f}s (attempt {attempt + 1})")
+            return 0.0  # acquire() already waits out the pause
+
+        logger.warning(f"{label}: {error} - retrying in {delay:.1f}s (attempt {attempt + 1})")
+        return delay
+
+    def call(self, request: Callable[[], Any], priority: int = PRIORITY_ANALYSIS, tokens: int = 0,
+             label: str = 'request') -> Any:
+        """Run a synchronous API call under the limits, retrying transient failures"""
+        for attempt in itertools.count():
+            self.acquire(priority, tokens)
+            try:
+                started = time.perf_counter()
+                result = request()
+                self.stats['requests'] += 1
+                _notify_listeners(label, time.perf_counter() - started, result)
+                return result
+            except Exception as e:
+                delay = self._handle_failure(e, attempt, label)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+
+    async def call_async(self, request: Callable[[], Awaitable[Any]], priority: int = PRIORITY_ABBREVIATION,
+                         tokens: int = 0, label: str = 'request') -> Any:
+        """Async counterpart of call(); waiting for a slot happens off the event loop"""
+        for attempt in itertools.count():
+            await asyncio.to_thread(self.acquire, priority, tokens)
+            try:
+                started = time.perf_counter()
+                result = await request()
+                self.stats['requests'] += 1
+                _notify_listeners(label, time.perf_counter() - started, result)
+                return result
+            except Exception as e:
+                delay = self._handle_failure(e, attempt, label)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+
+    def summary(self) -> Dict[str, Any]:
+        return dict(self.stats, queued_seconds=round(self.stats['queued_seconds'], 3))
+
+
+def add_call_listener(listener: CallListener):
+    """Register a callback for every successful call made through any scheduler"""
+    if listener not in _call_listeners:
+        _call_listeners.append(listener)
+
+
+def _notify_listeners(label: str, latency_seconds: float, response: Any):
+    for listener in _call_listeners:
+        try:
+            listener(label, latency_seconds, response)
+        except Exception as e:
+            logger.warning(f"Call listener failed: {e}")
+
+
+def get_scheduler() -> RequestScheduler:
+    """The process-wide scheduler (created on first use from the environment limits)"""
+    global _default_scheduler
+    with _default_lock:
+        if _default_scheduler is None:
+            _default_scheduler = RequestScheduler()
+        return _default_scheduler
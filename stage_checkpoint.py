@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Pipeline Stage Checkpoints
+Persists each finished stage's output so an interrupted run (crash, Ctrl-C)
+can resume where it stopped instead of starting over.
+1. One directory per input file, named after the SHA-256 of its bytes
+2. <stage>.json holds the stage's result and state plus a key built from the
+   versions of that stage and every stage before it, so bumping a stage's
+   version invalidates it and everything downstream
+3. <stage>.progress.jsonl collects partial results (e.g. abbreviation batches)
+   one line per unit of work, appended as each unit finishes
+Without resume=True the input's directory is cleared first, so a fresh run
+never mixes in output from an earlier one.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHECKPOINT_DIR = os.getenv('PIPELINE_CHECKPOINT_DIR', '.cache/checkpoints')
+_HASH_CHUNK = 1024 * 1024
+
+
+def file_sha256(path: Union[str, Path]) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class StageCheckpoint:
+    """Stage outputs of one pipeline run over one input file"""
+
+    def __init__(self, input_path: Union[str, Path], stage_versions: Dict[str, int], resume: bool = False,
+                 root: Union[str, Path] = DEFAULT_CHECKPOINT_DIR):
+        self.input_hash = file_sha256(input_path)
+        self.stage_versions = stage_versions
+        self.resume = resume
+        self.directory = Path(root) / self.input_hash[:32]
+
+        if not resume and self.directory.exists():
+            shutil.rmtree(self.directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        logger.info(f"Stage checkpoints in {self.directory} ({'resuming' if resume else 'fresh run'})")
+
+    def stage_key(self, stage: str, params: str = '') -> str:
+        """Versions of this stage and all stages before it (plus stage-specific parameters)"""
+        chain = []
+        for name, version in self.stage_versions.items():
+            chain.append(f"{name}{version}")
+            if name == stage:
+                break
+        return '-'.join(chain) + (f"|{params}" if params else '')
+
+    def _path(self, stage: str, suffix: str = '.json') -> Path:
+        return self.directory / f"{stage}{suffix}"
+
+    def load(self, stage: str, params: str = '') -> Optional[Dict[str, Any]]:
+        """Saved output of a completed stage, or None (always None on a fresh run)"""
+        path = self._path(stage)
+        if not self.resume or not path.exists():
+            return None
+        try:
+            saved = json.loads(path.read_text(encoding='utf-8'))
+        except ValueError as e:
+            logger.warning(f"Ignoring unreadable checkpoint {path.name}: {e}")
+            return None
+        if saved.get('key') != self.stage_key(stage, params):
+            logger.info(f"Checkpoint for {stage} is from another stage version; re-running it")
+            return None
+        return saved['output']
+
+    def save(self, stage: str, output: Dict[str, Any], params: str = ''):
+        """Write a finished stage atomically"""
+        path = self._path(stage)
+        tmp_path = path.with_suffix('.json.tmp')
+        tmp_path.write_text(json.dumps({'key': self.stage_key(stage, params), 'output': output}, ensure_ascii=False),
+                            encoding='utf-8')
+        os.replace(tmp_path, path)
+
+    def load_progress(self, stage: str, params: str = '') -> Dict[str, Any]:
+        """Partial results of an unfinished stage, merged in the order they were written"""
+        path = self._path(stage, '.progress.jsonl')
+        merged: Dict[str, Any] = {}
+        if not self.resume or not path.exists():
+            return merged
+
+        with open(path, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        if not lines or json.loads(lines[0]).get('key') != self.stage_key(stage, params):
+            return merged
+        for line in lines[1:]:
+            try:
+                merged.update(json.loads(line))
+            except ValueError:
+                break  # A line cut short by the interruption
+        return merged
+
+    def start_progress(self, stage: str, params: str = '', keep: bool = False):
+        """Begin (or, with keep=True, continue) the progress log of a stage"""
+        path = self._path(stage, '.progress.jsonl')
+        if keep and path.exists():
+            return
+        path.write_text(json.dumps({'key': self.stage_key(stage, params)}) + '\n', encoding='utf-8')
+
+    def append_progress(self, stage: str, results: Dict[Any, Any]):
+        """Record one finished unit of work"""
+        with open(self._path(stage, '.progress.jsonl'), 'a', encoding='utf-8') as f:
+            f.write(json.dumps({str(k): v for k, v in results.items()}, ensure_ascii=False) + '\n')
+            f.flush()
+
+    def completed(self, stages: Iterable[str]) -> bool:
+        return all(self.load(stage) is not None for stage in stages)
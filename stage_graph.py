@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Declarative Stage Graph
+Runs a pipeline's steps as a small DAG instead of a hard-coded chain of calls.
+1. Each stage declares the stages whose results it takes as arguments
+   (inputs) and the ones it only has to wait for (after)
+2. A stage starts as soon as those are done, so independent stages (e.g. the
+   structure stats and the LLM analysis of the same raw data) run
+   concurrently on a thread pool; a lone ready stage runs on the caller's thread
+   and so does every inline stage, for stages that use thread-bound resources
+   (sqlite3 connections opened on the caller's thread refuse other threads)
+3. Results are memoized on the graph: a later run() only computes the stages
+   that have not finished yet
+4. Each stage's start offset and duration are recorded for a timing report;
+   an instrument (e.g. StageProfiler.measure) can wrap every stage call
+A stage fails when it raises or returns False / {'success': False}. Stages
+that depend on a failed stage are skipped.
+"""
+
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 4
+
+
+def stage_succeeded(result: Any) -> bool:
+    """Default success check: the wranglers' bool and {'success': bool, ...} conventions"""
+    if isinstance(result, dict):
+        return result.get('success', True) is not False
+    return result is not False
+
+
+class Stage:
+    """One named step: func(*input results), run once its inputs and `after` stages are done"""
+
+    def __init__(self, name: str, func: Callable[..., Any], inputs: Sequence[str] = (), after: Sequence[str] = (),
+                 check: Optional[Callable[[Any], bool]] = stage_succeeded, inline: bool = False):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.dependencies = list(inputs) + [name for name in after if name not in inputs]
+        self.check = check  # None: only an exception fails the stage
+        self.inline = inline  # Always run on the thread that called run(), never on the pool
+
+
+class StageGraph:
+    """Stages in declaration order; a stage may only depend on stages declared before it"""
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS,
+                 instrument: Optional[Callable[[str, Callable[[], Any]], Any]] = None):
+        self.max_workers = max_workers
+        self.instrument = instrument  # instrument(stage name, call) runs call() and returns its result
+        self.stages: Dict[str, Stage] = {}
+        self.results: Dict[str, Any] = {}
+        self.timings: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, name: str, func: Callable[..., Any], inputs: Sequence[str] = (), after: Sequence[str] = (),
+            check: Optional[Callable[[Any], bool]] = stage_succeeded, inline: bool = False) -> 'StageGraph':
+        if name in self.stages:
+            raise ValueError(f"Stage '{name}' is already defined")
+        stage = Stage(name, func, inputs, after, check, inline)
+        unknown = [dependency for dependency in stage.dependencies if dependency not in self.stages]
+        if unknown:
+            raise ValueError(f"Stage '{name}' depends on undefined stages {unknown}")
+        self.stages[name] = stage
+        return self
+
+    def required(self, targets: Optional[Iterable[str]] = None) -> List[str]:
+        """The targets and everything they depend on, in declaration order"""
+        needed = set()
+        stack = list(self.stages if targets is None else targets)
+        while stack:
+            name = stack.pop()
+            if name not in needed:
+                needed.add(name)
+                stack.extend(self.stages[name].dependencies)
+        return [name for name in self.stages if name in needed]
+
+    def _call(self, stage: Stage, run_started: float):
+        started = time.perf_counter()
+        call = lambda: stage.func(*[self.results[name] for name in stage.inputs])
+        try:
+            return (self.instrument(stage.name, call) if self.instrument is not None else call()), None
+        except Exception as e:
+            return None, e
+        finally:
+            self.timings[stage.name] = {'start': round(started - run_started, 3),
+                                        'seconds': round(time.perf_counter() - started, 3)}
+
+    def run(self, targets: Optional[Iterable[str]] = None, reraise: bool = False) -> Dict[str, Any]:
+        """Compute the targets (default: every stage); finished stages are not run again
+
+        With reraise=True the first stage exception is raised once the stages
+        already in flight have finished.
+        """
+        order = self.required(targets)
+        pending = [name for name in order if name not in self.results]
+        computed = list(pending)
+        running = {}
+        failed: Dict[str, str] = {}
+        exceptions: Dict[str, Exception] = {}
+        skipped: List[str] = []
+        run_started = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                ready = []
+                for name in list(pending):
+                    dependencies = self.stages[name].dependencies
+                    if any(dependency in failed or dependency in skipped for dependency in dependencies):
+                        pending.remove(name)
+                        skipped.append(name)
+                        logger.info(f"Stage '{name}' skipped: an input failed")
+                    elif all(dependency in self.results for dependency in dependencies):
+                        pending.remove(name)
+                        ready.append(name)
+
+                inline = [name for name in ready if self.stages[name].inline]
+                pooled = [name for name in ready if not self.stages[name].inline]
+                if len(pooled) == 1 and not inline and not running:
+                    # Nothing to overlap with: run on this thread (keeps Ctrl-C and tracebacks direct)
+                    inline, pooled = pooled, []
+
+                for name in pooled:
+                    running[pool.submit(self._call, self.stages[name], run_started)] = name
+                # Inline stages overlap with the pooled ones but stay on this thread
+                finished = [(name, self._call(self.stages[name], run_started)) for name in inline]
+                if not finished:
+                    if not running:
+                        break
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    finished = [(running.pop(future), future.result()) for future in done]
+
+                for name, (result, error) in finished:
+                    stage = self.stages[name]
+                    if error is not None:
+                        failed[name] = str(error)
+                        exceptions[name] = error
+                        logger.error(f"Stage '{name}' raised: {error}")
+                    elif stage.check is not None and not stage.check(result):
+                        error = result.get('error') if isinstance(result, dict) else None
+                        failed[name] = error or 'stage reported failure'
+                        logger.error(f"Stage '{name}' failed: {failed[name]}")
+                    else:
+                        self.results[name] = result
+                    self.timings[name]['status'] = 'failed' if name in failed else 'ok'
+
+        if reraise and exceptions:
+            raise next(iter(exceptions.values()))
+
+        return {
+            'success': all(name in self.results for name in order),
+            'results': {name: self.results[name] for name in order if name in self.results},
+            'failed': failed,
+            'exceptions': exceptions,
+            'skipped': skipped,
+            'timings': {name: self.timings[name] for name in computed if name in self.timings},
+            'wall_seconds': round(time.perf_counter() - run_started, 3)
+        }
+
+
+def timing_lines(report: Dict[str, Any]) -> List[str]:
+    """Per-stage timing table (start offset, duration, status) for a run() report"""
+    timings = report['timings']
+    width = max([len(name) for name in timings] + [5])
+    lines = [f"{'stage':<{width}} {'start s':>8} {'seconds':>8}  status"]
+    for name, timing in timings.items():
+        lines.append(f"{name:<{width}} {timing['start']:>8.3f} {timing['seconds']:>8.3f}  {timing.get('status', '?')}")
+    busy = sum(timing['seconds'] for timing in timings.values())
+    lines.append(f"{len(timings)} stages, {busy:.3f}s of stage time in {report['wall_seconds']:.3f}s wall")
+    return lines
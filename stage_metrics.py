@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Per-Stage Metrics and Profiling
+Measures every stage a StageGraph runs (pass StageProfiler.measure as the
+graph's instrument) and writes a machine-readable JSON report per run.
+1. Wall time, and CPU time of the thread the stage ran on
+2. Peak RSS of the process when the stage ends; with profiling on, also the
+   tracemalloc peak during the stage
+3. Rows / columns the stage left behind (shape callback of the entry point)
+4. LLM calls made inside the stage: count, latencies and input / output tokens,
+   reported by the request scheduler and attributed through a context variable
+   (copied into the stage's asyncio tasks)
+With a profile directory every stage also gets a cProfile dump,
+<dir>/<stage>.prof (python -m pstats, snakeviz). Both tracemalloc and, on
+Python 3.12+, cProfile see the whole process, so overlapping stages share a
+memory peak and only the first of them gets a profile.
+"""
+
+import cProfile
+import json
+import logging
+import threading
+import time
+import tracemalloc
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Sequence, Union
+
+from prompt_caching import usage_stats
+from request_scheduler import add_call_listener
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE_DIR = 'profiles'
+TOKEN_KEYS = ('input_tokens', 'cache_creation_input_tokens', 'cache_read_input_tokens', 'output_tokens')
+MB = 1024 * 1024
+
+# Metrics dict of the stage running in this thread / task
+_current_stage: ContextVar[Optional[Dict[str, Any]]] = ContextVar('current_stage_metrics', default=None)
+_llm_lock = threading.Lock()
+
+Shape = Callable[[str, Any], Dict[str, Optional[int]]]
+
+
+def rows_shape(rows: Optional[Sequence[Sequence[Any]]]) -> Dict[str, Optional[int]]:
+    """Rows / columns of a list-of-rows table (None when nothing is loaded yet)"""
+    if not rows:
+        return {'rows': None, 'columns': None}
+    return {'rows': len(rows), 'columns': len(rows[0])}
+
+
+def _max_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def record_llm_call(label: str, latency_seconds: float, response: Any):
+    """Request-scheduler listener: add one call to the current stage's metrics"""
+    metrics = _current_stage.get()
+    if metrics is None:
+        return
+    usage = usage_stats(response)
+    with _llm_lock:
+        llm = metrics['llm']
+        llm['calls'] += 1
+        llm['latencies'].append(round(latency_seconds, 3))
+        for key in TOKEN_KEYS:
+            llm[key] += usage.get(key, 0)
+
+
+def _empty_llm() -> Dict[str, Any]:
+    return dict({'calls': 0, 'latencies': []}, **{key: 0 for key in TOKEN_KEYS})
+
+
+class StageProfiler:
+    """Collects the metrics of one pipeline run, stage by stage"""
+
+    def __init__(self, pipeline: str, profile_dir: Optional[Union[str, Path]] = None, shape: Optional[Shape] = None):
+        self.pipeline = pipeline
+        self.profile_dir = Path(profile_dir) if profile_dir else None
+        self.shape = shape
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        add_call_listener(record_llm_call)
+
+        if self.profile_dir is not None:
+            self.profile_dir.mkdir(parents=True, exist_ok=True)
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+    def measure(self, stage: str, call: Callable[[], Any]) -> Any:
+        """Run one stage's call and record its metrics (also when it raises)"""
+        metrics = {'wall_seconds': None, 'cpu_seconds': None, 'max_rss_mb': None, 'tracemalloc_peak_mb': None,
+                   'rows': None, 'columns': None, 'llm': _empty_llm()}
+        token = _current_stage.set(metrics)
+
+        profiler = None
+        if self.profile_dir is not None:
+            tracemalloc.reset_peak()
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:  # Another stage's profiler is active (process-wide on 3.12+)
+                logger.info(f"Stage '{stage}' overlaps a profiled stage; no cProfile dump for it")
+                profiler = None
+
+        result = None
+        started_wall, started_cpu = time.perf_counter(), time.thread_time()
+        try:
+            result = call()
+            return result
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profile_path = self.profile_dir / f"{stage}.prof"
+                profiler.dump_stats(str(profile_path))
+                metrics['profile'] = str(profile_path)
+            metrics['wall_seconds'] = round(time.perf_counter() - started_wall, 3)
+            metrics['cpu_seconds'] = round(time.thread_time() - started_cpu, 3)
+            metrics['max_rss_mb'] = _max_rss_mb()
+            if tracemalloc.is_tracing():
+                metrics['tracemalloc_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / MB, 1)
+            if self.shape is not None:
+                try:
+                    metrics.update(self.shape(stage, result))
+                except Exception as e:
+                    logger.warning(f"Could not measure the shape after stage '{stage}': {e}")
+            _current_stage.reset(token)
+            self.stages[stage] = metrics
+
+    def report(self, **extra) -> Dict[str, Any]:
+        """The metrics report: per-stage metrics plus totals over all stages"""
+        llm_calls = [metrics['llm'] for metrics in self.stages.values()]
+        totals = {
+            'stage_seconds': round(sum(metrics['wall_seconds'] for metrics in self.stages.values()), 3),
+            'cpu_seconds': round(sum(metrics['cpu_seconds'] for metrics in self.stages.values()), 3),
+            'llm_calls': sum(llm['calls'] for llm in llm_calls),
+            'llm_seconds': round(sum(sum(llm['latencies']) for llm in llm_calls), 3)
+        }
+        totals.update({key: sum(llm[key] for llm in llm_calls) for key in TOKEN_KEYS})
+        return dict({'pipeline': self.pipeline, 'started_at': self.started_at, 'stages': self.stages,
+                     'totals': totals}, **extra)
+
+    def write(self, path: Union[str, Path], **extra) -> Dict[str, Any]:
+        """Write report() as JSON"""
+        report = self.report(**extra)
+        Path(path).write_text(json.dumps(report, indent=2, default=str), encoding='utf-8')
+        logger.info(f"Stage metrics saved to {path}")
+        return report
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Bulk Survey Data Writer
+Persists a wrangled survey grid into the survey_data long table
+(database/setup-tables.sql) with COPY FROM STDIN instead of row-by-row INSERTs.
+1. Data rows are consumed in bounded chunks of respondents
+2. Each chunk is melted column-wise into long rows joined with column_mapping
+3. Chunks are streamed to COPY as CSV; existing rows for the document are replaced
+   inside the same transaction (or kept, when a new wave is appended)
+4. Only numeric answers get response_normalized; dates and free text stay NULL
+As in storeSurveyData (src/utils/database.js), empty responses are skipped and
+question_category comes from the same keyword rules as inferQuestionCategory.
+question_type is 'numeric' when every answer in the column is numeric, otherwise
+'text'. Chunks are written with the type seen so far, and columns that turn out
+to be text in a later chunk are corrected with one UPDATE before the commit
+(an appended wave also starts from the types already stored for the document).
+Respondent IDs are written as text; a blank ID gets the positional r<n> id.
+"""
+
+import io
+import itertools
+import json
+import logging
+import numbers
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_ROWS = 2000  # Respondent rows per chunk (x columns = long rows per COPY)
+
+SURVEY_DATA_COLUMNS = [
+    'source_document_id', 'question_id', 'question_text', 'question_category',
+    'question_type', 'question_order', 'respondent_id', 'response_value',
+    'response_normalized', 'metadata'
+]
+
+COPY_SQL = f"COPY survey_data ({', '.join(SURVEY_DATA_COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+
+
+def _mapping_entry(column_mapping: Dict[Any, Dict[str, str]], col_idx: int) -> Dict[str, str]:
+    """column_mapping is keyed by int (ImprovedDataWrangler) or str (PythonDataWrangler)"""
+    return column_mapping.get(col_idx) or column_mapping.get(str(col_idx)) or {
+        'longName': f'Column_{col_idx}', 'shortName': f'col_{col_idx}'
+    }
+
+
+def find_respondent_column(column_mapping: Dict[Any, Dict[str, str]]) -> Optional[int]:
+    """Column whose long name is the SurveyMonkey 'Respondent ID', if any"""
+    for key, mapping in column_mapping.items():
+        if mapping.get('longName', '').lower().startswith('respondent id'):
+            return int(key)
+    return None
+
+
+# inferQuestionCategory in src/utils/database.js, first match wins
+QUESTION_CATEGORIES = [
+    ('demographics', ('age', 'demographic', 'gender')),
+    ('spending', ('spend', 'buy', 'purchase')),
+    ('behavior', ('often', 'frequency', 'how many')),
+    ('preferences', ('prefer', 'like', 'opinion')),
+]
+
+
+def infer_question_category(question_text: str) -> str:
+    lower_text = question_text.lower()
+    for category, keywords in QUESTION_CATEGORIES:
+        if any(keyword in lower_text for keyword in keywords):
+            return category
+    return 'general'
+
+
+def normalize_responses(values: pd.Series) -> pd.Series:
+    """Numeric value of each answer; dates, booleans and non-numeric text are NaN"""
+    if pd.api.types.is_bool_dtype(values):
+        return pd.Series(np.nan, index=values.index)
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype(float)
+
+    kind = pd.api.types.infer_dtype(values, skipna=True)
+    if kind in ('integer', 'floating', 'decimal', 'mixed-integer-float'):
+        return pd.to_numeric(values, errors='coerce').astype(float)
+    if kind in ('string', 'mixed', 'mixed-integer'):
+        # to_numeric would turn dates into epoch integers and booleans into 0/1, so only
+        # numbers and numeric text are parsed
+        parsable = values.map(lambda value: isinstance(value, (str, numbers.Number)) and not isinstance(value, bool))
+        return pd.to_numeric(values.where(parsable), errors='coerce').astype(float)
+    return pd.Series(np.nan, index=values.index)
+
+
+def respondent_labels(ids: pd.Series, positional: pd.Series) -> pd.Series:
+    """Respondent ID cells as text (integral floats without '.0'); blank cells take the positional id"""
+    def label(value):
+        if value is None or (isinstance(value, float) and np.isnan(value)):
+            return ''
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+        return str(value).strip()
+
+    labels = ids.map(label)
+    return labels.where(labels != '', positional)
+
+
+def _chunked(rows: Iterable[Sequence[Any]], size: int) -> Iterator[List[Sequence[Any]]]:
+    iterator = iter(rows)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def melt_chunk(frame: pd.DataFrame, source_document_id: int, column_mapping: Dict[Any, Dict[str, str]],
+               respondent_ids: pd.Series, question_types: Dict[int, str]) -> pd.DataFrame:
+    """Long-format survey_data rows for one chunk of respondents"""
+    parts = []
+
+    for col_idx in frame.columns:
+        values = frame[col_idx]
+        present = values.notna()
+        if not present.any():
+            continue
+        values = values[present]
+
+        as_text = values.astype(str)
+        normalized = normalize_responses(values)
+
+        if question_types.get(col_idx) != 'text':
+            question_types[col_idx] = 'numeric' if normalized.notna().all() else 'text'
+
+        mapping = _mapping_entry(column_mapping, col_idx)
+        parts.append(pd.DataFrame({
+            'source_document_id': source_document_id,
+            'question_id': mapping['shortName'],
+            'question_text': mapping['longName'],
+            'question_category': infer_question_category(mapping['longName']),
+            'question_type': question_types[col_idx],
+            'question_order': int(col_idx) + 1,
+            'respondent_id': respondent_ids[present].to_numpy(),
+            'response_value': as_text.to_numpy(),
+            'response_normalized': normalized.to_numpy(),
+            'metadata': json.dumps({'column': int(col_idx)}),
+        }))
+
+    if not parts:
+        return pd.DataFrame(columns=SURVEY_DATA_COLUMNS)
+    return pd.concat(parts, ignore_index=True)
+
+
+def _copy_chunk(cursor, long_rows: pd.DataFrame):
+    """Stream one chunk through COPY ... FROM STDIN (CSV: unquoted empty = NULL)"""
+    buffer = io.StringIO()
+    long_rows.to_csv(buffer, index=False, header=False, na_rep='')
+    buffer.seek(0)
+    cursor.copy_expert(COPY_SQL, buffer)
+    return buffer.tell()
+
+
+def _insert_chunk(cursor, long_rows: pd.DataFrame):
+    """SQLite stand-in: no COPY, so use executemany"""
+    placeholders = ', '.join('?' for _ in SURVEY_DATA_COLUMNS)
+    records = long_rows.astype(object).where(long_rows.notna(), None).itertuples(index=False, name=None)
+    cursor.executemany(f"INSERT INTO survey_data ({', '.join(SURVEY_DATA_COLUMNS)}) VALUES ({placeholders})", records)
+    return 0
+
+
+def _stored_text_columns(cursor, source_document_id: int, placeholder: str) -> List[int]:
+    """Column indexes already stored as 'text' for the document (question_order is 1-based)"""
+    cursor.execute(f"SELECT DISTINCT question_order FROM survey_data "
+                   f"WHERE source_document_id = {placeholder} AND question_type = 'text'", (source_document_id,))
+    return [row[0] - 1 for row in cursor.fetchall()]
+
+
+def _retype_as_text(cursor, source_document_id: int, col_indexes: List[int], placeholder: str) -> int:
+    """Mark rows stored as 'numeric' in columns that turned out to hold text"""
+    orders = [col_idx + 1 for col_idx in col_indexes]
+    cursor.execute(
+        f"UPDATE survey_data SET question_type = 'text' WHERE source_document_id = {placeholder} "
+        f"AND question_type = 'numeric' AND question_order IN ({', '.join(placeholder for _ in orders)})",
+        (source_document_id, *orders)
+    )
+    return cursor.rowcount
+
+
+def write_survey_data(connection, source_document_id: int, data_rows: Iterable[Sequence[Any]],
+                      column_mapping: Dict[Any, Dict[str, str]], chunk_rows: int = DEFAULT_CHUNK_ROWS,
+                      replace: bool = True, respondent_offset: int = 0) -> Dict[str, Any]:
+    """Replace survey_data for one document with the wrangled data rows, in one transaction
+
+    With replace=False the rows are appended (an incremental wave); respondent_offset
+    continues the r<n> numbering used when the sheet has no Respondent ID column.
+    """
+    is_sqlite = isinstance(connection, sqlite3.Connection)
+    placeholder = '?' if is_sqlite else '%s'
+    respondent_column = find_respondent_column(column_mapping)
+    num_columns = len(column_mapping)
+    question_types: Dict[int, str] = {}
+
+    start = time.perf_counter()
+    respondents = 0
+    records = 0
+    bytes_sent = 0
+    chunks = 0
+
+    cursor = connection.cursor()
+    try:
+        deleted = 0
+        if replace:
+            cursor.execute(f"DELETE FROM survey_data WHERE source_document_id = {placeholder}", (source_document_id,))
+            deleted = cursor.rowcount
+        else:
+            question_types.update({col_idx: 'text' for col_idx in
+                                   _stored_text_columns(cursor, source_document_id, placeholder)})
+        numeric_written = set()
+
+        for chunk in _chunked(data_rows, chunk_rows):
+            frame = pd.DataFrame.from_records(chunk).iloc[:, :num_columns]
+            frame = frame.replace('', np.nan)
+
+            respondent_ids = pd.Series([f'r{respondent_offset + respondents + i + 1}' for i in range(len(frame))])
+            if respondent_column is not None:
+                respondent_ids = respondent_labels(frame[respondent_column], respondent_ids)
+
+            long_rows = melt_chunk(frame, source_document_id, column_mapping, respondent_ids, question_types)
+            numeric_written.update(col_idx for col_idx, kind in question_types.items() if kind == 'numeric')
+            bytes_sent += _insert_chunk(cursor, long_rows) if is_sqlite else _copy_chunk(cursor, long_rows)
+
+            respondents += len(frame)
+            records += len(long_rows)
+            chunks += 1
+            logger.info(f"Chunk {chunks}: {len(frame)} respondents -> {len(long_rows)} survey_data rows")
+
+        # An appended wave can also turn text a column the earlier waves stored as numeric
+        retyped = sorted(col_idx for col_idx, kind in question_types.items()
+                         if kind == 'text' and (col_idx in numeric_written or not replace))
+        if retyped:
+            updated = _retype_as_text(cursor, source_document_id, retyped, placeholder)
+            if updated:
+                logger.info(f"{updated} rows re-typed as text: their columns had text answers in a later chunk")
+
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    seconds = time.perf_counter() - start
+    rows_per_second = records / seconds if seconds > 0 else 0.0
+    logger.info(f"Stored {records} survey_data rows for document {source_document_id} "
+                f"({respondents} respondents, {chunks} chunks, replaced {deleted}) "
+                f"in {seconds:.2f}s = {rows_per_second:,.0f} rows/s")
+
+    return {
+        'success': True,
+        'records_stored': records,
+        'respondents': respondents,
+        'records_replaced': deleted,
+        'chunks': chunks,
+        'bytes_sent': bytes_sent,
+        'seconds': round(seconds, 3),
+        'rows_per_second': round(rows_per_second, 1)
+    }
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Incremental Survey Waves
+Recognises a re-export of a survey that was already wrangled (same header
+block, more respondents) so only the new respondents are processed.
+1. header_fingerprint() hashes the stripped header rows
+2. WaveRegistry (SQLite) maps a fingerprint to the document that first carried
+   it, its column_mapping and the respondent keys already written to survey_data
+3. respondent_keys() / new_respondent_mask() pick out the data rows whose
+   Respondent ID (or, without one, whose row content) has not been seen
+A matching upload reuses the stored column_mapping, so no LLM calls are made,
+and its new rows are appended to the first document's survey_data.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Union
+
+import numpy as np
+import pandas as pd
+
+from header_block import header_block
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REGISTRY_PATH = os.getenv('SURVEY_WAVE_REGISTRY_PATH', '.cache/survey_waves.sqlite3')
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS survey_waves (
+    fingerprint TEXT PRIMARY KEY,
+    document_id INTEGER NOT NULL,
+    column_mapping TEXT NOT NULL,
+    header_rows INTEGER NOT NULL,
+    respondent_column INTEGER,
+    waves INTEGER NOT NULL DEFAULT 1,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS survey_wave_respondents (
+    fingerprint TEXT NOT NULL,
+    respondent_key TEXT NOT NULL,
+    PRIMARY KEY (fingerprint, respondent_key)
+) WITHOUT ROWID;
+"""
+
+
+def header_fingerprint(header_rows: Sequence[Sequence[Any]]) -> str:
+    """Fingerprint of a header block: identical question/sub-label text in every cell"""
+    block = header_block(header_rows)
+    text = '\x1e'.join('\x1f'.join(row) for row in block.tolist())
+    return hashlib.sha256(f"{block.shape}\x1d{text}".encode('utf-8')).hexdigest()[:32]
+
+
+def respondent_keys(data_rows: Sequence[Sequence[Any]], respondent_column: Optional[int]) -> pd.Series:
+    """One key per data row: the Respondent ID as stored in survey_data, else a hash of the row"""
+    if respondent_column is not None:
+        values = pd.Series([row[respondent_column] if respondent_column < len(row) else '' for row in data_rows],
+                           dtype=object)
+        return values.astype(str)
+    frame = pd.DataFrame.from_records(list(data_rows))
+    return pd.util.hash_pandas_object(frame.astype(str), index=False).astype(str).reset_index(drop=True)
+
+
+def new_respondent_mask(keys: pd.Series, known: Set[str]) -> np.ndarray:
+    """True for rows whose key is not among the known respondents"""
+    return ~keys.isin(known).to_numpy()
+
+
+class WaveRegistry:
+    """SQLite record of wrangled header blocks and the respondents stored for each"""
+
+    def __init__(self, path: Union[str, Path] = DEFAULT_REGISTRY_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Batch workers share the file, so wait on locks instead of failing
+        self.connection = sqlite3.connect(str(self.path), timeout=30)
+        self.connection.executescript(SCHEMA_SQL)
+
+    def lookup(self, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """The earlier wave with this header block, or None"""
+        row = self.connection.execute(
+            """
+            SELECT document_id, column_mapping, header_rows, respondent_column, waves,
+                   (SELECT COUNT(*) FROM survey_wave_respondents r WHERE r.fingerprint = w.fingerprint)
+            FROM survey_waves w WHERE fingerprint = ?
+            """,
+            (fingerprint,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            'fingerprint': fingerprint,
+            'document_id': row[0],
+            'column_mapping': json.loads(row[1]),
+            'header_rows': row[2],
+            'respondent_column': row[3],
+            'waves': row[4],
+            'respondents': row[5]
+        }
+
+    def register(self, fingerprint: str, document_id: int, column_mapping: Dict[Any, Dict[str, str]],
+                 header_rows: int, respondent_column: Optional[int], keys: Optional[Iterable[str]] = None):
+        """Record a fully wrangled document; keys replace the stored respondents when given"""
+        now = time.time()
+        with self.connection:
+            self.connection.execute(
+                """
+                INSERT OR REPLACE INTO survey_waves
+                    (fingerprint, document_id, column_mapping, header_rows, respondent_column, waves, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, 1, ?, ?)
+                """,
+                (fingerprint, document_id, json.dumps({str(k): v for k, v in column_mapping.items()}),
+                 header_rows, respondent_column, now, now)
+            )
+            if keys is not None:
+                self.connection.execute("DELETE FROM survey_wave_respondents WHERE fingerprint = ?", (fingerprint,))
+                self._insert_keys(fingerprint, keys)
+
+    def add_wave(self, fingerprint: str, keys: Iterable[str]):
+        """Record the respondents an incremental wave appended"""
+        with self.connection:
+            self._insert_keys(fingerprint, keys)
+            self.connection.execute(
+                "UPDATE survey_waves SET waves = waves + 1, updated_at = ? WHERE fingerprint = ?",
+                (time.time(), fingerprint)
+            )
+
+    def _insert_keys(self, fingerprint: str, keys: Iterable[str]):
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO survey_wave_respondents (fingerprint, respondent_key) VALUES (?, ?)",
+            ((fingerprint, key) for key in keys)
+        )
+
+    def known_respondents(self, fingerprint: str) -> Set[str]:
+        rows = self.connection.execute(
+            "SELECT respondent_key FROM survey_wave_respondents WHERE fingerprint = ?", (fingerprint,)
+        )
+        return {key for (key,) in rows}
+
+    def close(self):
+        self.connection.close()
+
+
+def select_rows(data_rows: Sequence[Sequence[Any]], mask: np.ndarray) -> List[Sequence[Any]]:
+    """The data rows where mask is True"""
+    return [data_rows[row_idx] for row_idx in np.flatnonzero(mask).tolist()]
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Synthetic SurveyMonkey-Style Surveys
+Generates survey exports of any shape so the pipeline can be measured beyond
+the one Parents workbook.
+1. Header block of configurable depth: the question text sits on the first
+   column of each matrix block and is blank after it (SurveyMonkey's merged
+   cells); deeper blocks add section rows, and the bottom row holds each
+   column's sub-label
+2. Leading respondent columns (Respondent ID, dates, email) come first, then
+   question blocks of matrix_width columns: Likert / choice text, 0-10 ratings
+   or open text, with a share of unanswered cells
+3. Data rows are produced in chunks from a seeded generator, so 1M-row files
+   stream to disk without holding the sheet in memory
+.xlsx output is capped at Excel's 1,048,576 rows x 16,384 columns; wider
+surveys can be written as CSV or used in memory.
+Example: python synthetic_survey.py --rows 100000 --columns 2000 --header-depth 3 --output survey.xlsx
+"""
+
+import argparse
+import csv
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List
+
+import numpy as np
+from openpyxl import Workbook
+
+logger = logging.getLogger(__name__)
+
+EXCEL_MAX_ROWS = 1048576
+EXCEL_MAX_COLUMNS = 16384
+CELLS_PER_CHUNK = 2_000_000
+
+RESPONDENT_COLUMNS = ['Respondent ID', 'Collector ID', 'Start Date', 'End Date', 'Email Address']
+LIKERT = ['Strongly disagree', 'Disagree', 'Neither agree nor disagree', 'Agree', 'Strongly agree']
+CHOICES = ['Yes', 'No', 'Not sure', 'Prefer not to say']
+OPEN_TEXT = [
+    'Easy to use and good value', 'Too expensive for what you get', 'Would like more sizes',
+    'Delivery was slow', 'Great customer service', 'The app keeps crashing', 'Friends recommended it',
+    'Saw an advert online', 'Nothing to add', 'Better than the brand I used before'
+]
+BLOCK_KINDS = ('likert', 'choice', 'rating', 'open')
+START_DATE = datetime(2024, 1, 1)
+
+
+class SurveySpec:
+    """Shape of a synthetic survey; the same spec and seed always give the same sheet"""
+
+    def __init__(self, rows: int = 1000, columns: int = 253, header_depth: int = 2, matrix_width: int = 6,
+                 blank_ratio: float = 0.1, seed: int = 0):
+        if header_depth < 1:
+            raise ValueError("header_depth must be at least 1")
+        self.rows = rows
+        self.columns = columns
+        self.header_depth = header_depth
+        self.matrix_width = max(1, matrix_width)
+        self.blank_ratio = blank_ratio
+        self.seed = seed
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(vars(self))
+
+    @property
+    def key(self) -> str:
+        """File-name friendly identity of the spec"""
+        return (f"r{self.rows}_c{self.columns}_d{self.header_depth}_m{self.matrix_width}"
+                f"_b{self.blank_ratio:g}_s{self.seed}")
+
+    def column_kinds(self) -> np.ndarray:
+        """Kind of every column: the respondent columns, then one kind per question block"""
+        leading = min(len(RESPONDENT_COLUMNS), self.columns)
+        blocks = -(-(self.columns - leading) // self.matrix_width)
+        block_kinds = np.random.default_rng(self.seed).choice(BLOCK_KINDS, size=blocks)
+        kinds = np.repeat(block_kinds, self.matrix_width)[:self.columns - leading]
+        return np.concatenate([np.array(['respondent'] * leading, dtype=object), kinds.astype(object)])
+
+
+def header_rows(spec: SurveySpec) -> List[List[str]]:
+    """The header block: question row, section rows (depth > 2), then the sub-label row"""
+    kinds = spec.column_kinds()
+    leading = int((kinds == 'respondent').sum())
+    question_columns = np.arange(spec.columns - leading)
+    block = question_columns // spec.matrix_width
+    position = question_columns % spec.matrix_width
+
+    if spec.header_depth == 1:
+        # Single header row: every column carries its full question text
+        return [RESPONDENT_COLUMNS[:leading] + [f'Q{b + 1}: Item {p + 1}' for b, p in zip(block, position)]]
+
+    question_row = RESPONDENT_COLUMNS[:leading] + [
+        f'Q{b + 1}: How much do you agree with the following statements about topic {b + 1}?' if p == 0 else ''
+        for b, p in zip(block, position)
+    ]
+    rows = [question_row]
+
+    section_width = spec.matrix_width * 4
+    for depth in range(1, spec.header_depth - 1):
+        rows.append([''] * leading + [
+            f'Section {depth}.{col_idx // section_width + 1}' if col_idx % section_width == 0 else ''
+            for col_idx in question_columns
+        ])
+
+    sub_labels = {
+        'likert': 'Statement {p}', 'choice': 'Option {p}', 'rating': 'Rating {p}', 'open': 'Comment {p}'
+    }
+    rows.append([''] * leading + [
+        'Response' if spec.matrix_width == 1 else sub_labels[kind].format(p=p + 1)
+        for kind, p in zip(kinds[leading:], position)
+    ])
+    return rows
+
+
+def data_chunks(spec: SurveySpec, chunk_rows: int = 0) -> Iterator[List[List[Any]]]:
+    """Data rows in chunks (default: about CELLS_PER_CHUNK cells each); blanks are None"""
+    chunk_rows = chunk_rows or max(1, CELLS_PER_CHUNK // max(spec.columns, 1))
+    kinds = spec.column_kinds()
+    rng = np.random.default_rng(spec.seed + 1)
+    columns_of = {kind: np.flatnonzero(kinds == kind) for kind in BLOCK_KINDS}
+    leading = int((kinds == 'respondent').sum())
+
+    likert, choices, open_text = (np.array(values, dtype=object) for values in (LIKERT, CHOICES, OPEN_TEXT))
+
+    for start in range(0, spec.rows, chunk_rows):
+        count = min(chunk_rows, spec.rows - start)
+        chunk = np.empty((count, spec.columns), dtype=object)
+
+        if columns_of['likert'].size:
+            chunk[:, columns_of['likert']] = likert[rng.integers(0, len(likert), (count, columns_of['likert'].size))]
+        if columns_of['choice'].size:
+            chunk[:, columns_of['choice']] = choices[rng.integers(0, len(choices), (count, columns_of['choice'].size))]
+        if columns_of['rating'].size:
+            chunk[:, columns_of['rating']] = rng.integers(0, 11, (count, columns_of['rating'].size)).astype(object)
+        if columns_of['open'].size:
+            chunk[:, columns_of['open']] = open_text[rng.integers(0, len(open_text), (count, columns_of['open'].size))]
+
+        blanks = rng.random((count, spec.columns)) < spec.blank_ratio
+        blanks[:, :leading] = False  # Respondent metadata is always present
+        chunk[blanks] = None
+
+        respondent_ids = np.arange(start, start + count) + 10_000_000_000
+        started = [START_DATE + timedelta(minutes=int(offset)) for offset in rng.integers(0, 525600, count)]
+        respondent_values = [
+            respondent_ids.tolist(),
+            [int(collector) for collector in rng.integers(400_000_000, 400_000_010, count)],
+            started,
+            [moment + timedelta(minutes=int(minutes)) for moment, minutes in zip(started, rng.integers(2, 40, count))],
+            [f'respondent{respondent_id}@example.com' for respondent_id in respondent_ids.tolist()]
+        ]
+        for col_idx in range(leading):
+            chunk[:, col_idx] = respondent_values[col_idx]
+
+        yield chunk.tolist()
+
+
+def survey_rows(spec: SurveySpec) -> List[List[Any]]:
+    """The whole sheet in memory: header rows followed by data rows"""
+    rows = [list(row) for row in header_rows(spec)]
+    for chunk in data_chunks(spec):
+        rows.extend(chunk)
+    return rows
+
+
+def write_workbook(spec: SurveySpec, path: str) -> Dict[str, Any]:
+    """Stream the survey into an .xlsx workbook (write-only mode)"""
+    if spec.columns > EXCEL_MAX_COLUMNS or spec.rows + spec.header_depth > EXCEL_MAX_ROWS:
+        raise ValueError(f"{spec.rows} rows x {spec.columns} columns exceeds the .xlsx limits; write CSV instead")
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Sheet')
+    for row in header_rows(spec):
+        sheet.append([cell or None for cell in row])
+    for chunk in data_chunks(spec):
+        for row in chunk:
+            sheet.append(row)
+    workbook.save(path)
+
+    logger.info(f"Wrote {path}: {spec.header_depth} header rows + {spec.rows} data rows x {spec.columns} columns")
+    return {'path': path, 'rows': spec.rows + spec.header_depth, 'columns': spec.columns}
+
+
+def write_csv(spec: SurveySpec, path: str) -> Dict[str, Any]:
+    """Stream the survey into a CSV file (no width limit)"""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerows(header_rows(spec))
+        for chunk in data_chunks(spec):
+            writer.writerows(['' if cell is None else cell for cell in row] for row in chunk)
+
+    logger.info(f"Wrote {path}: {spec.header_depth} header rows + {spec.rows} data rows x {spec.columns} columns")
+    return {'path': path, 'rows': spec.rows + spec.header_depth, 'columns': spec.columns}
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Generate a synthetic SurveyMonkey-style survey export")
+    parser.add_argument('--rows', type=int, default=1000, help="Respondents (data rows)")
+    parser.add_argument('--columns', type=int, default=253, help="Total columns")
+    parser.add_argument('--header-depth', type=int, default=2, help="Header rows")
+    parser.add_argument('--matrix-width', type=int, default=6, help="Columns per question block (1 = single answers)")
+    parser.add_argument('--blank-ratio', type=float, default=0.1, help="Share of unanswered cells")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='synthetic_survey.xlsx', help=".xlsx or .csv file to write")
+    args = parser.parse_args()
+
+    spec = SurveySpec(rows=args.rows, columns=args.columns, header_depth=args.header_depth,
+                      matrix_width=args.matrix_width, blank_ratio=args.blank_ratio, seed=args.seed)
+    if args.output.endswith('.csv'):
+        write_csv(spec, args.output)
+    else:
+        write_workbook(spec, args.output)
+
+
+if __name__ == "__main__":
+    main()
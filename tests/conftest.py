@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The pipeline modules live at the repository root (and debug/), not in a package
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'debug'))
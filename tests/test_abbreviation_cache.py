@@ -0,0 +1,24 @@
+from abbreviation_cache import AbbreviationCache, cache_keys
+from header_abbreviation import AsyncAbbreviator
+
+
+def test_repeated_long_names_get_one_key_per_occurrence():
+    keys = cache_keys(['Other', 'Age', 'Other', 'Other'])
+    assert keys[:2] == ['Other', 'Age']
+    assert len(set(keys)) == 4
+
+
+def test_warm_run_rebuilds_the_names_of_repeated_headers(tmp_path):
+    headers = ['Which brand do you prefer? | Other (please specify)', 'How old are you today?',
+               'Which brand do you prefer? | Other (please specify)']
+    cold_answers = {0: 'brand_other', 1: 'age', 2: 'brand_other_txt'}
+
+    cache = AbbreviationCache(tmp_path / 'cache.sqlite3')
+    abbreviator = AsyncAbbreviator(api_key='test', cache=cache, local_fast_path=False)
+    abbreviator.remember(headers, cold_answers)
+    cold = abbreviator.assemble(headers, cold_answers)
+
+    warm_answers, _ = abbreviator.prefill(headers)
+    assert warm_answers == cold_answers
+    assert abbreviator.assemble(headers, warm_answers) == cold
+    cache.close()
@@ -0,0 +1,58 @@
+import pytest
+
+from bulk_abbreviation import STATUS_SUBMITTED, BulkAbbreviationJob
+from header_abbreviation import AsyncAbbreviator
+from llm_standin import LLMStandIn
+
+HEADERS = [f'How satisfied were you with part {i} of the visit? | Rating' for i in range(6)]
+
+
+@pytest.fixture
+def standin():
+    with LLMStandIn(batch_seconds=0.2) as server:
+        yield server
+
+
+def make_job(standin, checkpoint):
+    abbreviator = AsyncAbbreviator(api_key='test', base_url=standin.base_url, temperature=None,
+                                   local_fast_path=False, max_batch_tokens=None)
+    return BulkAbbreviationJob(checkpoint, abbreviator, batch_size=4, poll_seconds=0.05)
+
+
+def test_resume_after_crash_polls_the_submitted_job_instead_of_resubmitting(standin, tmp_path):
+    checkpoint = tmp_path / 'bulk.json'
+    job = make_job(standin, checkpoint)
+    job.add_document('doc1', HEADERS)
+    batch_id = job.submit()
+    assert job.status == STATUS_SUBMITTED
+    del job  # Crash while the batch is processing
+
+    resumed = make_job(standin, checkpoint)
+    results = resumed.run()
+
+    assert resumed.state['batch_id'] == batch_id
+    assert standin.stats['batches'] == 1
+    assert results['doc1']['retried_online'] == 0
+    assert len(set(results['doc1']['names'])) == len(HEADERS)
+
+
+def test_checkpoint_is_kept_until_every_document_is_committed(standin, tmp_path):
+    checkpoint = tmp_path / 'bulk.json'
+    job = make_job(standin, checkpoint)
+    job.add_document('doc1', HEADERS)
+    job.add_document('doc2', HEADERS[:3])
+    names = job.run()
+    job.mark_committed('doc1')
+    assert job.retire() is None  # doc2 crashed before its mapping was stored
+    answered = standin.stats['synthetic']
+
+    resumed = make_job(standin, checkpoint)
+    results = resumed.run()
+
+    assert list(results) == ['doc2']
+    assert results['doc2']['names'] == names['doc2']['names']
+    assert standin.stats['synthetic'] == answered  # Served from the checkpoint, nothing requested again
+    resumed.mark_committed('doc2')
+    archived = resumed.retire()
+    assert archived.name == f"bulk.{resumed.state['batch_id']}.json"
+    assert not checkpoint.exists()
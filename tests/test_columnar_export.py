@@ -0,0 +1,29 @@
+import pandas as pd
+
+from columnar_export import type_column, type_columns, unique_column_names
+
+
+def test_dictionary_encoded_columns_are_typed_per_distinct_value():
+    answers = pd.Series(pd.Categorical(['Agree', 'Disagree', '', 'Agree', None] * 4))
+    numbers = pd.Series(pd.Categorical(['1', '2', '', None, '3'] * 4))
+    mixed = pd.Series(pd.Categorical([1, '1', 'x', ''] * 4, categories=[1, '1', 'x', '']))
+
+    typed = type_column(answers)
+    assert list(typed.cat.categories) == ['Agree', 'Disagree']
+    assert typed.isna().sum() == 8
+
+    assert str(type_column(numbers).dtype) == 'Int64'
+    assert type_column(numbers).tolist()[:3] == [1, 2, pd.NA]
+
+    assert list(type_column(mixed).cat.categories) == ['1', 'x']
+
+
+def test_columns_with_the_same_answers_share_one_categorical_dtype():
+    raw = pd.DataFrame({'a': pd.Categorical(['Yes', 'No', 'Yes', 'Yes']),
+                        'b': pd.Categorical(['No', 'No', 'Yes', 'No'])})
+    typed = type_columns(raw)
+    assert typed['a'].dtype is typed['b'].dtype
+
+
+def test_unique_column_names_skip_names_taken_later():
+    assert unique_column_names(['a', 'a', 'a_2', '']) == ['a', 'a_2', 'a_2_2', 'column_3']
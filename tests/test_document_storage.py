@@ -0,0 +1,73 @@
+import base64
+
+import psycopg2
+
+import document_storage
+from document_storage import fetch_document_content
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.result = None
+
+    def execute(self, sql, params=None):
+        sql = ' '.join(sql.split())
+        self.connection.statements.append(sql)
+        if sql.startswith('UPDATE source_documents') and self.connection.fail_update:
+            raise psycopg2.OperationalError('read-only transaction')
+        if 'information_schema' in sql:
+            self.result = (1,) if self.connection.binary else None
+        elif sql.startswith('SELECT file_content, file_content_encoding'):
+            self.result = (None, None)
+        elif sql.startswith('SELECT file_content_base64'):
+            self.result = (base64.b64encode(self.connection.payload).decode(),)
+
+    def fetchone(self):
+        return self.result
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    autocommit = False
+
+    def __init__(self, dsn, binary=True, fail_update=False):
+        self.dsn = dsn
+        self.binary = binary
+        self.fail_update = fail_update
+        self.payload = b'PK' + b'survey' * 200
+        self.statements = []
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def test_base64_rows_are_backfilled_inside_a_savepoint():
+    connection = FakeConnection('dbname=backfill')
+    assert fetch_document_content(connection, 7).read() == connection.payload
+    fetch_document_content(connection, 7)
+
+    assert sum('information_schema' in sql for sql in connection.statements) == 1
+    update = connection.statements.index(next(sql for sql in connection.statements if sql.startswith('UPDATE')))
+    assert connection.statements[update - 1] == f"SAVEPOINT {document_storage.BACKFILL_SAVEPOINT}"
+    assert connection.statements[update + 1] == f"RELEASE SAVEPOINT {document_storage.BACKFILL_SAVEPOINT}"
+
+
+def test_failed_backfill_keeps_the_callers_transaction():
+    connection = FakeConnection('dbname=readonly', fail_update=True)
+    assert fetch_document_content(connection, 7).read() == connection.payload
+    assert f"ROLLBACK TO SAVEPOINT {document_storage.BACKFILL_SAVEPOINT}" in connection.statements
+    assert connection.rollbacks == 0
+
+
+def test_schema_without_binary_columns_reads_base64_only():
+    connection = FakeConnection('dbname=legacy', binary=False)
+    assert fetch_document_content(connection, 7).read() == connection.payload
+    assert not any(sql.startswith(('SELECT file_content,', 'UPDATE')) for sql in connection.statements)
+    assert connection.rollbacks == 0
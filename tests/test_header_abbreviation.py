@@ -0,0 +1,18 @@
+from header_abbreviation import EXAMPLE_BATCH, EXAMPLE_NAMES, AsyncAbbreviator, parse_abbreviation_response
+from prompt_caching import MIN_CACHEABLE_TOKENS
+from request_scheduler import estimate_tokens
+
+
+def test_every_batch_shares_a_cacheable_system_prefix():
+    abbreviator = AsyncAbbreviator(api_key='test')
+    first = abbreviator.build_request([(0, 'How old are you?')])
+    second = abbreviator.build_request([(5, 'Which region do you live in?'), (6, 'Any other comments?')])
+
+    assert first['system'] == second['system']
+    assert estimate_tokens(first['system'][0]['text']) >= MIN_CACHEABLE_TOKENS
+    assert first['system'][0]['cache_control'] == {'type': 'ephemeral'}
+
+
+def test_worked_example_reply_parses_to_its_names():
+    reply = AsyncAbbreviator(api_key='test').instructions.rsplit('Example reply:\n', 1)[1]
+    assert parse_abbreviation_response(reply, EXAMPLE_BATCH) == EXAMPLE_NAMES
@@ -0,0 +1,34 @@
+import json
+
+from header_abbreviation import EXAMPLE_BATCH, EXAMPLE_NAMES
+from python_pipeline import ABBREVIATION_INSTRUCTIONS, parse_abbreviation_response
+
+BATCH = [(4, 'How satisfied are you? | Price'), (5, 'How satisfied are you? | Quality'),
+         (6, 'How satisfied are you? | Other'), (7, 'Any other comments?')]
+
+
+def reply(entries):
+    return json.dumps({'abbreviations': entries})
+
+
+def test_skipped_entry_leaves_its_column_to_the_fallback():
+    names = parse_abbreviation_response(reply([
+        {'column': 4, 'original': 'Price', 'abbreviated': 'sat_price'},
+        {'column': 6, 'original': 'Other', 'abbreviated': 'sat_other'},
+        {'column': 7, 'original': 'Any other comments?', 'abbreviated': 'comments'},
+    ]), BATCH)
+    assert names == {4: 'sat_price', 6: 'sat_other', 7: 'comments'}
+
+
+def test_entries_without_a_column_match_on_the_echoed_original():
+    names = parse_abbreviation_response(reply([
+        {'original': 'Any other comments?', 'abbreviated': 'comments'},
+        {'original': 'Quality', 'abbreviated': 'sat_quality'},
+        {'column': 99, 'original': 'Unknown', 'abbreviated': 'stray'},
+    ]), BATCH)
+    assert names == {7: 'comments', 5: 'sat_quality'}
+
+
+def test_worked_example_reply_parses():
+    example = ABBREVIATION_INSTRUCTIONS.rsplit('Example reply:\n', 1)[1]
+    assert parse_abbreviation_response(example, EXAMPLE_BATCH) == EXAMPLE_NAMES
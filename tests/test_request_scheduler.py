@@ -0,0 +1,62 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import anthropic
+import pytest
+
+from request_scheduler import PRIORITY_ABBREVIATION, PRIORITY_ANALYSIS, RequestScheduler
+
+
+def api_error(error_class, status, headers=None):
+    # The SDK's status errors only read these attributes of the HTTP response
+    response = SimpleNamespace(status_code=status, headers=headers or {}, request=None)
+    return error_class(f'status {status}', response=response, body=None)
+
+
+def test_waiting_callers_are_served_by_priority():
+    scheduler = RequestScheduler(requests_per_minute=600)  # one request every 0.1s
+    scheduler.requests.tokens = 0
+    order = []
+
+    def caller(name, priority):
+        scheduler.call(lambda: order.append(name), priority=priority)
+
+    threads = [threading.Thread(target=caller, args=('abbreviation', PRIORITY_ABBREVIATION)),
+               threading.Thread(target=caller, args=('analysis', PRIORITY_ANALYSIS))]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.02)  # Both are queued before the first slot frees up
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert order == ['analysis', 'abbreviation']
+
+
+def test_rate_limit_pauses_for_retry_after_then_retries():
+    scheduler = RequestScheduler(requests_per_minute=6000)
+    attempts = []
+
+    def request():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise api_error(anthropic.RateLimitError, 429, {'retry-after': '0.3',
+                                                            'anthropic-ratelimit-requests-remaining': '0'})
+        return 'ok'
+
+    assert scheduler.call(request, label='test') == 'ok'
+    assert attempts[1] - attempts[0] >= 0.3
+    assert scheduler.stats['rate_limited'] == 1
+    assert scheduler.stats['retries'] == 1
+
+
+def test_client_errors_are_not_retried():
+    scheduler = RequestScheduler()
+
+    def request():
+        raise api_error(anthropic.BadRequestError, 400)
+
+    with pytest.raises(anthropic.BadRequestError):
+        scheduler.call(request)
+    assert scheduler.stats['failed'] == 1
+    assert scheduler.stats['retries'] == 0
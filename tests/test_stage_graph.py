@@ -0,0 +1,81 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from stage_graph import StageGraph
+
+
+def test_stages_get_their_inputs_and_results_are_memoized():
+    calls = []
+    graph = StageGraph()
+    graph.add('a', lambda: calls.append('a') or 2)
+    graph.add('b', lambda a: calls.append('b') or a * 10, inputs=['a'])
+
+    assert graph.run(['b'])['results'] == {'a': 2, 'b': 20}
+    graph.run(['b'])
+    assert calls == ['a', 'b']
+
+
+def test_failure_skips_dependents_but_not_independent_stages():
+    graph = StageGraph()
+    graph.add('load', lambda: {'success': False, 'error': 'bad file'})
+    graph.add('stats', lambda: 'ok')
+    graph.add('detect', lambda: True, after=['load'])
+    graph.add('report', lambda stats: stats, inputs=['stats'], after=['detect'])
+
+    report = graph.run()
+
+    assert report['success'] is False
+    assert report['failed'] == {'load': 'bad file'}
+    assert report['skipped'] == ['detect', 'report']
+    assert report['results'] == {'stats': 'ok'}
+
+
+def test_exception_is_reraised_on_request():
+    def boom():
+        raise ValueError('boom')
+
+    graph = StageGraph()
+    graph.add('boom', boom)
+    graph.add('after', lambda: True, after=['boom'])
+
+    report = graph.run()
+    assert isinstance(report['exceptions']['boom'], ValueError)
+    assert report['skipped'] == ['after']
+    with pytest.raises(ValueError):
+        StageGraph().add('boom', boom).run(reraise=True)
+
+
+def test_independent_stages_overlap():
+    graph = StageGraph()
+    graph.add('x', lambda: time.sleep(0.2))
+    graph.add('y', lambda: time.sleep(0.2))
+
+    assert graph.run()['wall_seconds'] < 0.35
+
+
+def test_inline_stage_runs_on_the_callers_thread_while_others_are_in_flight():
+    caller = threading.get_ident()
+    connection = sqlite3.connect(':memory:')  # check_same_thread: only usable from this thread
+    threads = {}
+
+    def record(name, value=None, seconds=0.0):
+        def run(*_):
+            time.sleep(seconds)
+            threads[name] = threading.get_ident()
+            return value if value is not None else True
+        return run
+
+    graph = StageGraph()
+    graph.add('document', record('document', seconds=0.3))  # still running when 'fill' is done
+    graph.add('fill', record('fill'))
+    graph.add('abbreviate', lambda: connection.execute('SELECT 1').fetchone()[0], after=['fill'], inline=True)
+    graph.add('finish', record('finish'), inputs=['document'], after=['abbreviate'], inline=True)
+
+    report = graph.run(reraise=True)
+
+    assert report['results']['abbreviate'] == 1
+    assert threads['finish'] == caller
+    assert threads['document'] != caller
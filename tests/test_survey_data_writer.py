@@ -0,0 +1,47 @@
+import sqlite3
+
+import numpy as np
+
+from survey_data_writer import SURVEY_DATA_COLUMNS, write_survey_data
+
+MAPPING = {
+    0: {'longName': 'Respondent ID', 'shortName': 'respondent_id'},
+    1: {'longName': 'How many visits?', 'shortName': 'visits'},
+    2: {'longName': 'Favourite colour', 'shortName': 'colour'},
+}
+
+
+def survey_db():
+    connection = sqlite3.connect(':memory:')
+    connection.execute(f"CREATE TABLE survey_data ({', '.join(SURVEY_DATA_COLUMNS)})")
+    return connection
+
+
+def column_types(connection):
+    return dict(connection.execute("SELECT DISTINCT question_id, question_type FROM survey_data").fetchall())
+
+
+def test_question_type_covers_every_chunk():
+    connection = survey_db()
+    rows = [[101, 3, 'red'], [102, 5, 'blue'], [103, 'a few', 'red'], [104, 2, 'green']]
+    write_survey_data(connection, 1, rows, MAPPING, chunk_rows=2)
+
+    assert column_types(connection) == {'respondent_id': 'numeric', 'visits': 'text', 'colour': 'text'}
+
+
+def test_appended_wave_keeps_one_type_per_column():
+    connection = survey_db()
+    write_survey_data(connection, 1, [[101, 3, 'red']], MAPPING)
+    write_survey_data(connection, 1, [[102, 'none', 'blue']], MAPPING, replace=False, respondent_offset=1)
+
+    assert column_types(connection)['visits'] == 'text'
+
+
+def test_blank_respondent_ids_fall_back_to_the_row_number():
+    connection = survey_db()
+    rows = [[101.0, 3, 'red'], ['', 4, 'blue'], [np.nan, 5, 'green']]
+    write_survey_data(connection, 1, rows, MAPPING)
+
+    respondents = [row[0] for row in connection.execute(
+        "SELECT respondent_id FROM survey_data WHERE question_id = 'visits' ORDER BY rowid")]
+    assert respondents == ['101', 'r2', 'r3']
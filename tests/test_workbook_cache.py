@@ -0,0 +1,14 @@
+import pandas as pd
+
+from workbook_cache import WorkbookCache
+
+
+def test_mixed_columns_round_trip_booleans(tmp_path):
+    cache = WorkbookCache(tmp_path)
+    data = pd.DataFrame({0: pd.Series([True, 'yes', 3, None, False, 2.5], dtype=object)})
+    cache.put('k', [['Answer']], data)
+
+    headers, restored = cache.get('k')
+    assert headers == [['Answer']]
+    assert restored[0].tolist() == [True, 'yes', 3, None, False, 2.5]
+    assert [type(value) for value in restored[0]][:3] == [bool, str, int]
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Parsed Workbook Cache
+Keeps the normalized grid of each parsed worksheet on disk as an Arrow IPC
+(Feather v2) file, keyed by the SHA-256 of the workbook bytes and the sheet.
+1. Header rows are stored as JSON in the file's schema metadata
+2. Data columns are stored with their native dtypes and memory-mapped back
+3. Mixed-type columns are stored as text plus a per-cell kind code
+4. The directory is trimmed least-recently-used first once it exceeds max_bytes
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from cell_normalization import frame_from_rows, normalize_sheet
+from excel_loader import open_sheet
+
+logger = logging.getLogger(__name__)
+
+CACHE_FORMAT_VERSION = '2'
+DEFAULT_CACHE_DIR = os.getenv('WORKBOOK_CACHE_DIR', '.cache/workbooks')
+DEFAULT_MAX_BYTES = int(os.getenv('WORKBOOK_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+
+# Per-cell kind codes for mixed (object) columns
+KIND_NULL, KIND_TEXT, KIND_INT, KIND_FLOAT, KIND_DATETIME, KIND_BOOL = 0, 1, 2, 3, 4, 5
+KIND_SUFFIX = '__kind'
+
+# Read integer/boolean columns back as nullable dtypes so large ids never pass through float64
+_NULLABLE_TYPES = {
+    pa.int64(): pd.Int64Dtype(),
+    pa.bool_(): pd.BooleanDtype(),
+}
+
+
+class WorkbookCache:
+    """Content-addressed on-disk cache of normalized worksheets"""
+
+    def __init__(self, cache_dir: Union[str, Path] = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(workbook_bytes: bytes, sheet: Union[int, str] = 0) -> str:
+        """SHA-256 of the workbook bytes, the sheet selector and the cache format"""
+        digest = hashlib.sha256(workbook_bytes)
+        digest.update(f"|sheet={sheet}|v{CACHE_FORMAT_VERSION}".encode('utf-8'))
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.arrow"
+
+    def get(self, key: str) -> Optional[Tuple[List[List[str]], pd.DataFrame]]:
+        """Memory-map a cached sheet back in, or None on a miss"""
+        path = self._path(key)
+        if not path.exists():
+            self.misses += 1
+            return None
+
+        try:
+            with pa.memory_map(str(path), 'r') as source:
+                table = pa.ipc.open_file(source).read_all()
+            headers, data = _decode_table(table)
+        except Exception as e:
+            logger.warning(f"Discarding unreadable cache entry {path.name}: {e}")
+            path.unlink(missing_ok=True)
+            self.misses += 1
+            return None
+
+        os.utime(path)  # Mark as recently used for eviction
+        self.hits += 1
+        return headers, data
+
+    def put(self, key: str, headers: List[List[str]], data: pd.DataFrame):
+        """Write a sheet to the cache, then trim the directory to max_bytes"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        tmp_path = path.with_suffix('.tmp')
+
+        table = _encode_table(headers, data)
+        with pa.OSFile(str(tmp_path), 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+
+        self.evict(keep=key)
+
+    def evict(self, keep: Optional[str] = None):
+        """Delete least-recently-used entries until the cache fits in max_bytes"""
+        if not self.cache_dir.exists():
+            return
+
+        entries = sorted(self.cache_dir.glob('*.arrow'), key=lambda p: p.stat().st_mtime)
+        total = sum(p.stat().st_size for p in entries)
+
+        for path in entries:
+            if total <= self.max_bytes:
+                break
+            if keep and path.stem == keep:
+                continue
+            total -= path.stat().st_size
+            path.unlink(missing_ok=True)
+            logger.info(f"Evicted cached workbook {path.name}")
+
+
+def _encode_table(headers: List[List[str]], data: pd.DataFrame) -> pa.Table:
+    """Arrow table for one normalized sheet; column names are the stringified column positions"""
+    arrays = {}
+    mixed_columns = []
+
+    for col in data.columns:
+        column = data[col]
+        name = str(col)
+        if column.dtype == object:
+            kinds = _cell_kinds(column)
+            text = column.astype(object).where(kinds != KIND_NULL, None)
+            arrays[name] = pa.array(text.map(lambda v: None if v is None else str(v)), type=pa.string())
+            arrays[name + KIND_SUFFIX] = pa.array(kinds, type=pa.int8())
+            mixed_columns.append(name)
+        else:
+            arrays[name] = pa.Array.from_pandas(column)
+
+    table = pa.table(arrays)
+    metadata = {
+        b'headers': json.dumps(headers, ensure_ascii=False).encode('utf-8'),
+        b'columns': json.dumps([str(col) for col in data.columns]).encode('utf-8'),
+        b'mixed_columns': json.dumps(mixed_columns).encode('utf-8'),
+        b'pandas_dtypes': json.dumps({str(col): str(dtype) for col, dtype in data.dtypes.items()}).encode('utf-8'),
+    }
+    return table.replace_schema_metadata(metadata)
+
+
+def _decode_table(table: pa.Table) -> Tuple[List[List[str]], pd.DataFrame]:
+    """Inverse of _encode_table"""
+    metadata = table.schema.metadata
+    headers = json.loads(metadata[b'headers'])
+    columns = json.loads(metadata[b'columns'])
+    mixed_columns = set(json.loads(metadata[b'mixed_columns']))
+    dtypes = json.loads(metadata[b'pandas_dtypes'])
+
+    data = {}
+    for name in columns:
+        if name in mixed_columns:
+            text = table.column(name).to_pandas()
+            kinds = table.column(name + KIND_SUFFIX).to_numpy()
+            data[int(name)] = _restore_mixed(text, kinds)
+        else:
+            column = table.column(name).to_pandas(types_mapper=_NULLABLE_TYPES.get)
+            data[int(name)] = column.astype(dtypes[name])
+
+    return headers, pd.DataFrame(data)
+
+
+def _cell_kinds(column: pd.Series) -> np.ndarray:
+    """Kind code for every cell of a mixed column"""
+    def kind(value):
+        if value is None or (isinstance(value, float) and np.isnan(value)) or value is pd.NA:
+            return KIND_NULL
+        if isinstance(value, (bool, np.bool_)):
+            return KIND_BOOL
+        if isinstance(value, str):
+            return KIND_TEXT
+        if isinstance(value, (int, np.integer)):
+            return KIND_INT
+        if isinstance(value, (float, np.floating)):
+            return KIND_FLOAT
+        if hasattr(value, 'year'):
+            return KIND_DATETIME
+        return KIND_TEXT
+
+    return column.map(kind).to_numpy(dtype=np.int8)
+
+
+def _restore_mixed(text: pd.Series, kinds: np.ndarray) -> pd.Series:
+    """Rebuild a mixed column from its text and kind codes"""
+    restored = text.astype(object).where(kinds != KIND_NULL, None)
+
+    conversions = ((KIND_INT, int), (KIND_FLOAT, float), (KIND_DATETIME, pd.Timestamp),
+                   (KIND_BOOL, lambda value: value == 'True'))
+    for code, convert in conversions:
+        mask = kinds == code
+        if mask.any():
+            restored[mask] = [convert(value) for value in text[mask]]
+
+    return restored
+
+
+def load_sheet(source: Union[str, bytes], sheet: Union[int, str] = 0,
+               cache: Optional[WorkbookCache] = None) -> Tuple[List[List[str]], pd.DataFrame]:
+    """Normalized (header rows, typed data) for a workbook path or its bytes, via the cache when given"""
+    if cache is None:
+        with open_sheet(source, sheet) as stream:
+            return normalize_sheet(frame_from_rows(stream.rows()))
+
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            workbook_bytes = f.read()
+    else:
+        workbook_bytes = bytes(source)
+
+    key = cache.make_key(workbook_bytes, sheet)
+    start = time.perf_counter()
+
+    cached = cache.get(key)
+    if cached is not None:
+        logger.info(f"Workbook cache hit {key[:12]} ({time.perf_counter() - start:.3f}s)")
+        return cached
+
+    with open_sheet(io.BytesIO(workbook_bytes), sheet) as stream:
+        headers, data = normalize_sheet(frame_from_rows(stream.rows()))
+    cache.put(key, headers, data)
+    logger.info(f"Workbook cache miss {key[:12]}: parsed and stored ({time.perf_counter() - start:.3f}s)")
+
+    return headers, data
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Compact Columnar Working Table
+LLMDataWrangler's in-memory grid: the stringified header rows plus one typed
+array per data column, instead of a list of Python objects per row.
+1. Integer answers are stored in the smallest integer dtype that holds them
+   (nullable when the column has gaps), other numbers as float64, dates as datetime64
+2. Text and mixed columns are dictionary-encoded categoricals, so a Likert label
+   repeated a million times is stored once plus a 1-byte code per cell
+3. copy() and every row/column operation return a new table that shares the
+   untouched column arrays; arrays are never modified in place (copy-on-write)
+4. Blank cells read back as '', matching cell_normalization.to_rows()
+"""
+
+import logging
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from cell_normalization import frame_from_rows, normalize_sheet
+
+logger = logging.getLogger(__name__)
+
+ROW_CHUNK = 10000
+
+
+def encode_column(column: pd.Series):
+    """Smallest faithful array for one column of typed data cells"""
+    column = column.reset_index(drop=True)
+    dtype = column.dtype
+
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_datetime64_any_dtype(dtype):
+        return column.array
+
+    if isinstance(dtype, pd.CategoricalDtype):
+        return column.array
+
+    if pd.api.types.is_integer_dtype(dtype):
+        if column.isna().any():
+            # Nullable IntegerArray: narrow values plus a 1-byte validity mask
+            return pd.to_numeric(column, downcast='integer').array
+        return pd.to_numeric(column.to_numpy(dtype='int64'), downcast='integer')
+
+    if pd.api.types.is_numeric_dtype(dtype):
+        return column.to_numpy(dtype='float64', na_value=np.nan)
+
+    # Blank text is NaN after normalize_data, so it becomes the categorical's missing code
+    column = column.astype(object).where(column.notna() & column.ne(''), np.nan)
+
+    # Numbers mixed with '' blanks (grids built from lists rather than a workbook) stay numeric
+    if pd.api.types.infer_dtype(column, skipna=True) in ('integer', 'floating', 'mixed-integer-float'):
+        return encode_column(pd.to_numeric(column).convert_dtypes())
+
+    return pd.Categorical(column)
+
+
+def cell_values(values, start: int = 0, stop: Optional[int] = None) -> List[Any]:
+    """Python cells of one column slice; missing cells become ''"""
+    part = values[start:stop]
+    if isinstance(part, np.ndarray) and part.dtype.kind in 'iub':
+        return part.tolist()
+    cells = pd.Series(part, copy=False)
+    return cells.astype(object).where(cells.notna(), '').tolist()
+
+
+class WorkingTable:
+    """Header rows plus typed column arrays; row indexes count header rows first, like the old list grid"""
+
+    def __init__(self, header_rows: List[List[Any]], columns: List[Any]):
+        self.header_rows = header_rows
+        self.columns = columns
+        self.data_rows = len(columns[0]) if columns else 0
+
+    @classmethod
+    def from_sheet(cls, headers: List[List[str]], data: pd.DataFrame) -> 'WorkingTable':
+        """Build from normalize_sheet() output"""
+        width = max([len(data.columns)] + [len(row) for row in headers])
+        header_rows = [list(row) + [''] * (width - len(row)) for row in headers]
+        columns = [encode_column(data[label]) for label in data.columns]
+        columns += [pd.Categorical([np.nan] * len(data))] * (width - len(columns))
+        table = cls(header_rows, columns)
+        logger.info(f"Working table: {len(table)} rows x {table.width} columns in "
+                    f"{table.nbytes() / 1e6:.1f} MB")
+        return table
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Sequence[Any]], header_rows: Optional[int] = None) -> 'WorkingTable':
+        """Build from a list-of-rows grid (header rows on top)"""
+        headers, data = normalize_sheet(frame_from_rows(rows), header_rows=header_rows)
+        return cls.from_sheet(headers, data)
+
+    def __len__(self) -> int:
+        return len(self.header_rows) + self.data_rows
+
+    @property
+    def width(self) -> int:
+        return len(self.columns) if self.columns else max([len(row) for row in self.header_rows], default=0)
+
+    @property
+    def header(self) -> List[Any]:
+        """The top row (the column names once the plan has removed the others)"""
+        return self.head(1)[0] if len(self) else []
+
+    def nbytes(self) -> int:
+        total = sum(len(str(cell)) for row in self.header_rows for cell in row)
+        for values in self.columns:
+            if isinstance(values, pd.Categorical):
+                total += values.codes.nbytes + int(values.categories.memory_usage(deep=True))
+            else:
+                total += values.nbytes
+        return total
+
+    def copy(self) -> 'WorkingTable':
+        """Copy-on-write view: shares every column array with this table"""
+        return WorkingTable([row[:] for row in self.header_rows], list(self.columns))
+
+    def column(self, col_idx: int) -> pd.Series:
+        """One data column as a Series view (header rows excluded)"""
+        return pd.Series(self.columns[col_idx], copy=False)
+
+    def with_columns(self, replacements: Dict[int, Any]) -> 'WorkingTable':
+        """New table with some data columns replaced by new typed Series/arrays"""
+        columns = list(self.columns)
+        for col_idx, values in replacements.items():
+            columns[col_idx] = encode_column(pd.Series(values, copy=False))
+        return WorkingTable([row[:] for row in self.header_rows], columns)
+
+    def with_header(self, header: Sequence[Any]) -> 'WorkingTable':
+        """New table whose top row is header"""
+        return WorkingTable([list(header)] + [row[:] for row in self.header_rows[1:]], list(self.columns))
+
+    def drop_rows(self, row_indexes: Iterable[int]) -> 'WorkingTable':
+        """New table without the listed positional rows; out-of-range indexes are ignored"""
+        drop = {int(row_idx) for row_idx in row_indexes if 0 <= int(row_idx) < len(self)}
+        header_count = len(self.header_rows)
+        header_rows = [row[:] for row_idx, row in enumerate(self.header_rows) if row_idx not in drop]
+
+        keep = np.ones(self.data_rows, dtype=bool)
+        keep[[row_idx - header_count for row_idx in drop if row_idx >= header_count]] = False
+        columns = list(self.columns) if keep.all() else [values[keep] for values in self.columns]
+        return WorkingTable(header_rows, columns)
+
+    def single_header(self) -> 'WorkingTable':
+        """Keep only the top row as header; lower header rows (or the first data row) move into the data"""
+        if len(self.header_rows) == 1 or not len(self):
+            return self.copy()
+
+        if not self.header_rows:
+            header = self.head(1)[0]
+            return WorkingTable([header], [values[1:] for values in self.columns])
+
+        # Rare: the plan kept several header rows, so their text is prepended to every column
+        extra = self.header_rows[1:]
+        columns = []
+        for col_idx, values in enumerate(self.columns):
+            above = pd.Series([row[col_idx] for row in extra], dtype=object)
+            below = pd.Series(values, copy=False).astype(object)
+            columns.append(encode_column(pd.concat([above, below], ignore_index=True)))
+        return WorkingTable([self.header_rows[0][:]], columns)
+
+    def head(self, rows: int) -> List[List[Any]]:
+        """First rows as lists of cells, header rows included"""
+        top = [row[:] for row in self.header_rows[:rows]]
+        remaining = min(max(0, rows - len(top)), self.data_rows)
+        if remaining:
+            top += self._data_slice(0, remaining)
+        return top
+
+    def _data_slice(self, start: int, stop: int) -> List[List[Any]]:
+        cells = [cell_values(values, start, stop) for values in self.columns]
+        return [list(row) for row in zip(*cells)]
+
+    def iter_rows(self) -> Iterator[List[Any]]:
+        """Every row as a list of cells, decoded ROW_CHUNK data rows at a time"""
+        for row in self.header_rows:
+            yield row[:]
+        for start in range(0, self.data_rows, ROW_CHUNK):
+            yield from self._data_slice(start, min(start + ROW_CHUNK, self.data_rows))
+
+    def to_rows(self) -> List[List[Any]]:
+        """The whole grid as lists of cells (for callers that still want the list form)"""
+        return list(self.iter_rows())
+
+    def data_frame(self, names: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """Data rows as a DataFrame over the typed arrays; blanks stay missing"""
+        frame = pd.DataFrame({col_idx: pd.Series(values, copy=False) for col_idx, values in enumerate(self.columns)})
+        if names is not None:
+            # Assigned afterwards so duplicate names (allowed in a CSV header) survive
+            frame.columns = list(names)
+        return frame